@@ -91,6 +91,8 @@ export const notificationQueueEndpoint = {
             chatId: task.chatId,
             metadata: task.metadata || {},
             createdAt: new Date().toISOString(),
+            // Числовой ключ сортировки очереди для бота (createdAt сохраняется как Timestamp)
+            dueAt: Date.now(),
             sent: false,
             error: null,
         };
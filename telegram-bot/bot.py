@@ -5,14 +5,17 @@
 # Если версия не меняется в логах - проверьте кэш Python и systemd service
 
 import asyncio
+import html
 import logging
 import sys
 import os
 import subprocess
 from datetime import datetime
+from typing import Dict, Any, Optional, List, Tuple
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import (
     Application,
+    TypeHandler,
     CommandHandler,
     CallbackQueryHandler,
     MessageHandler,
@@ -29,27 +32,43 @@ from keyboards import (
     get_funnels_keyboard, get_clients_keyboard, get_users_keyboard, get_confirm_keyboard,
     get_back_button, get_tasks_list_keyboard
 )
-from messages import format_task_message, format_deal_message, format_meeting_message, format_document_message
-from tasks import (
-    get_user_tasks, get_today_tasks, get_overdue_tasks, get_task_by_id,
-    update_task_status, create_task, get_statuses
-)
+from messages import format_ambiguous_id_message, format_new_task_notification, format_task_due_date
+from tasks import get_task_by_id, update_task_status, create_task, get_statuses
 from deals import (
     get_all_deals, get_user_deals, get_deal_by_id, create_deal, update_deal,
     update_deal_stage, delete_deal, search_deals, get_sales_funnels, get_funnel_stages,
-    get_won_deals_today
+    get_funnel_deals, get_new_deals, get_funnel_deal_counts, get_funnel, get_funnel_stage, get_funnel_stage_order
 )
 from clients import get_all_clients, get_client_by_id, create_client, search_clients
 from profile import get_user_profile, format_profile_message
 from notifications import (
-    check_new_tasks, check_new_deals, check_upcoming_meetings,
+    check_new_deals, check_upcoming_meetings,
     get_successful_deal_message
 )
 from notification_queue import (
-    get_pending_notifications, mark_notification_sent, cleanup_old_notifications
+    NotificationBatch, NotificationLease, mark_notification_sent, mark_notification_failed,
+    reserve_send_key, release_send_key, cleanup_old_notifications, backfill_due_at
 )
 from scheduler import TaskScheduler
-from utils import get_today_date, is_overdue
+from id_index import resolve_short_id
+from task_lists import TaskListSnapshot, task_list_snapshots
+from counters import UserCounters, user_counters
+from deal_events import won_deal_detector, new_deal_detector
+from subscriptions import subscriber_registry
+from collection_store import apply_saved
+from entity_resolver import get_resolver
+from render_cache import render_task, render_deal, render_meeting, render_document
+from send_dispatcher import send_dispatcher, is_permanent_send_error
+from notification_lanes import LaneReader, lane_limiter
+from outbox import outbox, STATUS_SENT, STATUS_PENDING
+from poll_interval import AdaptiveInterval
+from stages import Stage, StageRun
+from tick_snapshot import TickSnapshot
+from job_runner import job_runner
+from notification_digest import (
+    DigestEvent, digest_buffer, render_events, render_queue_digest, ready_notifications, group_notifications
+)
+from utils import get_today_date, is_overdue, short_id
 
 # Версия кода - определяем ДО всего остального
 CODE_VERSION_AT_START = "2026-01-24-refactored"
@@ -113,7 +132,7 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
                 logger.info(f"[START] User {telegram_user_id} already authorized")
                 await update.message.reply_text(
                     "Вы уже авторизованы! Используйте меню для навигации.",
-                    reply_markup=get_main_menu()
+                    reply_markup=get_main_menu(get_session_counters(telegram_user_id))
                 )
                 return ConversationHandler.END
         
@@ -176,7 +195,7 @@ async def password(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
             await update.message.reply_text(
                 f"✅ Авторизация успешна!\n\n"
                 f"Добро пожаловать, {user.get('name', 'Пользователь')}!",
-                reply_markup=get_main_menu()
+                reply_markup=get_main_menu(get_session_counters(telegram_user_id))
             )
             return ConversationHandler.END
         else:
@@ -216,6 +235,17 @@ async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     )
     await update.message.reply_text(help_text)
 
+def get_session_counters(telegram_user_id: int) -> Optional[UserCounters]:
+    """Счетчики для бейджей меню (None, если пользователь не авторизован или счетчики недоступны)"""
+    session = user_sessions.get(telegram_user_id)
+    if not session:
+        return None
+    try:
+        return user_counters.get(session['user_id'])
+    except Exception as e:
+        logger.error(f"Error getting counters for {telegram_user_id}: {e}", exc_info=True)
+        return None
+
 def require_auth(func):
     """Декоратор для проверки авторизации"""
     async def wrapper(update: Update, context: ContextTypes.DEFAULT_TYPE, *args, **kwargs):
@@ -239,14 +269,20 @@ async def menu_main(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Главное меню"""
     query = update.callback_query
     await query.answer()
-    await query.edit_message_text("🏠 Главное меню", reply_markup=get_main_menu())
+    await query.edit_message_text(
+        "🏠 Главное меню",
+        reply_markup=get_main_menu(get_session_counters(update.effective_user.id))
+    )
 
 @require_auth
 async def menu_tasks(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Меню задач"""
     query = update.callback_query
     await query.answer()
-    await query.edit_message_text("📋 Задачи", reply_markup=get_tasks_menu())
+    await query.edit_message_text(
+        "📋 Задачи",
+        reply_markup=get_tasks_menu(get_session_counters(update.effective_user.id))
+    )
 
 @require_auth
 async def tasks_all(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -257,9 +293,10 @@ async def tasks_all(update: Update, context: ContextTypes.DEFAULT_TYPE):
     telegram_user_id = update.effective_user.id
     user_id = user_sessions[telegram_user_id]['user_id']
     
-    all_user_tasks = get_user_tasks(user_id)
+    # Вход в список из меню всегда строит свежий снимок
+    snapshot = task_list_snapshots.get(update.effective_chat.id, user_id, 'all', refresh=True)
     
-    if not all_user_tasks:
+    if not snapshot.tasks:
         await query.edit_message_text(
             "✅ У вас нет активных задач!",
             reply_markup=get_tasks_menu()
@@ -267,7 +304,7 @@ async def tasks_all(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return
     
     # Показываем список с фильтрами (по умолчанию "all")
-    await show_tasks_list(query, all_user_tasks, 'all', 0)
+    await show_tasks_list(query, snapshot, 0)
 
 @require_auth
 async def tasks_filter(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -283,19 +320,9 @@ async def tasks_filter(update: Update, context: ContextTypes.DEFAULT_TYPE):
     filter_type = data[2]  # all, today, overdue
     page = int(data[3]) if len(data) > 3 else 0
     
-    # Получаем все задачи
-    all_user_tasks = get_user_tasks(user_id)
-    
-    # Применяем фильтр
-    filtered_tasks = []
-    if filter_type == 'today':
-        filtered_tasks = get_today_tasks(user_id)
-    elif filter_type == 'overdue':
-        filtered_tasks = get_overdue_tasks(user_id)
-    else:  # all
-        filtered_tasks = all_user_tasks
-    
-    await show_tasks_list(query, filtered_tasks, filter_type, page)
+    # Фильтр берется из снимка (все фильтры считаются за один проход)
+    snapshot = task_list_snapshots.get(update.effective_chat.id, user_id, filter_type)
+    await show_tasks_list(query, snapshot, page)
 
 @require_auth
 async def tasks_page(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -311,26 +338,20 @@ async def tasks_page(update: Update, context: ContextTypes.DEFAULT_TYPE):
     filter_type = data[2]  # all, today, overdue
     page = int(data[3]) if len(data) > 3 else 0
     
-    # Получаем все задачи
-    all_user_tasks = get_user_tasks(user_id)
-    
-    # Применяем фильтр
-    filtered_tasks = []
-    if filter_type == 'today':
-        filtered_tasks = get_today_tasks(user_id)
-    elif filter_type == 'overdue':
-        filtered_tasks = get_overdue_tasks(user_id)
-    else:  # all
-        filtered_tasks = all_user_tasks
-    
-    await show_tasks_list(query, filtered_tasks, filter_type, page)
+    # Страница обслуживается из снимка без повторной загрузки задач
+    snapshot = task_list_snapshots.get(update.effective_chat.id, user_id, filter_type)
+    await show_tasks_list(query, snapshot, page)
 
-async def show_tasks_list(query, tasks: list, filter_type: str, page: int):
-    """Показать список задач с фильтрами и навигацией"""
+async def show_tasks_list(query, snapshot: TaskListSnapshot, page: int):
+    """Показать страницу списка задач с фильтрами и навигацией"""
     page_size = 10
+    total = snapshot.total
+    filter_type = snapshot.filter_type
+    
+    # Снимок мог уменьшиться после обновления - не выходим за последнюю страницу
+    page = max(0, min(page, snapshot.page_count(page_size) - 1))
     start_idx = page * page_size
-    end_idx = start_idx + page_size
-    total = len(tasks)
+    page_tasks = snapshot.get_page(page, page_size)
     
     # Формируем сообщение
     filter_names = {
@@ -345,7 +366,6 @@ async def show_tasks_list(query, tasks: list, filter_type: str, page: int):
     if total == 0:
         message += "✅ Задач не найдено"
     else:
-        page_tasks = tasks[start_idx:end_idx]
         for i, task in enumerate(page_tasks, start=start_idx + 1):
             task_title = task.get('title', 'Без названия')
             end_date = task.get('endDate', '')
@@ -368,9 +388,9 @@ async def show_tasks_list(query, tasks: list, filter_type: str, page: int):
             message += f"{i}. {task_title}{date_str}\n   Статус: {status}\n\n"
         
         if total > page_size:
-            message += f"\nСтраница {page + 1} из {(total + page_size - 1) // page_size}"
+            message += f"\nСтраница {page + 1} из {snapshot.page_count(page_size)}"
     
-    keyboard = get_tasks_list_keyboard(tasks, filter_type, page, page_size)
+    keyboard = get_tasks_list_keyboard(page_tasks, filter_type, page, snapshot.has_next(page, page_size))
     
     try:
         await query.edit_message_text(
@@ -414,11 +434,9 @@ async def task_detail(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await query.edit_message_text("❌ Задача не найдена", reply_markup=get_tasks_menu())
         return
     
-    users = firebase.get_all('users')
-    projects = firebase.get_all('projects')
-    message = format_task_message(task, users, projects)
+    rendered = render_task(task, get_resolver())
     
-    await query.edit_message_text(message, reply_markup=get_task_menu(task_id))
+    await query.edit_message_text(rendered.text, reply_markup=rendered.reply_markup)
 
 @require_auth
 async def task_set_status(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -439,6 +457,7 @@ async def task_set_status(update: Update, context: ContextTypes.DEFAULT_TYPE):
             if status_obj:
                 status_name = status_obj.get('name', new_status)
                 update_task_status(task_id, status_name)
+                task_list_snapshots.invalidate_task(task)
                 await query.edit_message_text(
                     f"✅ Статус задачи изменен на: {status_name}",
                     reply_markup=get_task_menu(task_id)
@@ -464,7 +483,10 @@ async def menu_deals(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Меню сделок"""
     query = update.callback_query
     await query.answer()
-    await query.edit_message_text("🎯 Сделки", reply_markup=get_deals_menu())
+    await query.edit_message_text(
+        "🎯 Сделки",
+        reply_markup=get_deals_menu(get_session_counters(update.effective_user.id))
+    )
 
 @require_auth
 async def deals_all(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -490,9 +512,10 @@ async def deals_all(update: Update, context: ContextTypes.DEFAULT_TYPE):
         keyboard.append([InlineKeyboardButton("📊 Все сделки", callback_data="deals_all_show")])
         for funnel in funnels:
             funnel_name = funnel.get('name', funnel.get('id', ''))[:30]
+            funnel_count = sum(get_funnel_deal_counts(funnel.get('id', '')).values())
             keyboard.append([
                 InlineKeyboardButton(
-                    f"🎯 {funnel_name}",
+                    f"🎯 {funnel_name} ({funnel_count})",
                     callback_data=f"deals_funnel_{funnel.get('id', '')}"
                 )
             ])
@@ -513,8 +536,6 @@ async def deals_all_show(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await query.answer()
     
     deals = get_all_deals(include_archived=False)
-    clients = firebase.get_all('clients')
-    users = firebase.get_all('users')
     
     if not deals:
         await query.edit_message_text(
@@ -554,14 +575,14 @@ async def deals_funnel(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await query.answer("❌ Воронка не указана")
         return
     
-    funnel = firebase.get_by_id('salesFunnels', funnel_id)
+    funnel = get_funnel(funnel_id)
     
     if not funnel:
         await query.answer("❌ Воронка не найдена")
         return
     
-    # Получаем стадии воронки
-    stages = get_funnel_stages(funnel_id)
+    # Стадии берем из уже загруженной воронки
+    stages = funnel.get('stages', [])
     
     if not stages:
         await query.edit_message_text(
@@ -571,14 +592,20 @@ async def deals_funnel(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return
     
     # Показываем выбор стадии
+    stage_counts = get_funnel_deal_counts(funnel_id)
     message = f"🎯 Воронка: {funnel.get('name', '')}\n\nВыберите этап воронки:"
     keyboard = []
-    keyboard.append([InlineKeyboardButton("📊 Все этапы", callback_data=f"deals_funnel_stage_all_{funnel_id}")])
+    keyboard.append([
+        InlineKeyboardButton(
+            f"📊 Все этапы ({sum(stage_counts.values())})",
+            callback_data=f"deals_funnel_stage_all_{funnel_id}"
+        )
+    ])
     for stage in stages:
         stage_name = stage.get('name', stage.get('id', ''))[:30]
         keyboard.append([
             InlineKeyboardButton(
-                f"📌 {stage_name}",
+                f"📌 {stage_name} ({stage_counts.get(stage.get('id', ''), 0)})",
                 callback_data=f"deals_funnel_stage_{funnel_id}_{stage.get('id', '')}"
             )
         ])
@@ -603,24 +630,28 @@ async def deals_funnel_stage(update: Update, context: ContextTypes.DEFAULT_TYPE)
         await query.answer("❌ Воронка не указана")
         return
     
-    funnel = firebase.get_by_id('salesFunnels', funnel_id)
+    funnel = get_funnel(funnel_id)
     
     if not funnel:
         await query.answer("❌ Воронка не найдена")
         return
     
-    deals = get_all_deals(include_archived=False)
-    
-    # Фильтруем сделки по воронке и этапу
+    # Сделки воронки и этапа из индекса
     if stage_id == 'all':
-        # Все сделки воронки
-        funnel_deals = [d for d in deals if d.get('funnelId') == funnel_id]
+        # Все сделки воронки в порядке этапов
+        funnel_deals = get_funnel_deals(funnel_id)
+        
+        def stage_position(deal):
+            # Сделки с неизвестной стадией - в конце списка
+            position = get_funnel_stage_order(funnel_id, deal.get('stage'))
+            return position if position is not None else len(funnel.get('stages', []))
+        
+        funnel_deals.sort(key=stage_position)
         stage_name = "Все этапы"
     else:
         # Сделки конкретного этапа
-        funnel_deals = [d for d in deals if d.get('funnelId') == funnel_id and d.get('stage') == stage_id]
-        stages = get_funnel_stages(funnel_id)
-        stage = next((s for s in stages if s.get('id') == stage_id), None)
+        funnel_deals = get_funnel_deals(funnel_id, stage_id)
+        stage = get_funnel_stage(funnel_id, stage_id)
         stage_name = stage.get('name', stage_id) if stage else stage_id
     
     if not funnel_deals:
@@ -654,15 +685,8 @@ async def deals_new(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
     await query.answer()
     
-    deals = get_all_deals(include_archived=False)
-    
-    # Фильтруем сделки на этапе "НОВАЯ ЗАЯВКА"
-    # Ищем по stage = "НОВАЯ ЗАЯВКА" или похожим значениям
-    new_deals = []
-    for deal in deals:
-        stage = deal.get('stage', '').lower()
-        if 'новая' in stage or 'new' in stage or stage == 'new':
-            new_deals.append(deal)
+    # Сделки на этапе "НОВАЯ ЗАЯВКА" (по stage = "НОВАЯ ЗАЯВКА" или похожим значениям)
+    new_deals = get_new_deals()
     
     if not new_deals:
         await query.edit_message_text(
@@ -699,8 +723,6 @@ async def deals_mine(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_id = user_sessions[telegram_user_id]['user_id']
     
     deals = get_user_deals(user_id, include_archived=False)
-    clients = firebase.get_all('clients')
-    users = firebase.get_all('users')
     
     if not deals:
         await query.edit_message_text(
@@ -776,7 +798,7 @@ async def deal_create_funnel(update: Update, context: ContextTypes.DEFAULT_TYPE)
     
     # Получаем этапы воронки
     stages = get_funnel_stages(funnel_id)
-    funnel = firebase.get_by_id('salesFunnels', funnel_id)
+    funnel = get_funnel(funnel_id)
     funnel_name = funnel.get('name', '') if funnel else ''
     
     if stages and len(stages) > 0:
@@ -828,11 +850,10 @@ async def deal_create_stage(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_states[telegram_user_id]['state'] = 'creating_deal_title'
     
     # Получаем название этапа
-    stages = get_funnel_stages(funnel_id)
-    stage = next((s for s in stages if s.get('id') == stage_id), None)
+    stage = get_funnel_stage(funnel_id, stage_id)
     stage_name = stage.get('name', '') if stage else ''
     
-    funnel = firebase.get_by_id('salesFunnels', funnel_id)
+    funnel = get_funnel(funnel_id)
     funnel_name = funnel.get('name', '') if funnel else ''
     
     await query.edit_message_text(
@@ -853,12 +874,9 @@ async def deal_detail(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await query.edit_message_text("❌ Сделка не найдена", reply_markup=get_deals_menu())
         return
     
-    clients = firebase.get_all('clients')
-    users = firebase.get_all('users')
-    funnels = get_sales_funnels()
-    message = format_deal_message(deal, clients, users, funnels)
+    rendered = render_deal(deal, get_resolver())
     
-    await query.edit_message_text(message, reply_markup=get_deal_menu(deal_id))
+    await query.edit_message_text(rendered.text, reply_markup=rendered.reply_markup)
 
 @require_auth
 async def deal_set_stage(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -876,28 +894,9 @@ async def deal_set_stage(update: Update, context: ContextTypes.DEFAULT_TYPE):
         if deal:
             update_deal_stage(deal_id, new_stage)
             
-            # Проверяем, не перешла ли сделка в стадию "won"
+            # Переход в стадию "won" объявляем сразу (детектор не даст повторить его в стадии deal_events)
             if new_stage == 'won':
-                # Отправляем уведомление в групповой чат
-                notification_prefs = firebase.get_by_id('notificationPrefs', 'default')
-                telegram_chat_id = notification_prefs.get('telegramGroupChatId') if notification_prefs else None
-                
-                if telegram_chat_id:
-                    clients = firebase.get_all('clients')
-                    users = firebase.get_all('users')
-                    message = get_successful_deal_message(deal, clients, users)
-                    if message:
-                        try:
-                            await context.bot.send_message(
-                                chat_id=telegram_chat_id,
-                                text=message,
-                                parse_mode='HTML'
-                            )
-                            logger.info(f"Successfully sent deal notification to group {telegram_chat_id}")
-                        except Exception as e:
-                            logger.error(f"Error sending successful deal message: {e}")
-                else:
-                    logger.warning("No telegramGroupChatId configured for deal notifications")
+                await announce_won_deals(context.bot)
             
             await query.edit_message_text(
                 f"✅ Стадия сделки изменена",
@@ -1051,6 +1050,7 @@ async def settings_notifications(update: Update, context: ContextTypes.DEFAULT_T
             'groupSuccessfulDeals': {'telegramGroup': True},
         }
         firebase.save('notificationPrefs', notification_prefs)
+        apply_saved('notificationPrefs', notification_prefs)
     
     message = "🔔 Настройки уведомлений\n\nВыберите категорию для настройки:"
     
@@ -1375,6 +1375,7 @@ async def settings_group_set_chat_id_input(update: Update, context: ContextTypes
         
         notification_prefs['telegramGroupChatId'] = chat_id
         firebase.save('notificationPrefs', notification_prefs)
+        apply_saved('notificationPrefs', notification_prefs)
         
         await update.message.reply_text(
             f"✅ ID группового чата сохранен: {chat_id}",
@@ -1425,6 +1426,7 @@ async def settings_toggle_notification(update: Update, context: ContextTypes.DEF
         notification_prefs[setting_name] = current_setting
         notification_prefs['id'] = 'default'
         firebase.save('notificationPrefs', notification_prefs)
+        apply_saved('notificationPrefs', notification_prefs)
         
         # Определяем, в какую категорию вернуться
         category = "settings_notifications"
@@ -1486,7 +1488,7 @@ async def menu_help(update: Update, context: ContextTypes.DEFAULT_TYPE):
         "/help - Показать эту справку\n\n"
         "Используйте кнопки меню для навигации по функциям бота."
     )
-    await query.edit_message_text(help_text, reply_markup=get_main_menu())
+    await query.edit_message_text(help_text, reply_markup=get_main_menu(get_session_counters(update.effective_user.id)))
 
 async def handle_text_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Обработчик текстовых сообщений для создания задач и сделок"""
@@ -1522,9 +1524,10 @@ async def handle_text_message(update: Update, context: ContextTypes.DEFAULT_TYPE
             
             task_id = create_task(task_data)
             if task_id:
+                task_list_snapshots.invalidate_user(user_id)
                 await update.message.reply_text(
                     f"✅ Задача '{text}' создана!",
-                    reply_markup=get_tasks_menu()
+                    reply_markup=get_tasks_menu(get_session_counters(telegram_user_id))
                 )
             else:
                 await update.message.reply_text("❌ Ошибка при создании задачи")
@@ -1549,7 +1552,7 @@ async def handle_text_message(update: Update, context: ContextTypes.DEFAULT_TYPE
             if deal_id:
                 await update.message.reply_text(
                     f"✅ Заявка '{data.get('title', '')}' создана!",
-                    reply_markup=get_deals_menu()
+                    reply_markup=get_deals_menu(get_session_counters(telegram_user_id))
                 )
             else:
                 await update.message.reply_text("❌ Ошибка при создании заявки")
@@ -1749,9 +1752,9 @@ async def task_from_message_assignee_callback(update: Update, context: ContextTy
             task_id = create_task(task_data)
             
             if task_id:
+                task_list_snapshots.invalidate_task(task_data)
                 # Получаем имя исполнителя
-                users = firebase.get_all('users')
-                assignee = next((u for u in users if u.get('id') == assignee_id), None)
+                assignee = get_resolver().user(assignee_id)
                 assignee_name = assignee.get('name', 'Неизвестно') if assignee else 'Неизвестно'
                 
                 await query.edit_message_text(
@@ -1798,8 +1801,9 @@ async def show_task_in_group(update: Update, context: ContextTypes.DEFAULT_TYPE)
         
         search_query = ' '.join(context.args).strip()
         
-        # Сначала пытаемся найти по ID
-        task = get_task_by_id(search_query)
+        # Сначала пытаемся найти по полному или короткому ID (как в сообщениях: конец ID)
+        task_id, candidates = resolve_short_id('tasks', search_query)
+        task = get_task_by_id(task_id or search_query)
         
         # Если не найдено по ID, ищем по названию
         if not task:
@@ -1815,6 +1819,10 @@ async def show_task_in_group(update: Update, context: ContextTypes.DEFAULT_TYPE)
                     matching_tasks.append(t)
             
             if len(matching_tasks) == 0:
+                if candidates:
+                    # Короткий ID подходит к нескольким объектам, а по названию ничего не нашлось
+                    await update.message.reply_text(format_ambiguous_id_message(search_query, candidates))
+                    return
                 await update.message.reply_text(f"❌ Задача с ID или названием '{search_query}' не найдена.")
                 return
             elif len(matching_tasks) == 1:
@@ -1823,19 +1831,15 @@ async def show_task_in_group(update: Update, context: ContextTypes.DEFAULT_TYPE)
                 # Показываем список найденных задач
                 message = f"🔍 Найдено несколько задач ({len(matching_tasks)}):\n\n"
                 for i, t in enumerate(matching_tasks[:10], 1):
-                    message += f"{i}. {t.get('title', 'Без названия')} (ID: {t.get('id', 'N/A')[:12]})\n"
+                    message += f"{i}. {t.get('title', 'Без названия')} (ID: {short_id(t.get('id'))})\n"
                 if len(matching_tasks) > 10:
                     message += f"\n... и еще {len(matching_tasks) - 10} задач"
                 message += "\n\nИспользуйте ID для точного поиска."
                 await update.message.reply_text(message)
                 return
         
-        # Получаем данные для форматирования
-        users = firebase.get_all('users')
-        projects = firebase.get_all('projects')
-        
         # Форматируем сообщение
-        message = format_task_message(task, users, projects)
+        message = render_task(task, get_resolver(), with_menu=False).text
         
         await update.message.reply_text(message, parse_mode='HTML')
         
@@ -1861,44 +1865,38 @@ async def show_deal_in_group(update: Update, context: ContextTypes.DEFAULT_TYPE)
         
         search_query = ' '.join(context.args).strip()
         
-        # Сначала пытаемся найти по ID
-        deal = get_deal_by_id(search_query)
+        # Сначала пытаемся найти по полному или короткому ID (как в сообщениях: конец ID)
+        deal_id, candidates = resolve_short_id('deals', search_query)
+        deal = get_deal_by_id(deal_id or search_query)
         
-        # Если не найдено по ID, ищем по названию
+        # Если не найдено по ID, ищем по названию и контакту
         if not deal:
-            all_deals = get_all_deals(include_archived=False)
-            matching_deals = []
-            search_lower = search_query.lower()
-            
-            for d in all_deals:
-                title = d.get('title', d.get('contactName', '')).lower()
-                if search_lower in title or title in search_lower:
-                    matching_deals.append(d)
+            matching_deals = search_deals(search_query, limit=11)
             
             if len(matching_deals) == 0:
+                if candidates:
+                    # Короткий ID подходит к нескольким объектам, а по названию ничего не нашлось
+                    await update.message.reply_text(format_ambiguous_id_message(search_query, candidates))
+                    return
                 await update.message.reply_text(f"❌ Сделка с ID или названием '{search_query}' не найдена.")
                 return
             elif len(matching_deals) == 1:
                 deal = matching_deals[0]
             else:
                 # Показываем список найденных сделок
-                message = f"🔍 Найдено несколько сделок ({len(matching_deals)}):\n\n"
+                found = len(matching_deals) if len(matching_deals) <= 10 else "10+"
+                message = f"🔍 Найдено несколько сделок ({found}):\n\n"
                 for i, d in enumerate(matching_deals[:10], 1):
                     title = d.get('title', d.get('contactName', 'Без названия'))
-                    message += f"{i}. {title} (ID: {d.get('id', 'N/A')[:12]})\n"
+                    message += f"{i}. {title} (ID: {short_id(d.get('id'))})\n"
                 if len(matching_deals) > 10:
-                    message += f"\n... и еще {len(matching_deals) - 10} сделок"
+                    message += "\n... и еще сделки"
                 message += "\n\nИспользуйте ID для точного поиска."
                 await update.message.reply_text(message)
                 return
         
-        # Получаем данные для форматирования
-        clients = firebase.get_all('clients')
-        users = firebase.get_all('users')
-        funnels = get_sales_funnels()
-        
         # Форматируем сообщение
-        message = format_deal_message(deal, clients, users, funnels)
+        message = render_deal(deal, get_resolver(), with_menu=False).text
         
         await update.message.reply_text(message, parse_mode='HTML')
         
@@ -1924,8 +1922,9 @@ async def show_meeting_in_group(update: Update, context: ContextTypes.DEFAULT_TY
         
         search_query = ' '.join(context.args).strip()
         
-        # Сначала пытаемся найти по ID
-        meeting = firebase.get_by_id('meetings', search_query)
+        # Сначала пытаемся найти по полному или короткому ID (как в сообщениях: конец ID)
+        meeting_id, candidates = resolve_short_id('meetings', search_query)
+        meeting = firebase.get_by_id('meetings', meeting_id or search_query)
         
         # Если не найдено по ID, ищем по названию
         if not meeting:
@@ -1941,6 +1940,10 @@ async def show_meeting_in_group(update: Update, context: ContextTypes.DEFAULT_TY
                     matching_meetings.append(m)
             
             if len(matching_meetings) == 0:
+                if candidates:
+                    # Короткий ID подходит к нескольким объектам, а по названию ничего не нашлось
+                    await update.message.reply_text(format_ambiguous_id_message(search_query, candidates))
+                    return
                 await update.message.reply_text(f"❌ Встреча с ID или названием '{search_query}' не найдена.")
                 return
             elif len(matching_meetings) == 1:
@@ -1949,18 +1952,15 @@ async def show_meeting_in_group(update: Update, context: ContextTypes.DEFAULT_TY
                 # Показываем список найденных встреч
                 message = f"🔍 Найдено несколько встреч ({len(matching_meetings)}):\n\n"
                 for i, m in enumerate(matching_meetings[:10], 1):
-                    message += f"{i}. {m.get('title', 'Без названия')} (ID: {m.get('id', 'N/A')[:12]})\n"
+                    message += f"{i}. {m.get('title', 'Без названия')} (ID: {short_id(m.get('id'))})\n"
                 if len(matching_meetings) > 10:
                     message += f"\n... и еще {len(matching_meetings) - 10} встреч"
                 message += "\n\nИспользуйте ID для точного поиска."
                 await update.message.reply_text(message)
                 return
         
-        # Получаем данные для форматирования
-        users = firebase.get_all('users')
-        
         # Форматируем сообщение
-        message = format_meeting_message(meeting, users)
+        message = render_meeting(meeting, get_resolver()).text
         
         await update.message.reply_text(message, parse_mode='HTML')
         
@@ -1986,8 +1986,9 @@ async def show_document_in_group(update: Update, context: ContextTypes.DEFAULT_T
         
         search_query = ' '.join(context.args).strip()
         
-        # Сначала пытаемся найти по ID
-        document = firebase.get_by_id('docs', search_query)
+        # Сначала пытаемся найти по полному или короткому ID (как в сообщениях: конец ID)
+        document_id, candidates = resolve_short_id('docs', search_query)
+        document = firebase.get_by_id('docs', document_id or search_query)
         
         # Если не найдено по ID, ищем по названию
         if not document:
@@ -2003,6 +2004,10 @@ async def show_document_in_group(update: Update, context: ContextTypes.DEFAULT_T
                     matching_docs.append(d)
             
             if len(matching_docs) == 0:
+                if candidates:
+                    # Короткий ID подходит к нескольким объектам, а по названию ничего не нашлось
+                    await update.message.reply_text(format_ambiguous_id_message(search_query, candidates))
+                    return
                 await update.message.reply_text(f"❌ Документ с ID или названием '{search_query}' не найден.")
                 return
             elif len(matching_docs) == 1:
@@ -2011,18 +2016,15 @@ async def show_document_in_group(update: Update, context: ContextTypes.DEFAULT_T
                 # Показываем список найденных документов
                 message = f"🔍 Найдено несколько документов ({len(matching_docs)}):\n\n"
                 for i, d in enumerate(matching_docs[:10], 1):
-                    message += f"{i}. {d.get('title', 'Без названия')} (ID: {d.get('id', 'N/A')[:12]})\n"
+                    message += f"{i}. {d.get('title', 'Без названия')} (ID: {short_id(d.get('id'))})\n"
                 if len(matching_docs) > 10:
                     message += f"\n... и еще {len(matching_docs) - 10} документов"
                 message += "\n\nИспользуйте ID для точного поиска."
                 await update.message.reply_text(message)
                 return
         
-        # Получаем данные для форматирования
-        users = firebase.get_all('users')
-        
         # Форматируем сообщение
-        message = format_document_message(document, users)
+        message = render_document(document, get_resolver()).text
         
         await update.message.reply_text(message, parse_mode='HTML')
         
@@ -2033,211 +2035,431 @@ async def show_document_in_group(update: Update, context: ContextTypes.DEFAULT_T
         except:
             pass
 
-async def periodic_check(context: ContextTypes.DEFAULT_TYPE):
-    """Периодическая проверка новых задач, заявок и обработка очереди уведомлений"""
+def take_won_deal_messages() -> List[Tuple[str, str, Dict[str, Any]]]:
+    """Сообщения в группу о сделках, перешедших в стадию 'won' (каждый переход - один раз): (ID чата, текст, сделка)"""
+    notification_prefs = firebase.get_by_id('notificationPrefs', 'default')
+    if not notification_prefs:
+        won_deal_detector.discard_pending()
+        return []
+    
+    # Проверяем, включены ли уведомления об успешных сделках
+    group_successful_deals = notification_prefs.get('groupSuccessfulDeals', {'telegramGroup': True})
+    if not group_successful_deals.get('telegramGroup', True):
+        logger.debug("Group successful deals notifications are disabled")
+        won_deal_detector.discard_pending()
+        return []
+    
+    telegram_chat_id = notification_prefs.get('telegramGroupChatId')
+    if not telegram_chat_id:
+        logger.warning("No telegramGroupChatId configured for deal notifications")
+        won_deal_detector.discard_pending()
+        return []
+    
+    messages = []
+    for deal in won_deal_detector.take_won_deals():
+        message = get_successful_deal_message(deal)
+        if message:
+            messages.append((telegram_chat_id, message, deal))
+        else:
+            won_deal_detector.retry_later(deal)
+    return messages
+
+async def send_won_deal_message(bot, item: Tuple[str, str, Dict[str, Any]]) -> None:
+    """Отправить в группу сообщение об успешной сделке (переход считается объявленным только после отправки)"""
+    telegram_chat_id, message, deal = item
     try:
-        now = datetime.now()
-        
-        # Обрабатываем очередь уведомлений из Firebase (от веб-приложения)
+        await send_dispatcher.send(bot, telegram_chat_id, message, parse_mode='HTML')
+        logger.info(f"Successfully sent deal notification to group {telegram_chat_id}")
+    except Exception as e:
+        logger.error(f"Error sending successful deal message: {e}")
+        won_deal_detector.retry_later(deal)
+        return
+    won_deal_detector.mark_announced(deal)
+
+async def announce_won_deals(bot) -> None:
+    """Отправить в группу сообщения о сделках, перешедших в стадию 'won' (каждая сделка - один раз)"""
+    for item in take_won_deal_messages():
+        await send_won_deal_message(bot, item)
+
+def queue_send_key(task_id: str) -> str:
+    """Ключ уведомления очереди в журнале отправок"""
+    return f"queue:{task_id}"
+
+def deal_created_send_key(deal_id: str, chat_id: Any) -> str:
+    """Ключ уведомления о новой сделке в журнале отправок (общий для очереди и рассылки бота)"""
+    return f"dealCreated:{deal_id}:{chat_id}"
+
+def notification_send_keys(notification: Dict[str, Any]) -> List[str]:
+    """Ключи уведомления очереди в журнале отправок"""
+    keys = [queue_send_key(notification['id'])]
+    deal_id = (notification.get('metadata') or {}).get('dealId')
+    if notification.get('type') == 'dealCreated' and deal_id:
+        # Ту же сделку подписчику может отправить и рассылка бота (fan_out_new_deals)
+        keys.append(deal_created_send_key(deal_id, notification.get('chatId')))
+    return keys
+
+async def process_notification_batch(bot, lease: NotificationLease) -> int:
+    """
+    Отправить арендованные уведомления из очереди и отметить результат каждого
+    
+    Уведомления одного типа в один чат отправляются одним сообщением-дайджестом.
+    Журнал отправок ведет ключ на каждое уведомление (а не на дайджест), поэтому
+    другая группировка после перезапуска не отправляет уведомление повторно
+    
+    Returns:
+        Количество отправленных уведомлений
+    """
+    # Уведомления, уже отправленные или отправляемые (по журналу отправок)
+    outbox_statuses = outbox.key_statuses([key for notification_task in lease for key in notification_send_keys(notification_task)])
+    valid = []
+    for notification_task in lease:
+        task_id = notification_task.get('id')
+        chat_id = notification_task.get('chatId')
+        message = notification_task.get('message')
+        notification_type = notification_task.get('type', 'unknown')
+        user_id = notification_task.get('userId', 'unknown')
+        
+        logger.info(f"[PERIODIC] Processing notification {task_id}: type={notification_type}, userId={user_id}, chatId={chat_id}")
+        
+        if not lease.holds(task_id):
+            logger.warning(f"[PERIODIC] Lease on notification {task_id} expired, skipping")
+            continue
+        
+        if not chat_id or not message:
+            logger.warning(f"[PERIODIC] ❌ Invalid notification task {task_id}: missing chatId ({chat_id}) or message ({bool(message)})")
+            mark_notification_failed(task_id, "Missing chatId or message", permanent=True, lease=lease)
+            continue
+        
+        key_statuses = {outbox_statuses.get(key) for key in notification_send_keys(notification_task)}
+        if STATUS_SENT in key_statuses:
+            # Отправлено раньше (отметка в Firebase не дошла) или рассылкой бота - отмечаем с токеном этой аренды
+            logger.info(f"[PERIODIC] Notification {task_id} already sent, acking")
+            mark_notification_sent(task_id, success=True, lease=lease)
+            continue
+        if STATUS_PENDING in key_statuses:
+            logger.info(f"[PERIODIC] Notification {task_id} is being sent, skipping")
+            continue
+        
+        # Такое же уведомление (тот же ключ идемпотентности) уже отправлено - не дублируем
+        if not reserve_send_key(notification_task):
+            logger.info(f"[PERIODIC] Duplicate notification {task_id} skipped")
+            mark_notification_sent(task_id, success=True, error="Duplicate", lease=lease)
+            continue
+        
+        valid.append(notification_task)
+    
+    # Отправляем все группы параллельно (с лимитами Telegram), потом отмечаем результат
+    sends = []
+    for (chat_id, _), group in group_notifications(valid).items():
+        # Сообщение записывается в журнал до отправки; отметку в Firebase сделает flush_outbox_acks
+        text = render_queue_digest(group)
+        acks = {notification_task['id']: lease.token for notification_task in group}
+        member_keys = [key for notification_task in group for key in notification_send_keys(notification_task)]
+        row_id = outbox.record(chat_id, text, 'queue', acks=acks, member_keys=member_keys, parse_mode='HTML')
+        if row_id is None:
+            # Часть уведомлений уже отправляется (записана после проверки выше)
+            logger.info(f"[PERIODIC] Notifications {sorted(acks)} are already sent or being sent, skipping")
+            continue
+        # Отправка ждет свободного места в полосе уведомления (приоритетные полосы не блокируются массовыми)
+        send = outbox.deliver(bot, row_id, chat_id, text, parse_mode='HTML')
+        sends.append((group, chat_id, asyncio.ensure_future(lane_limiter.run(group[0], send))))
+    
+    sent_count = 0
+    for group, chat_id, send_future in sends:
+        task_ids = [notification_task.get('id') for notification_task in group]
         try:
-            pending_notifications = get_pending_notifications(limit=20)
-            logger.info(f"[PERIODIC] ===== PROCESSING NOTIFICATION QUEUE =====")
-            logger.info(f"[PERIODIC] Found {len(pending_notifications)} pending notifications from queue")
-            
-            if pending_notifications:
-                logger.info(f"[PERIODIC] First notification sample: {pending_notifications[0]}")
-            
-            for notification_task in pending_notifications:
-                task_id = notification_task.get('id')
-                chat_id = notification_task.get('chatId')
-                message = notification_task.get('message')
-                notification_type = notification_task.get('type', 'unknown')
-                user_id = notification_task.get('userId', 'unknown')
-                
-                logger.info(f"[PERIODIC] Processing notification {task_id}: type={notification_type}, userId={user_id}, chatId={chat_id}")
-                
-                if not chat_id or not message:
-                    logger.warning(f"[PERIODIC] ❌ Invalid notification task {task_id}: missing chatId ({chat_id}) or message ({bool(message)})")
-                    mark_notification_sent(task_id, success=False, error="Missing chatId or message")
-                    continue
-                
-                try:
-                    await context.bot.send_message(
-                        chat_id=chat_id,
-                        text=message,
-                        parse_mode='HTML'
-                    )
-                    mark_notification_sent(task_id, success=True)
-                    logger.info(f"[PERIODIC] ✅ Successfully sent notification {task_id} to chat {chat_id}")
-                except Exception as e:
-                    error_msg = str(e)
-                    mark_notification_sent(task_id, success=False, error=error_msg)
-                    logger.error(f"[PERIODIC] ❌ Error sending notification {task_id} to {chat_id}: {e}", exc_info=True)
-                    logger.error(f"[PERIODIC] Error details: {error_msg}")
-            
-            # Очищаем старые уведомления (раз в час, проверяем случайно)
-            import random
-            if random.random() < 0.1:  # 10% вероятность
-                cleanup_old_notifications(days=7)
+            await send_future
+            sent_count += len(group)
+            logger.info(f"[PERIODIC] ✅ Successfully sent notifications {task_ids} to chat {chat_id}")
         except Exception as e:
-            logger.error(f"[PERIODIC] Error processing notification queue: {e}", exc_info=True)
-        
-        # Проверяем активность пользователей
-        for telegram_user_id, session in list(user_sessions.items()):
-            user_id = session['user_id']
-            if not check_user_active(user_id):
-                del user_sessions[telegram_user_id]
-                if telegram_user_id in user_states:
-                    del user_states[telegram_user_id]
-                try:
-                    await context.bot.send_message(
-                        chat_id=telegram_user_id,
-                        text="❌ Ваш аккаунт был деактивирован. Используйте /start для повторной авторизации."
-                    )
-                except:
-                    pass
-                continue
-            
-            # Проверяем новые задачи
-            last_check = session.get('last_check', now)
-            
-            # Получаем настройки уведомлений
-            notification_prefs = firebase.get_by_id('notificationPrefs', 'default')
-            # ВСЕ УВЕДОМЛЕНИЯ БАЗОВО АКТИВНЫ - если настройка не существует, считаем что она включена
-            if notification_prefs:
-                new_task_setting = notification_prefs.get('newTask', {'telegramPersonal': True, 'telegramGroup': False})
-                # Если настройка существует но не является словарем, создаем дефолтную
-                if not isinstance(new_task_setting, dict):
-                    new_task_setting = {'telegramPersonal': True, 'telegramGroup': False}
-            else:
-                # Если настроек вообще нет, все уведомления включены по умолчанию
-                new_task_setting = {'telegramPersonal': True, 'telegramGroup': False}
-            
-            # Проверяем, включены ли уведомления о новых задачах (по умолчанию True)
-            if new_task_setting.get('telegramPersonal', True):
-                new_tasks = check_new_tasks(user_id, last_check)
-                logger.info(f"[PERIODIC] Found {len(new_tasks)} new tasks for user {user_id}")
-                
-                for task in new_tasks:
-                    # Проверяем, назначена ли задача на пользователя или создана пользователем
-                    assignee_id = task.get('assigneeId')
-                    assignee_ids = task.get('assigneeIds', [])
-                    created_by = task.get('createdByUserId')
-                    
-                    is_assigned = (assignee_id and str(assignee_id) == str(user_id)) or \
-                                 (isinstance(assignee_ids, list) and user_id in [str(uid) for uid in assignee_ids if uid])
-                    is_created_by = created_by and str(created_by) == str(user_id)
-                    
-                    # Отправляем уведомление если задача назначена на пользователя
-                    if is_assigned:
-                        users = firebase.get_all('users')
-                        projects = firebase.get_all('projects')
-                        assignee_user = next((u for u in users if u.get('id') == assignee_id), None)
-                        assignee_name = assignee_user.get('name', 'Неизвестно') if assignee_user else 'Не назначено'
-                        
-                        # Форматируем сообщение о новой задаче
-                        message = f"🆕 <b>Новая задача</b>\n\n"
-                        message += f"📝 <b>Задача:</b> {task.get('title', 'Без названия')}\n"
-                        message += f"👤 <b>Ответственный:</b> {assignee_name}\n"
-                        if task.get('endDate'):
-                            # Форматируем дату
-                            try:
-                                from datetime import datetime
-                                end_date = task.get('endDate')
-                                if 'T' in end_date:
-                                    end_date = end_date.split('T')[0]
-                                elif ' ' in end_date:
-                                    end_date = end_date.split(' ')[0]
-                                date_obj = datetime.strptime(end_date, '%Y-%m-%d')
-                                message += f"📅 <b>Срок:</b> {date_obj.strftime('%d.%m.%Y')}\n"
-                            except:
-                                message += f"📅 <b>Срок:</b> {task.get('endDate')}\n"
-                        if task.get('priority'):
-                            message += f"⚡ <b>Приоритет:</b> {task.get('priority')}\n"
-                        
-                        keyboard = get_task_menu(task.get('id'))
-                        try:
-                            await context.bot.send_message(
-                                chat_id=telegram_user_id,
-                                text=message,
-                                reply_markup=keyboard,
-                                parse_mode='HTML'
-                            )
-                            logger.info(f"[PERIODIC] Sent new task notification to {telegram_user_id} for task {task.get('id')}")
-                        except Exception as e:
-                            logger.error(f"Error sending task notification: {e}", exc_info=True)
-                    
-                    # Также отправляем уведомление создателю, если он не является исполнителем
-                    elif is_created_by and assignee_id and str(assignee_id) != str(user_id):
-                        users = firebase.get_all('users')
-                        assignee_user = next((u for u in users if u.get('id') == assignee_id), None)
-                        assignee_name = assignee_user.get('name', 'Неизвестно') if assignee_user else 'Не назначено'
-                        
-                        message = f"🆕 <b>Вы создали задачу</b>\n\n"
-                        message += f"📝 <b>Задача:</b> {task.get('title', 'Без названия')}\n"
-                        message += f"👤 <b>Ответственный:</b> {assignee_name}\n"
-                        if task.get('endDate'):
-                            try:
-                                from datetime import datetime
-                                end_date = task.get('endDate')
-                                if 'T' in end_date:
-                                    end_date = end_date.split('T')[0]
-                                elif ' ' in end_date:
-                                    end_date = end_date.split(' ')[0]
-                                date_obj = datetime.strptime(end_date, '%Y-%m-%d')
-                                message += f"📅 <b>Срок:</b> {date_obj.strftime('%d.%m.%Y')}\n"
-                            except:
-                                message += f"📅 <b>Срок:</b> {task.get('endDate')}\n"
-                        
-                        keyboard = get_task_menu(task.get('id'))
-                        try:
-                            await context.bot.send_message(
-                                chat_id=telegram_user_id,
-                                text=message,
-                                reply_markup=keyboard,
-                                parse_mode='HTML'
-                            )
-                            logger.info(f"[PERIODIC] Sent task created notification to {telegram_user_id} for task {task.get('id')}")
-                        except Exception as e:
-                            logger.error(f"Error sending task created notification: {e}", exc_info=True)
-            else:
-                logger.debug(f"[PERIODIC] New task notifications disabled for user {user_id}")
-            
-            # Обновляем время последней проверки
-            session['last_check'] = now
-        
-        # Проверяем успешные сделки для групповых уведомлений
-        notification_prefs = firebase.get_by_id('notificationPrefs', 'default')
-        if notification_prefs:
-            # Проверяем, включены ли уведомления об успешных сделках
-            group_successful_deals = notification_prefs.get('groupSuccessfulDeals', {'telegramGroup': True})
-            if group_successful_deals.get('telegramGroup', True):
-                won_deals = get_won_deals_today()
-                if won_deals:
-                    telegram_chat_id = notification_prefs.get('telegramGroupChatId')
-                    
-                    if telegram_chat_id:
-                        clients = firebase.get_all('clients')
-                        users = firebase.get_all('users')
-                        for deal in won_deals:
-                            message = get_successful_deal_message(deal, clients, users)
-                            if message:
-                                try:
-                                    await context.bot.send_message(
-                                        chat_id=telegram_chat_id,
-                                        text=message,
-                                        parse_mode='HTML'
-                                    )
-                                    logger.info(f"Successfully sent deal notification to group {telegram_chat_id}")
-                                except Exception as e:
-                                    logger.error(f"Error sending successful deal message: {e}")
-                    else:
-                        logger.warning("No telegramGroupChatId configured for deal notifications")
-            else:
-                logger.debug("Group successful deals notifications are disabled")
-    
+            error_msg = str(e)
+            for notification_task in group:
+                release_send_key(notification_task)
+                mark_notification_failed(notification_task.get('id'), error_msg, permanent=is_permanent_send_error(e), lease=lease)
+            logger.error(f"[PERIODIC] ❌ Error sending notifications {task_ids} to {chat_id}: {e}", exc_info=True)
+            logger.error(f"[PERIODIC] Error details: {error_msg}")
+    return sent_count
+
+async def send_digest(bot, events: List[DigestEvent]) -> None:
+    """Отправить собранные уведомления бота (одно событие - как есть, несколько - дайджестом)"""
+    # События, уже отправленные другим путем (тот же ключ в журнале), не повторяем
+    keyed = [event.send_key for event in events if event.send_key]
+    if keyed:
+        sent_keys = outbox.key_statuses(keyed)
+        events = [event for event in events if event.send_key not in sent_keys]
+        if not events:
+            return
+    text, reply_markup = render_events(events)
+    member_keys = [event.send_key for event in events if event.send_key]
+    send_future = outbox.submit(
+        bot, events[0].chat_id, text, 'digest',
+        member_keys=member_keys or None, reply_markup=reply_markup, parse_mode='HTML'
+    )
+    if send_future is None:
+        return
+    try:
+        await send_future
+        logger.info(f"[PERIODIC] Sent {len(events)} {events[0].kind} notifications to {events[0].chat_id}")
+    except Exception as e:
+        logger.error(f"Error sending task notification: {e}", exc_info=True)
+
+@job_runner.guard('replay_outbox')
+async def replay_outbox(context: ContextTypes.DEFAULT_TYPE):
+    """Повторить отправки из журнала, не завершенные до перезапуска"""
+    try:
+        await outbox.replay(context.bot)
     except Exception as e:
-        logger.error(f"[PERIODIC] Error in periodic_check: {e}", exc_info=True)
+        logger.error(f"[OUTBOX] Error replaying outbox: {e}", exc_info=True)
+
+@job_runner.guard('flush_outbox_acks')
+async def flush_outbox_acks(context: ContextTypes.DEFAULT_TYPE):
+    """Отметить в очереди Firebase уведомления, отправленные с прошлого раза"""
+    try:
+        outbox.flush_acks()
+    except Exception as e:
+        logger.error(f"[OUTBOX] Error flushing acks: {e}", exc_info=True)
+
+@job_runner.guard('refresh_counters')
+async def refresh_counters(context: ContextTypes.DEFAULT_TYPE):
+    """Перечитать индексы задач и сделок для счетчиков меню (меню их не перечитывает)"""
+    try:
+        # Перечитывание коллекций - синхронные запросы к Firebase, не блокируем цикл событий
+        await asyncio.to_thread(user_counters.refresh)
+    except Exception as e:
+        logger.error(f"[COUNTERS] Error refreshing counters: {e}", exc_info=True)
+
+async def log_job_stats(context: ContextTypes.DEFAULT_TYPE):
+    """Записать в лог статистику периодических задач и стадий"""
+    job_runner.log_summary()
+    for stage in periodic_stages:
+        logger.info(f"[STAGE] {stage.name}: {stage.stats.summary()}")
+
+@job_runner.guard('cleanup_notifications')
+async def cleanup_notifications(context: ContextTypes.DEFAULT_TYPE):
+    """Очистить старые уведомления очереди, снимки списков задач и журнал отправок"""
+    try:
+        cleanup_old_notifications(days=7)
+        task_list_snapshots.cleanup()
+        outbox.cleanup()
+    except Exception as e:
+        logger.error(f"[PERIODIC] Error cleaning up notifications: {e}", exc_info=True)
+
+async def note_user_activity(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Пользователь работает с ботом - возвращаем очередь уведомлений и поиск новых задач к минимальному интервалу"""
+    notification_queue_stage.wake(context.job_queue)
+    new_tasks_stage.wake(context.job_queue)
+
+async def collect_notification_batches() -> StageRun:
+    """Источник стадии очереди уведомлений: готовые к отправке пачки из Firebase (от веб-приложения)"""
+    # Очередь читается по приоритетным полосам (тип уведомления), пачка чередует полосы по весам
+    reader = LaneReader()
+    batches = []
+    backlog = False
+    for _ in range(config.NOTIFICATION_QUEUE_MAX_BATCHES):
+        batch = reader.next_batch()
+        logger.info(f"[PERIODIC] Found {len(batch)} pending notifications from queue")
+        
+        if batch.items:
+            logger.info(f"[PERIODIC] First notification sample: {batch.items[0]}")
+        
+        # Группы, которые еще собираются в дайджест, остаются в очереди до следующей проверки
+        ready, deferred = ready_notifications(batch.items)
+        if deferred:
+            logger.info(f"[PERIODIC] {deferred} notifications wait to be merged into digests")
+            backlog = True
+        if ready:
+            batches.append(NotificationBatch(items=ready, cursor=batch.cursor, has_more=batch.has_more))
+        if not batch.has_more:
+            break
+    else:
+        # Прочитали максимум пачек, а в очереди еще есть уведомления
+        backlog = True
+    # Полезная работа - отправленные уведомления (их считает обработчик), а не число пачек
+    return StageRun(items=batches, backlog=backlog)
+
+async def send_notification_batch(bot, batch: NotificationBatch) -> int:
+    """Обработчик стадии очереди уведомлений: арендовать пачку и отправить ее (возвращает число отправленных)"""
+    # Арендуем пачку, чтобы другие процессы бота не отправили те же уведомления,
+    # и продлеваем аренду, пока идет отправка
+    lease = batch.lease()
+    heartbeat = asyncio.create_task(lease.keep_alive())
+    try:
+        return await process_notification_batch(bot, lease)
+    finally:
+        heartbeat.cancel()
+
+async def collect_sessions() -> StageRun:
+    """Источник стадии проверки сессий: сессии всех авторизованных пользователей"""
+    # Пользователи читаются один раз на все сессии
+    snapshot = TickSnapshot()
+    # Интервал постоянный, полезная работа не считается
+    return StageRun(items=[(telegram_user_id, session, snapshot) for telegram_user_id, session in list(user_sessions.items())])
+
+async def check_session_active(bot, entry: Tuple[int, dict, TickSnapshot]) -> None:
+    """Обработчик стадии проверки сессий: завершить сессию деактивированного пользователя"""
+    telegram_user_id, session, snapshot = entry
+    if snapshot.user_active(session['user_id']):
+        return
+    user_sessions.pop(telegram_user_id, None)
+    user_states.pop(telegram_user_id, None)
+    try:
+        await bot.send_message(
+            chat_id=telegram_user_id,
+            text="❌ Ваш аккаунт был деактивирован. Используйте /start для повторной авторизации."
+        )
+    except:
+        pass
+
+async def collect_new_task_checks() -> StageRun:
+    """Источник стадии новых задач: сессии, для которых искать задачи, созданные с прошлой проверки"""
+    # Настройки и новые задачи читаются один раз на все сессии
+    snapshot = TickSnapshot()
+    now = snapshot.now
+    
+    # Получаем настройки уведомлений
+    notification_prefs = snapshot.prefs
+    # ВСЕ УВЕДОМЛЕНИЯ БАЗОВО АКТИВНЫ - если настройка не существует, считаем что она включена
+    if notification_prefs:
+        new_task_setting = notification_prefs.get('newTask', {'telegramPersonal': True, 'telegramGroup': False})
+        # Если настройка существует но не является словарем, создаем дефолтную
+        if not isinstance(new_task_setting, dict):
+            new_task_setting = {'telegramPersonal': True, 'telegramGroup': False}
+    else:
+        # Если настроек вообще нет, все уведомления включены по умолчанию
+        new_task_setting = {'telegramPersonal': True, 'telegramGroup': False}
+    
+    # Проверяем, включены ли уведомления о новых задачах (по умолчанию True)
+    if not new_task_setting.get('telegramPersonal', True):
+        logger.debug(f"[PERIODIC] New task notifications disabled")
+        # Обновляем время последней проверки
+        for session in list(user_sessions.values()):
+            session['last_check'] = now
+        return StageRun()
+    
+    sessions = list(user_sessions.items())
+    if sessions:
+        snapshot.load_recent_tasks(min(session.get('last_check', now) for _, session in sessions))
+    # Полезная работа - найденные новые задачи (их считает обработчик), а не число сессий
+    return StageRun(items=[(telegram_user_id, session, snapshot) for telegram_user_id, session in sessions])
+
+async def check_session_new_tasks(bot, check: Tuple[int, dict, TickSnapshot]) -> int:
+    """Обработчик стадии новых задач: уведомления о новых задачах пользователя (через дайджесты), возвращает число новых задач"""
+    telegram_user_id, session, snapshot = check
+    now = snapshot.now
+    if telegram_user_id not in user_sessions:
+        # Сессия завершена, пока проверка ждала в очереди
+        return 0
+    user_id = session['user_id']
+    last_check = session.get('last_check', now)
+    
+    new_tasks = snapshot.new_tasks(user_id, last_check)
+    logger.info(f"[PERIODIC] Found {len(new_tasks)} new tasks for user {user_id}")
+    if new_tasks:
+        # Снимки списков задач пользователя устарели
+        task_list_snapshots.invalidate_user(user_id)
+    
+    for task in new_tasks:
+        # Проверяем, назначена ли задача на пользователя или создана пользователем
+        assignee_id = task.get('assigneeId')
+        assignee_ids = task.get('assigneeIds', [])
+        created_by = task.get('createdByUserId')
+        
+        is_assigned = (assignee_id and str(assignee_id) == str(user_id)) or \
+                     (isinstance(assignee_ids, list) and user_id in [str(uid) for uid in assignee_ids if uid])
+        is_created_by = created_by and str(created_by) == str(user_id)
+        
+        # Уведомление исполнителю, а создателю - если он не исполнитель;
+        # несколько новых задач подряд уходят одним дайджестом
+        if is_assigned or (is_created_by and assignee_id and str(assignee_id) != str(user_id)):
+            assignee_user = get_resolver().user(assignee_id)
+            assignee_name = assignee_user.get('name', 'Неизвестно') if assignee_user else 'Не назначено'
+            entry = f"📝 {task.get('title', 'Без названия')}"
+            if task.get('endDate'):
+                entry += f" (📅 {format_task_due_date(task.get('endDate'))})"
+            digest_buffer.add(DigestEvent(
+                chat_id=telegram_user_id,
+                kind='taskCreated' if is_assigned else 'taskCreatedByMe',
+                text=format_new_task_notification(task, assignee_name, created_by_user=not is_assigned),
+                entry=entry,
+                reply_markup=get_task_menu(task.get('id'))
+            ))
+    
+    # Задачи, созданные после watermark, еще могут появиться в кэше - проверим их в следующий раз
+    session['last_check'] = snapshot.next_check(last_check)
+    return len(new_tasks)
+
+async def collect_ready_digests() -> StageRun:
+    """Источник стадии дайджестов: группы уведомлений, которые пора отправить"""
+    ready = digest_buffer.take_ready()
+    # Группы, которые еще собираются, нужно отправить вовремя
+    return StageRun(items=ready, activity=len(ready), backlog=len(digest_buffer) > 0)
+
+def fan_out_new_deals() -> int:
+    """
+    Уведомить подписчиков dealCreated (notificationPrefs) о новых сделках через дайджесты
+    
+    Returns:
+        Количество поставленных уведомлений
+    """
+    new_deals = new_deal_detector.take_new_deals()
+    subscribers = subscriber_registry.subscribers('dealCreated')
+    if not new_deals or not subscribers:
+        return 0
+    
+    resolver = get_resolver()
+    chat_ids = []
+    for user_id in subscribers:
+        user = resolver.user(user_id)
+        if user and not user.get('isArchived') and user.get('telegramUserId'):
+            chat_ids.append(user.get('telegramUserId'))
+    
+    for deal in new_deals:
+        rendered = render_deal(deal, resolver)
+        text = "🆕 <b>Новая заявка</b>\n\n" + html.escape(rendered.text)
+        entry = f"• {html.escape(deal.get('title') or deal.get('contactName') or 'Без названия')}"
+        for chat_id in chat_ids:
+            digest_buffer.add(DigestEvent(
+                chat_id=chat_id,
+                kind='dealCreated',
+                text=text,
+                entry=entry,
+                reply_markup=rendered.reply_markup,
+                # Ответственный и администраторы получают эту сделку и из очереди веб-приложения
+                send_key=deal_created_send_key(deal.get('id'), chat_id)
+            ))
+    logger.info(f"[PERIODIC] {len(new_deals)} new deals for {len(chat_ids)} subscribers")
+    return len(new_deals) * len(chat_ids)
+
+async def collect_deal_events() -> StageRun:
+    """
+    Источник стадии событий сделок: новые сделки расходятся подписчикам (через стадию дайджестов),
+    сообщения о сделках, перешедших в стадию 'won', отправляет сама стадия
+    """
+    fanned_out = fan_out_new_deals()
+    won_messages = take_won_deal_messages()
+    return StageRun(items=won_messages, activity=fanned_out + len(won_messages))
+
+# Стадии периодической обработки: у каждой свой интервал и параллельность (config.py)
+notification_queue_stage = Stage(
+    'notification_queue', collect_notification_batches, send_notification_batch,
+    AdaptiveInterval(), concurrency=config.NOTIFICATION_QUEUE_CONCURRENCY
+)
+session_stage = Stage(
+    'session_liveness', collect_sessions, check_session_active,
+    AdaptiveInterval(config.SESSION_CHECK_INTERVAL, config.SESSION_CHECK_INTERVAL),
+    concurrency=config.SESSION_CHECK_CONCURRENCY
+)
+new_tasks_stage = Stage('new_tasks', collect_new_task_checks, check_session_new_tasks, AdaptiveInterval())
+digest_stage = Stage(
+    'digests', collect_ready_digests, send_digest,
+    AdaptiveInterval(config.DIGEST_CHECK_INTERVAL, config.DIGEST_CHECK_INTERVAL),
+    concurrency=config.DIGEST_SEND_CONCURRENCY
+)
+deal_events_stage = Stage(
+    'deal_events', collect_deal_events, send_won_deal_message,
+    AdaptiveInterval(config.DEAL_EVENTS_INTERVAL, config.DEAL_EVENTS_INTERVAL)
+)
+periodic_stages = [notification_queue_stage, session_stage, new_tasks_stage, digest_stage, deal_events_stage]
 
 def main():
     """Главная функция запуска бота"""
@@ -2435,9 +2657,24 @@ def main():
     
     logger.info("[BOT] All handlers registered successfully")
     
-    # Периодическая проверка (каждые 10 секунд для быстрой доставки уведомлений)
+    # Любое действие пользователя возвращает очередь уведомлений и поиск новых задач к минимальному интервалу
+    application.add_handler(TypeHandler(Update, note_user_activity), group=-1)
+    
+    # Периодическая обработка: независимые стадии со своими интервалами
     job_queue = application.job_queue
-    job_queue.run_repeating(periodic_check, interval=10, first=5)
+    # Опоздания и пропуски запусков задач бота - в статистику job_runner
+    job_runner.attach(job_queue.scheduler)
+    # Уведомления без dueAt (записанные до появления поля) очередь не видит - проставляем до первого чтения
+    backfill_due_at()
+    for stage in periodic_stages:
+        stage.schedule(job_queue, 5)
+    job_queue.run_repeating(cleanup_notifications, interval=3600, first=60)
+    job_queue.run_repeating(refresh_counters, interval=config.COLLECTION_STORE_TTL, first=0)
+    
+    # Журнал отправок: незавершенные до перезапуска отправки и отметки в Firebase пачками
+    job_queue.run_once(replay_outbox, when=0)
+    job_queue.run_repeating(flush_outbox_acks, interval=config.OUTBOX_ACK_INTERVAL, first=config.OUTBOX_ACK_INTERVAL)
+    job_queue.run_repeating(log_job_stats, interval=config.JOB_STATS_INTERVAL, first=config.JOB_STATS_INTERVAL)
     
     # Запускаем планировщик задач
     scheduler = TaskScheduler(application.bot)
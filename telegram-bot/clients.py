@@ -4,6 +4,8 @@
 from typing import List, Dict, Any, Optional
 from datetime import datetime
 from firebase_client import firebase
+from collection_store import apply_saved
+from search_index import get_client_search, DEFAULT_SEARCH_LIMIT
 
 def get_all_clients(include_archived: bool = False) -> List[Dict[str, Any]]:
     """Получить всех клиентов"""
@@ -33,26 +35,16 @@ def create_client(client_data: Dict[str, Any]) -> Optional[str]:
             client_data['id'] = f"client-{int(datetime.now().timestamp() * 1000)}"
         
         firebase.save('clients', client_data)
+        apply_saved('clients', client_data)
         return client_data['id']
     except Exception as e:
         print(f"Error creating client: {e}")
         return None
 
-def search_clients(query: str) -> List[Dict[str, Any]]:
-    """Поиск клиентов по запросу"""
+def search_clients(query: str, limit: int = DEFAULT_SEARCH_LIMIT) -> List[Dict[str, Any]]:
+    """Поиск активных клиентов по имени, компании, контактному лицу или телефону (лучшие совпадения первыми)"""
     try:
-        all_clients = get_all_clients()
-        query_lower = query.lower()
-        
-        results = []
-        for client in all_clients:
-            name = client.get('name', '').lower()
-            company_name = client.get('companyName', '').lower()
-            
-            if query_lower in name or query_lower in company_name:
-                results.append(client)
-        
-        return results
+        return get_client_search().search(query, limit)
     except Exception as e:
         print(f"Error searching clients: {e}")
         return []
@@ -0,0 +1,188 @@
+"""
+Кэш коллекций Firebase в памяти
+Хранит копию коллекции и сообщает подписчикам об изменениях документов.
+С Admin SDK изменения приходят через подписку Firestore (on_snapshot),
+с REST API коллекция перечитывается по TTL и сравнивается с копией
+"""
+import logging
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Dict, Any, List, Optional, Tuple, Callable
+import config
+from firebase_client import firebase
+
+logger = logging.getLogger(__name__)
+
+# Подписчик получает (старый документ, новый документ); None - документа не было / он удален
+ChangeListener = Callable[[Optional[Dict[str, Any]], Optional[Dict[str, Any]]], None]
+
+# Даже при живой подписке изредка перечитываем коллекцию целиком (на случай обрыва потока)
+LIVE_RESYNC_SECONDS = 3600
+# Подписка доставляет изменения с задержкой: живая копия считается полной на столько секунд назад
+LIVE_WATERMARK_LAG_SECONDS = 5
+
+class CollectionStore:
+    """Копия одной коллекции в памяти с уведомлениями об изменениях"""
+    
+    def __init__(self, collection_name: str, ttl_seconds: int = config.COLLECTION_STORE_TTL):
+        self.collection_name = collection_name
+        self.ttl_seconds = ttl_seconds
+        # Общая блокировка коллекции - под ней же работают индексы, построенные поверх нее
+        self.lock = threading.RLock()
+        # Увеличивается при каждом изменении (используется как версия данных)
+        self.version = 0
+        self._docs: Dict[str, Dict[str, Any]] = {}
+        self._listeners: List[ChangeListener] = []
+        self._loaded_at: Optional[float] = None
+        # Время начала последнего успешного перечитывания (все созданное раньше уже в копии)
+        self._synced_at: Optional[datetime] = None
+        self._watch = None
+    
+    @property
+    def is_loaded(self) -> bool:
+        return self._loaded_at is not None
+    
+    @property
+    def is_live(self) -> bool:
+        return self._watch is not None
+    
+    def synced_until(self) -> Optional[datetime]:
+        """
+        Время, до которого в копии гарантированно есть все документы коллекции (None - не загружена)
+        
+        С REST API копия отстает до TTL: документ, созданный после начала перечитывания,
+        появится только при следующем. Поиск "созданных после T" по копии должен
+        продвигать T до этого времени, а не до текущего
+        """
+        if self._synced_at is None:
+            return None
+        if self.is_live:
+            return max(self._synced_at, datetime.now() - timedelta(seconds=LIVE_WATERMARK_LAG_SECONDS))
+        return self._synced_at
+    
+    def subscribe(self, listener: ChangeListener, replay: bool = False) -> None:
+        """
+        Подписаться на изменения документов (не загружает коллекцию)
+        
+        Args:
+            listener: Подписчик
+            replay: Сразу передать подписчику уже загруженные документы как новые
+                (для индексов, которые создаются после загрузки коллекции)
+        """
+        with self.lock:
+            self._listeners.append(listener)
+            if replay:
+                for doc in list(self._docs.values()):
+                    listener(None, doc)
+    
+    def ensure_fresh(self) -> None:
+        """Загрузить коллекцию при первом обращении и перечитать, если копия устарела"""
+        max_age = LIVE_RESYNC_SECONDS if self.is_live else self.ttl_seconds
+        if self._loaded_at is None or time.monotonic() - self._loaded_at > max_age:
+            self.reload()
+    
+    def reload(self) -> None:
+        """Перечитать коллекцию целиком и разослать изменения относительно копии"""
+        # createdAt хранится с точностью до миллисекунды: документ, созданный в ту же миллисекунду
+        # уже после начала чтения, не должен оказаться "раньше" времени синхронизации
+        started_at = datetime.now() - timedelta(milliseconds=1)
+        docs = firebase.get_all(self.collection_name)
+        with self.lock:
+            if not docs and self._docs:
+                # get_all возвращает [] и при ошибке - не считаем это удалением всей коллекции
+                logger.warning(f"[STORE] Empty reload of {self.collection_name}, keeping {len(self._docs)} cached docs")
+            else:
+                seen = set()
+                for doc in docs:
+                    seen.add(doc.get('id'))
+                    self.apply(doc)
+                for doc_id in [i for i in self._docs if i not in seen]:
+                    self.remove(doc_id)
+                self._synced_at = started_at
+            first_load = self._loaded_at is None
+            self._loaded_at = time.monotonic()
+        logger.info(f"[STORE] Loaded {len(docs)} docs from {self.collection_name}")
+        
+        if first_load:
+            self._watch = firebase.watch(self.collection_name, self._on_watch)
+            if self._watch is not None:
+                logger.info(f"[STORE] Watching {self.collection_name} for changes")
+    
+    def _on_watch(self, events: List[tuple]) -> None:
+        """Изменения из подписки Firestore"""
+        for change_type, doc in events:
+            if change_type == 'removed':
+                self.remove(doc.get('id'))
+            else:
+                self.apply(doc)
+    
+    def apply(self, doc: Dict[str, Any]) -> None:
+        """Записать документ в копию (изменения из Firebase или сохраненные ботом)"""
+        doc_id = doc.get('id')
+        if not doc_id:
+            return
+        with self.lock:
+            old = self._docs.get(doc_id)
+            if old == doc:
+                return
+            new = dict(doc)
+            self._docs[doc_id] = new
+            self.version += 1
+            self._notify(old, new)
+    
+    def remove(self, doc_id: str) -> None:
+        """Удалить документ из копии"""
+        with self.lock:
+            old = self._docs.pop(doc_id, None)
+            if old is None:
+                return
+            self.version += 1
+            self._notify(old, None)
+    
+    def _notify(self, old: Optional[Dict[str, Any]], new: Optional[Dict[str, Any]]) -> None:
+        for listener in self._listeners:
+            try:
+                listener(old, new)
+            except Exception as e:
+                logger.error(f"[STORE] Listener error for {self.collection_name}: {e}", exc_info=True)
+    
+    def get(self, doc_id: str) -> Optional[Dict[str, Any]]:
+        """Получить документ из копии"""
+        self.ensure_fresh()
+        with self.lock:
+            return self._docs.get(doc_id)
+    
+    def peek(self, doc_id: str) -> Optional[Dict[str, Any]]:
+        """Документ из копии без проверки свежести (для индексов, уже держащих блокировку)"""
+        return self._docs.get(doc_id)
+    
+    def snapshot(self) -> Tuple[int, Dict[str, Dict[str, Any]]]:
+        """Версия и копия словаря ID -> документ"""
+        self.ensure_fresh()
+        with self.lock:
+            return self.version, dict(self._docs)
+    
+    def values(self) -> List[Dict[str, Any]]:
+        """Все документы коллекции из копии"""
+        self.ensure_fresh()
+        with self.lock:
+            return list(self._docs.values())
+
+_stores: Dict[str, CollectionStore] = {}
+_stores_lock = threading.Lock()
+
+def get_store(collection_name: str) -> CollectionStore:
+    """Получить кэш коллекции (создается при первом обращении, загружается при первом чтении)"""
+    with _stores_lock:
+        store = _stores.get(collection_name)
+        if store is None:
+            store = CollectionStore(collection_name)
+            _stores[collection_name] = store
+        return store
+
+def apply_saved(collection_name: str, doc: Dict[str, Any]) -> None:
+    """Отразить в кэше документ, сохраненный ботом (если коллекция уже загружена)"""
+    store = get_store(collection_name)
+    if store.is_loaded:
+        store.apply(doc)
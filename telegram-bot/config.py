@@ -25,3 +25,78 @@ DAILY_REMINDER_TIME = '09:00'  # 9:00 утра
 # Время еженедельного отчета (понедельник)
 WEEKLY_REPORT_DAY = 0  # 0 = понедельник
 WEEKLY_REPORT_TIME = '09:00'  # 9:00 утра
+
+# Время жизни снимка списка задач для пагинации (секунды)
+TASK_LIST_SNAPSHOT_TTL = int(os.getenv('TASK_LIST_SNAPSHOT_TTL', '60'))
+
+# Как часто перечитывать коллекции, закэшированные в памяти, если нет подписки на изменения (секунды)
+COLLECTION_STORE_TTL = int(os.getenv('COLLECTION_STORE_TTL', '60'))
+
+# Сколько отрисованных сообщений о задачах и сделках держать в кэше
+RENDER_CACHE_SIZE = int(os.getenv('RENDER_CACHE_SIZE', '500'))
+
+# Отправка сообщений: сколько запросов к Telegram одновременно и лимиты скорости
+# (общий - сообщений в секунду, в один чат - в секунду, в одну группу - в минуту)
+SEND_CONCURRENCY = int(os.getenv('SEND_CONCURRENCY', '8'))
+SEND_GLOBAL_RATE = float(os.getenv('SEND_GLOBAL_RATE', '30'))
+SEND_CHAT_RATE = float(os.getenv('SEND_CHAT_RATE', '1'))
+SEND_GROUP_RATE_PER_MINUTE = float(os.getenv('SEND_GROUP_RATE_PER_MINUTE', '20'))
+# Сколько раз повторять отправку после RetryAfter
+SEND_MAX_RETRIES = int(os.getenv('SEND_MAX_RETRIES', '3'))
+
+# Очередь уведомлений от веб-приложения: размер пачки и сколько пачек обрабатывать за одну проверку
+NOTIFICATION_QUEUE_BATCH_SIZE = int(os.getenv('NOTIFICATION_QUEUE_BATCH_SIZE', '20'))
+NOTIFICATION_QUEUE_MAX_BATCHES = int(os.getenv('NOTIFICATION_QUEUE_MAX_BATCHES', '5'))
+
+# Аренда уведомлений очереди: ID процесса бота (по умолчанию хост и PID) и срок аренды (секунды)
+NOTIFICATION_WORKER_ID = os.getenv('NOTIFICATION_WORKER_ID', '')
+NOTIFICATION_LEASE_SECONDS = int(os.getenv('NOTIFICATION_LEASE_SECONDS', '60'))
+
+# Повторы неудачных уведомлений: задержка первой повторной попытки и максимальная задержка (секунды),
+# после скольких попыток уведомление уходит в notificationDeadLetters
+NOTIFICATION_RETRY_BASE_SECONDS = int(os.getenv('NOTIFICATION_RETRY_BASE_SECONDS', '30'))
+NOTIFICATION_RETRY_MAX_SECONDS = int(os.getenv('NOTIFICATION_RETRY_MAX_SECONDS', '3600'))
+NOTIFICATION_MAX_ATTEMPTS = int(os.getenv('NOTIFICATION_MAX_ATTEMPTS', '6'))
+
+# Защита от дублей уведомлений: сколько последних ключей помнить и в каком окне (секунды)
+# одинаковые по содержимому уведомления считаются одним
+NOTIFICATION_RECENT_KEYS = int(os.getenv('NOTIFICATION_RECENT_KEYS', '10000'))
+NOTIFICATION_DEDUPE_WINDOW_SECONDS = int(os.getenv('NOTIFICATION_DEDUPE_WINDOW_SECONDS', '600'))
+
+# Дайджесты уведомлений: сколько ждать новых событий того же типа в тот же чат, максимальная
+# задержка самого старого события (секунды) и сколько событий отправлять одним сообщением
+NOTIFICATION_DIGEST_WINDOW_SECONDS = int(os.getenv('NOTIFICATION_DIGEST_WINDOW_SECONDS', '15'))
+NOTIFICATION_DIGEST_MAX_DELAY_SECONDS = int(os.getenv('NOTIFICATION_DIGEST_MAX_DELAY_SECONDS', '60'))
+NOTIFICATION_DIGEST_MAX_SIZE = int(os.getenv('NOTIFICATION_DIGEST_MAX_SIZE', '10'))
+
+# Локальный журнал отправок (SQLite): путь к файлу, как часто отмечать отправленные уведомления
+# в Firebase (секунды) и сколько дней хранить завершенные записи
+OUTBOX_PATH = os.getenv('OUTBOX_PATH', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'outbox.db'))
+OUTBOX_ACK_INTERVAL = int(os.getenv('OUTBOX_ACK_INTERVAL', '2'))
+OUTBOX_RETENTION_DAYS = int(os.getenv('OUTBOX_RETENTION_DAYS', '3'))
+
+# Интервал периодической проверки (секунды): минимальный - при очереди уведомлений и активности,
+# максимальный - в простое; во сколько раз интервал растет после каждой проверки без событий
+PERIODIC_CHECK_MIN_INTERVAL = float(os.getenv('PERIODIC_CHECK_MIN_INTERVAL', '3'))
+PERIODIC_CHECK_MAX_INTERVAL = float(os.getenv('PERIODIC_CHECK_MAX_INTERVAL', '60'))
+PERIODIC_CHECK_BACKOFF = float(os.getenv('PERIODIC_CHECK_BACKOFF', '2'))
+
+# Статистика периодических задач: опоздание запуска (секунды), о котором писать предупреждение,
+# и как часто записывать сводку в лог (секунды)
+JOB_LAG_WARNING_SECONDS = float(os.getenv('JOB_LAG_WARNING_SECONDS', '5'))
+JOB_STATS_INTERVAL = int(os.getenv('JOB_STATS_INTERVAL', '600'))
+
+# Стадии периодической обработки: сколько пачек очереди уведомлений отправлять одновременно,
+# интервалы (секунды) проверки сессий, дайджестов и событий сделок, параллельность отправки
+NOTIFICATION_QUEUE_CONCURRENCY = int(os.getenv('NOTIFICATION_QUEUE_CONCURRENCY', '2'))
+SESSION_CHECK_INTERVAL = float(os.getenv('SESSION_CHECK_INTERVAL', '60'))
+SESSION_CHECK_CONCURRENCY = int(os.getenv('SESSION_CHECK_CONCURRENCY', '4'))
+DIGEST_CHECK_INTERVAL = float(os.getenv('DIGEST_CHECK_INTERVAL', '5'))
+DIGEST_SEND_CONCURRENCY = int(os.getenv('DIGEST_SEND_CONCURRENCY', '4'))
+DEAL_EVENTS_INTERVAL = float(os.getenv('DEAL_EVENTS_INTERVAL', '10'))
+
+# Напоминания о встречах: за сколько минут до встречи напоминать по умолчанию (через запятую,
+# пользователь может задать свои в поле meetingReminderMinutes) и сколько секунд после
+# назначенного времени напоминание еще можно отправить (если бот был остановлен)
+MEETING_REMINDER_MINUTES = tuple(int(m) for m in os.getenv('MEETING_REMINDER_MINUTES', '15').split(',') if m.strip())
+MEETING_REMINDER_GRACE_SECONDS = int(os.getenv('MEETING_REMINDER_GRACE_SECONDS', '300'))
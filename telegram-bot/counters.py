@@ -0,0 +1,111 @@
+"""
+Счетчики пользователя для бейджей в меню
+Количество активных, сегодняшних и просроченных задач и сделок пользователя
+поддерживается инкрементально по изменениям индексов задач и сделок.
+Индексы перечитывает фоновая задача (refresh), чтение счетчиков при отрисовке
+меню никогда не загружает коллекции
+"""
+import logging
+import threading
+from dataclasses import dataclass, replace
+from datetime import date
+from typing import Dict, Any, Optional
+from tasks import get_local_today
+from task_index import TaskEntry, get_task_index
+from deal_index import get_deal_index
+
+logger = logging.getLogger(__name__)
+
+@dataclass
+class UserCounters:
+    """Счетчики одного пользователя"""
+    active_tasks: int = 0
+    today_tasks: int = 0
+    overdue_tasks: int = 0
+    deals: int = 0
+
+class CountersService:
+    """Счетчики всех пользователей"""
+    
+    def __init__(self):
+        self._counters: Dict[str, UserCounters] = {}
+        self._day: Optional[date] = None
+        self._started = False
+        self._lock = threading.Lock()
+    
+    def _start(self) -> None:
+        """Подписаться на индексы и посчитать счетчики по их текущему состоянию"""
+        task_index = get_task_index()
+        deal_index = get_deal_index()
+        task_index.subscribe(self._on_task_change)
+        deal_index.subscribe(self._on_deal_change)
+        self._started = True
+        self._rebuild()
+    
+    def _rebuild(self) -> None:
+        """Пересчитать счетчики по индексам (при запуске и при смене дня)"""
+        task_index = get_task_index()
+        deal_index = get_deal_index()
+        task_index.ensure_fresh()
+        deal_index.ensure_fresh()
+        # Порядок блокировок тот же, что и при событиях: коллекция -> счетчики
+        with task_index.store.lock, deal_index.store.lock, self._lock:
+            self._day = get_local_today()
+            self._counters = {}
+            for entry in task_index.entries():
+                self._apply_task(entry, 1)
+            for user_id, count in deal_index.assignee_counts().items():
+                self._get(str(user_id)).deals = count
+        logger.info(f"[COUNTERS] Rebuilt counters for {len(self._counters)} users")
+    
+    def _get(self, user_id: str) -> UserCounters:
+        counters = self._counters.get(user_id)
+        if counters is None:
+            counters = UserCounters()
+            self._counters[user_id] = counters
+        return counters
+    
+    def _apply_task(self, entry: TaskEntry, delta: int) -> None:
+        for user_id in entry.user_ids:
+            counters = self._get(user_id)
+            counters.active_tasks += delta
+            if entry.end_date and self._day:
+                if entry.end_date == self._day:
+                    counters.today_tasks += delta
+                elif entry.end_date < self._day:
+                    counters.overdue_tasks += delta
+    
+    def _on_task_change(self, task_id: str, old_entry: Optional[TaskEntry], new_entry: Optional[TaskEntry]) -> None:
+        with self._lock:
+            if old_entry:
+                self._apply_task(old_entry, -1)
+            if new_entry:
+                self._apply_task(new_entry, 1)
+    
+    def _on_deal_change(self, old_deal: Optional[Dict[str, Any]], new_deal: Optional[Dict[str, Any]]) -> None:
+        with self._lock:
+            if old_deal and old_deal.get('assigneeId'):
+                self._get(str(old_deal['assigneeId'])).deals -= 1
+            if new_deal and new_deal.get('assigneeId'):
+                self._get(str(new_deal['assigneeId'])).deals += 1
+    
+    def refresh(self) -> None:
+        """Загрузить / перечитать индексы и пересчитать счетчики при смене дня (из фоновой задачи)"""
+        if not self._started:
+            self._start()
+            return
+        # Без подписки Firestore индексы перечитываются по TTL
+        get_task_index().ensure_fresh()
+        get_deal_index().ensure_fresh()
+        if self._day != get_local_today():
+            self._rebuild()
+    
+    def get(self, user_id: str) -> Optional[UserCounters]:
+        """Счетчики пользователя (копия) или None, если индексы еще не загружены"""
+        if not self._started:
+            return None
+        with self._lock:
+            return replace(self._counters.get(str(user_id)) or UserCounters())
+
+# Создаем экземпляр сервиса
+user_counters = CountersService()
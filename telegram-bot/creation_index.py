@@ -0,0 +1,89 @@
+"""
+Индекс документов по времени создания
+Строится поверх кэша коллекции: отсортированный массив времен создания (миллисекунды
+эпохи) и параллельный массив ID; "созданные после T" - бинарный поиск и срез,
+без разбора createdAt у всех документов коллекции
+"""
+import bisect
+import logging
+from datetime import datetime
+from typing import Dict, Any, List, Optional
+from collection_store import CollectionStore, get_store
+
+logger = logging.getLogger(__name__)
+
+def to_epoch_ms(value: datetime) -> int:
+    """Время в миллисекундах эпохи (время без часового пояса - локальное, как datetime.now())"""
+    return int(value.timestamp() * 1000)
+
+def created_at_ms(doc: Dict[str, Any], field: str = 'createdAt') -> Optional[int]:
+    """Время создания документа в миллисекундах эпохи или None, если его нет / не разбирается"""
+    created_at = doc.get(field)
+    if not created_at:
+        return None
+    try:
+        return to_epoch_ms(datetime.fromisoformat(str(created_at).replace('Z', '+00:00')))
+    except Exception:
+        return None
+
+class CreationIndex:
+    """Документы коллекции, упорядоченные по времени создания"""
+    
+    def __init__(self, store: CollectionStore, field: str = 'createdAt'):
+        self.store = store
+        self.field = field
+        # Отсортированные времена создания и ID документов в том же порядке
+        self._times: List[int] = []
+        self._ids: List[str] = []
+        self._time_of: Dict[str, int] = {}
+        store.subscribe(self._on_change, replay=True)
+    
+    def _on_change(self, old: Optional[Dict[str, Any]], new: Optional[Dict[str, Any]]) -> None:
+        doc_id = (new or old).get('id')
+        created = created_at_ms(new, self.field) if new else None
+        if self._time_of.get(doc_id) == created:
+            return
+        self._remove(doc_id)
+        if created is not None:
+            position = bisect.bisect_right(self._times, created)
+            self._times.insert(position, created)
+            self._ids.insert(position, doc_id)
+            self._time_of[doc_id] = created
+    
+    def _remove(self, doc_id: str) -> None:
+        created = self._time_of.pop(doc_id, None)
+        if created is None:
+            return
+        # Среди документов с тем же временем создания ищем нужный ID
+        position = bisect.bisect_left(self._times, created)
+        while self._ids[position] != doc_id:
+            position += 1
+        del self._times[position]
+        del self._ids[position]
+    
+    def watermark(self) -> Optional[datetime]:
+        """Время, до которого индекс знает все созданные документы (CollectionStore.synced_until)"""
+        self.store.ensure_fresh()
+        return self.store.synced_until()
+    
+    def created_since(self, since: datetime, until: Optional[datetime] = None) -> List[Dict[str, Any]]:
+        """
+        Документы, созданные после since и не позже until (по возрастанию времени создания)
+        
+        Для поиска новых документов until - watermark(), и следующий поиск начинается
+        с него: документы, попавшие в кэш позже, не теряются
+        """
+        self.store.ensure_fresh()
+        with self.store.lock:
+            start = bisect.bisect_right(self._times, to_epoch_ms(since))
+            end = bisect.bisect_right(self._times, to_epoch_ms(until)) if until is not None else len(self._times)
+            docs = [self.store.peek(doc_id) for doc_id in self._ids[start:end]]
+        return [doc for doc in docs if doc is not None]
+
+_indexes: Dict[str, CreationIndex] = {}
+
+def get_creation_index(collection_name: str) -> CreationIndex:
+    """Индекс коллекции по времени создания (создается при первом обращении)"""
+    if collection_name not in _indexes:
+        _indexes[collection_name] = CreationIndex(get_store(collection_name))
+    return _indexes[collection_name]
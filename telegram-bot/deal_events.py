@@ -0,0 +1,157 @@
+"""
+События сделок: новые сделки и переходы в стадию 'won'
+Переходы определяются по изменениям кэша коллекции deals (старая и новая стадия).
+Объявленная сделка сохраняется в Firebase (ID документа - ID сделки) после отправки
+сообщения и остается там, пока сделка в стадии 'won': правки объявленной сделки и
+перезапуск бота не повторяют сообщение. Когда сделка уходит из 'won', запись удаляется,
+и следующий переход в 'won' объявляется снова
+"""
+import logging
+import threading
+from collections import deque
+from datetime import datetime
+from typing import Dict, Any, List, Optional, Set
+import pytz
+import config
+from firebase_client import firebase
+from collection_store import CollectionStore, get_store
+
+logger = logging.getLogger(__name__)
+
+WON_STAGE = 'won'
+WON_DEALS_COLLECTION = 'telegramWonDeals'
+
+def _updated_today(deal: Dict[str, Any]) -> bool:
+    updated_at = deal.get('updatedAt', '')
+    if not updated_at:
+        return False
+    try:
+        tz = pytz.timezone(config.DEFAULT_TIMEZONE)
+        updated = datetime.fromisoformat(updated_at.replace('Z', '+00:00'))
+        if updated.tzinfo is None:
+            updated = tz.localize(updated)
+        return updated.astimezone(tz).date() == datetime.now(tz).date()
+    except Exception:
+        return False
+
+class WonDealDetector:
+    """Находит переходы сделок в стадию 'won' и выдает каждый переход один раз"""
+    
+    def __init__(self, store: CollectionStore):
+        self.store = store
+        self._pending: deque = deque()
+        # Сделки, ушедшие из 'won' (или не в 'won' при первой загрузке): их записи удаляются
+        self._left: deque = deque()
+        self._announced: Optional[Set[str]] = None
+        # Сделки, выданные на отправку, но еще не подтвержденные
+        self._in_flight: Set[str] = set()
+        self._lock = threading.Lock()
+        store.subscribe(self._on_change)
+    
+    def _on_change(self, old: Optional[Dict[str, Any]], new: Optional[Dict[str, Any]]) -> None:
+        if not new or new.get('stage') != WON_STAGE:
+            if old is None or old.get('stage') == WON_STAGE:
+                self._left.append((new or old).get('id'))
+            return
+        if old and old.get('stage') == WON_STAGE:
+            return
+        if old is None and not self.store.is_loaded:
+            # Первая загрузка: прежняя стадия неизвестна, догоняем только сегодняшние победы
+            # (например, пока бот был выключен); уже объявленные отсеются при выдаче
+            if not _updated_today(new):
+                return
+        self._pending.append(new.get('id'))
+    
+    def _load_announced(self) -> Set[str]:
+        if self._announced is None:
+            self._announced = set(firebase.list_ids(WON_DEALS_COLLECTION))
+            logger.info(f"[WON_DEALS] Loaded {len(self._announced)} announced deals")
+        return self._announced
+    
+    def _forget_left(self, announced: Set[str]) -> None:
+        """Удалить записи сделок, ушедших из 'won' (следующий переход будет объявлен)"""
+        while self._left:
+            deal_id = self._left.popleft()
+            if deal_id not in announced:
+                continue
+            # Если сделка уже вернулась в 'won', новый переход ждет в _pending
+            announced.discard(deal_id)
+            firebase.delete(WON_DEALS_COLLECTION, deal_id)
+    
+    def take_won_deals(self) -> List[Dict[str, Any]]:
+        """
+        Сделки, перешедшие в 'won' с прошлого вызова и еще не объявленные
+        
+        После отправки сообщения сделку нужно подтвердить (mark_announced)
+        или вернуть на повтор (retry_later); до этого она повторно не выдается
+        """
+        self.store.ensure_fresh()
+        with self._lock:
+            announced = self._load_announced()
+            self._forget_left(announced)
+            won_deals = []
+            while self._pending:
+                deal = self.store.get(self._pending.popleft())
+                if not deal or deal.get('stage') != WON_STAGE:
+                    continue
+                deal_id = deal.get('id')
+                if deal_id in announced or deal_id in self._in_flight:
+                    continue
+                self._in_flight.add(deal_id)
+                won_deals.append(deal)
+        if won_deals:
+            logger.info(f"[WON_DEALS] {len(won_deals)} deals moved to won")
+        return won_deals
+    
+    def mark_announced(self, deal: Dict[str, Any]) -> None:
+        """Сообщение отправлено - не объявлять сделку, пока она в 'won' (в том числе после перезапуска)"""
+        deal_id = deal.get('id')
+        with self._lock:
+            self._in_flight.discard(deal_id)
+            self._load_announced().add(deal_id)
+        firebase.save(WON_DEALS_COLLECTION, {
+            'id': deal_id,
+            'announcedAt': datetime.now().isoformat()
+        })
+    
+    def retry_later(self, deal: Dict[str, Any]) -> None:
+        """Сообщение не отправлено - выдать переход снова при следующем вызове"""
+        with self._lock:
+            self._in_flight.discard(deal.get('id'))
+            self._pending.append(deal.get('id'))
+    
+    def discard_pending(self) -> None:
+        """Забыть накопленные переходы (уведомления выключены)"""
+        self._pending.clear()
+
+class NewDealDetector:
+    """
+    Находит сделки, появившиеся после загрузки коллекции
+    
+    Сделки, созданные, пока бот был выключен, при первой загрузке не отличить от старых -
+    они не объявляются (ответственный и администраторы получают их из очереди веб-приложения)
+    """
+    
+    def __init__(self, store: CollectionStore):
+        self.store = store
+        self._pending: deque = deque()
+        store.subscribe(self._on_change)
+    
+    def _on_change(self, old: Optional[Dict[str, Any]], new: Optional[Dict[str, Any]]) -> None:
+        # При первой загрузке все сделки "новые" - их не объявляем
+        if old is None and new and self.store.is_loaded and not new.get('isArchived'):
+            self._pending.append(new.get('id'))
+    
+    def take_new_deals(self) -> List[Dict[str, Any]]:
+        """Сделки, созданные с прошлого вызова"""
+        self.store.ensure_fresh()
+        new_deals = []
+        while self._pending:
+            deal = self.store.get(self._pending.popleft())
+            if deal and not deal.get('isArchived'):
+                new_deals.append(deal)
+        return new_deals
+
+# Создаем экземпляры детекторов
+won_deal_detector = WonDealDetector(get_store('deals'))
+new_deal_detector = NewDealDetector(get_store('deals'))
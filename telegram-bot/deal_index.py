@@ -0,0 +1,155 @@
+"""
+Индекс активных сделок
+Строится поверх кэша коллекции deals и обновляется по одному документу при изменениях:
+сделки по (воронка, этап), по ответственному и по клиенту
+"""
+import logging
+from typing import Dict, Any, List, Optional, Set, Tuple, Callable, Iterable
+from collection_store import CollectionStore, get_store
+
+logger = logging.getLogger(__name__)
+
+# Подписчик получает (старая сделка, новая сделка); None - сделка не активна (нет или в архиве)
+DealIndexListener = Callable[[Optional[Dict[str, Any]], Optional[Dict[str, Any]]], None]
+
+def is_new_deal_stage(stage: str) -> bool:
+    """Этап "НОВАЯ ЗАЯВКА" (ищем по stage = "НОВАЯ ЗАЯВКА" или похожим значениям)"""
+    stage = (stage or '').lower()
+    return 'новая' in stage or 'new' in stage
+
+def _active(deal: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    if not deal or deal.get('isArchived', False):
+        return None
+    return deal
+
+class DealIndex:
+    """Активные (не архивные) сделки по воронкам, этапам, ответственным и клиентам"""
+    
+    def __init__(self, store: CollectionStore):
+        self.store = store
+        self._ids: Set[str] = set()
+        self._by_stage: Dict[Tuple[str, str], Set[str]] = {}
+        self._by_funnel: Dict[str, Set[str]] = {}
+        self._by_assignee: Dict[str, Set[str]] = {}
+        self._by_client: Dict[str, Set[str]] = {}
+        self._listeners: List[DealIndexListener] = []
+        store.subscribe(self._on_change, replay=True)
+    
+    def subscribe(self, listener: DealIndexListener) -> None:
+        """Подписаться на изменения активных сделок"""
+        with self.store.lock:
+            self._listeners.append(listener)
+    
+    def _on_change(self, old: Optional[Dict[str, Any]], new: Optional[Dict[str, Any]]) -> None:
+        old_deal = _active(old)
+        new_deal = _active(new)
+        if old_deal is None and new_deal is None:
+            return
+        
+        if old_deal:
+            self._index(old_deal, self._bucket_remove)
+            self._ids.discard(old_deal['id'])
+        if new_deal:
+            self._index(new_deal, self._bucket_add)
+            self._ids.add(new_deal['id'])
+        
+        for listener in self._listeners:
+            try:
+                listener(old_deal, new_deal)
+            except Exception as e:
+                logger.error(f"[DEAL_INDEX] Listener error: {e}", exc_info=True)
+    
+    def _index(self, deal: Dict[str, Any], update: Callable[[Dict, Any, str], None]) -> None:
+        deal_id = deal['id']
+        funnel_id = deal.get('funnelId')
+        update(self._by_stage, (funnel_id or '', deal.get('stage') or ''), deal_id)
+        update(self._by_funnel, funnel_id, deal_id)
+        assignee_id = deal.get('assigneeId')
+        update(self._by_assignee, str(assignee_id) if assignee_id else None, deal_id)
+        update(self._by_client, deal.get('clientId'), deal_id)
+    
+    @staticmethod
+    def _bucket_add(buckets: Dict, key: Any, deal_id: str) -> None:
+        if key:
+            buckets.setdefault(key, set()).add(deal_id)
+    
+    @staticmethod
+    def _bucket_remove(buckets: Dict, key: Any, deal_id: str) -> None:
+        bucket = buckets.get(key)
+        if bucket is not None:
+            bucket.discard(deal_id)
+            if not bucket:
+                del buckets[key]
+    
+    def ensure_fresh(self) -> None:
+        self.store.ensure_fresh()
+    
+    def _get_deals(self, deal_ids: Iterable[str]) -> List[Dict[str, Any]]:
+        # Порядок как у get_all (по ID документа)
+        docs = (self.store.peek(deal_id) for deal_id in sorted(deal_ids))
+        return [doc for doc in docs if doc]
+    
+    def all_deals(self) -> List[Dict[str, Any]]:
+        """Все активные сделки"""
+        self.ensure_fresh()
+        with self.store.lock:
+            return self._get_deals(self._ids)
+    
+    def by_funnel(self, funnel_id: str) -> List[Dict[str, Any]]:
+        """Активные сделки воронки"""
+        self.ensure_fresh()
+        with self.store.lock:
+            return self._get_deals(self._by_funnel.get(funnel_id, ()))
+    
+    def by_stage(self, funnel_id: str, stage_id: str) -> List[Dict[str, Any]]:
+        """Активные сделки этапа воронки"""
+        self.ensure_fresh()
+        with self.store.lock:
+            return self._get_deals(self._by_stage.get((funnel_id, stage_id), ()))
+    
+    def by_assignee(self, user_id: str) -> List[Dict[str, Any]]:
+        """Активные сделки ответственного"""
+        self.ensure_fresh()
+        with self.store.lock:
+            return self._get_deals(self._by_assignee.get(str(user_id), ()))
+    
+    def by_client(self, client_id: str) -> List[Dict[str, Any]]:
+        """Активные сделки клиента"""
+        self.ensure_fresh()
+        with self.store.lock:
+            return self._get_deals(self._by_client.get(client_id, ()))
+    
+    def new_deals(self) -> List[Dict[str, Any]]:
+        """Активные сделки на этапе "НОВАЯ ЗАЯВКА" (перебираются только этапы, а не сделки)"""
+        self.ensure_fresh()
+        with self.store.lock:
+            deal_ids = set()
+            for (funnel_id, stage_id), ids in self._by_stage.items():
+                if is_new_deal_stage(stage_id):
+                    deal_ids.update(ids)
+            return self._get_deals(deal_ids)
+    
+    def stage_counts(self, funnel_id: str) -> Dict[str, int]:
+        """Количество активных сделок по этапам воронки"""
+        self.ensure_fresh()
+        with self.store.lock:
+            return {
+                stage_id: len(ids)
+                for (bucket_funnel_id, stage_id), ids in self._by_stage.items()
+                if bucket_funnel_id == funnel_id
+            }
+    
+    def assignee_counts(self) -> Dict[str, int]:
+        """Количество активных сделок по всем ответственным"""
+        self.ensure_fresh()
+        with self.store.lock:
+            return {user_id: len(ids) for user_id, ids in self._by_assignee.items()}
+
+_deal_index: Optional[DealIndex] = None
+
+def get_deal_index() -> DealIndex:
+    """Получить индекс сделок (создается при первом обращении)"""
+    global _deal_index
+    if _deal_index is None:
+        _deal_index = DealIndex(get_store('deals'))
+    return _deal_index
@@ -4,14 +4,18 @@
 from typing import List, Dict, Any, Optional
 from datetime import datetime
 from firebase_client import firebase
+from id_index import get_id_index
+from collection_store import apply_saved
+from deal_index import get_deal_index
+from funnel_registry import funnel_registry
+from search_index import get_deal_search, DEFAULT_SEARCH_LIMIT
 
 def get_all_deals(include_archived: bool = False) -> List[Dict[str, Any]]:
     """Получить все сделки"""
     try:
-        all_deals = firebase.get_all('deals')
         if include_archived:
-            return all_deals
-        return [d for d in all_deals if not d.get('isArchived', False)]
+            return firebase.get_all('deals')
+        return get_deal_index().all_deals()
     except Exception as e:
         print(f"Error getting all deals: {e}")
         return []
@@ -19,12 +23,39 @@ def get_all_deals(include_archived: bool = False) -> List[Dict[str, Any]]:
 def get_user_deals(user_id: str, include_archived: bool = False) -> List[Dict[str, Any]]:
     """Получить сделки пользователя"""
     try:
-        all_deals = get_all_deals(include_archived)
-        return [d for d in all_deals if d.get('assigneeId') == user_id]
+        if include_archived:
+            return [d for d in get_all_deals(True) if d.get('assigneeId') == user_id]
+        return get_deal_index().by_assignee(user_id)
     except Exception as e:
         print(f"Error getting user deals: {e}")
         return []
 
+def get_funnel_deals(funnel_id: str, stage_id: Optional[str] = None) -> List[Dict[str, Any]]:
+    """Получить активные сделки воронки (или одного ее этапа)"""
+    try:
+        if stage_id is None:
+            return get_deal_index().by_funnel(funnel_id)
+        return get_deal_index().by_stage(funnel_id, stage_id)
+    except Exception as e:
+        print(f"Error getting funnel deals: {e}")
+        return []
+
+def get_new_deals() -> List[Dict[str, Any]]:
+    """Получить активные сделки на этапе 'НОВАЯ ЗАЯВКА'"""
+    try:
+        return get_deal_index().new_deals()
+    except Exception as e:
+        print(f"Error getting new deals: {e}")
+        return []
+
+def get_funnel_deal_counts(funnel_id: str) -> Dict[str, int]:
+    """Количество активных сделок по этапам воронки"""
+    try:
+        return get_deal_index().stage_counts(funnel_id)
+    except Exception as e:
+        print(f"Error getting funnel deal counts: {e}")
+        return {}
+
 def get_deal_by_id(deal_id: str) -> Optional[Dict[str, Any]]:
     """Получить сделку по ID"""
     return firebase.get_by_id('deals', deal_id)
@@ -42,6 +73,8 @@ def create_deal(deal_data: Dict[str, Any]) -> Optional[str]:
             deal_data['id'] = f"deal-{int(datetime.now().timestamp() * 1000)}"
         
         firebase.save('deals', deal_data)
+        get_id_index('deals').add(deal_data['id'])
+        apply_saved('deals', deal_data)
         return deal_data['id']
     except Exception as e:
         print(f"Error creating deal: {e}")
@@ -60,6 +93,7 @@ def update_deal(deal_id: str, updates: Dict[str, Any]) -> bool:
         
         deal['updatedAt'] = datetime.now().isoformat()
         firebase.save('deals', deal)
+        apply_saved('deals', deal)
         return True
     except Exception as e:
         print(f"Error updating deal: {e}")
@@ -79,26 +113,16 @@ def delete_deal(deal_id: str) -> bool:
         deal['isArchived'] = True
         deal['updatedAt'] = datetime.now().isoformat()
         firebase.save('deals', deal)
+        apply_saved('deals', deal)
         return True
     except Exception as e:
         print(f"Error deleting deal: {e}")
         return False
 
-def search_deals(query: str) -> List[Dict[str, Any]]:
-    """Поиск сделок по запросу"""
+def search_deals(query: str, limit: int = DEFAULT_SEARCH_LIMIT) -> List[Dict[str, Any]]:
+    """Поиск активных сделок по названию и контакту (лучшие совпадения первыми)"""
     try:
-        all_deals = get_all_deals()
-        query_lower = query.lower()
-        
-        results = []
-        for deal in all_deals:
-            title = deal.get('title', '').lower()
-            contact_name = deal.get('contactName', '').lower()
-            
-            if query_lower in title or query_lower in contact_name:
-                results.append(deal)
-        
-        return results
+        return get_deal_search().search(query, limit)
     except Exception as e:
         print(f"Error searching deals: {e}")
         return []
@@ -106,7 +130,7 @@ def search_deals(query: str) -> List[Dict[str, Any]]:
 def get_sales_funnels() -> List[Dict[str, Any]]:
     """Получить все воронки продаж"""
     try:
-        return firebase.get_all('salesFunnels')
+        return funnel_registry.funnels()
     except Exception as e:
         print(f"Error getting sales funnels: {e}")
         return []
@@ -114,14 +138,35 @@ def get_sales_funnels() -> List[Dict[str, Any]]:
 def get_funnel_stages(funnel_id: str) -> List[Dict[str, Any]]:
     """Получить стадии воронки"""
     try:
-        funnel = firebase.get_by_id('salesFunnels', funnel_id)
-        if funnel:
-            return funnel.get('stages', [])
-        return []
+        return funnel_registry.get_stages(funnel_id)
     except Exception as e:
         print(f"Error getting funnel stages: {e}")
         return []
 
+def get_funnel(funnel_id: str) -> Optional[Dict[str, Any]]:
+    """Получить воронку по ID"""
+    try:
+        return funnel_registry.get_funnel(funnel_id)
+    except Exception as e:
+        print(f"Error getting funnel: {e}")
+        return None
+
+def get_funnel_stage(funnel_id: str, stage_id: str) -> Optional[Dict[str, Any]]:
+    """Получить стадию воронки по ID"""
+    try:
+        return funnel_registry.get_stage(funnel_id, stage_id)
+    except Exception as e:
+        print(f"Error getting funnel stage: {e}")
+        return None
+
+def get_funnel_stage_order(funnel_id: str, stage_id: str) -> Optional[int]:
+    """Получить позицию стадии в воронке (None, если стадии нет)"""
+    try:
+        return funnel_registry.get_stage_order(funnel_id, stage_id)
+    except Exception as e:
+        print(f"Error getting funnel stage order: {e}")
+        return None
+
 def get_won_deals_today() -> List[Dict[str, Any]]:
     """Получить сделки, перешедшие в стадию 'won' сегодня"""
     try:
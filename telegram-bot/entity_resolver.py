@@ -0,0 +1,83 @@
+"""
+Разрешение ссылок на сущности (пользователи, клиенты, проекты, воронки) для сообщений
+Словари ID -> сущность строятся один раз на версию данных кэша коллекций,
+поэтому форматирование не ищет каждую ссылку перебором списков
+"""
+import logging
+import threading
+from typing import Dict, Any, List, Optional, Tuple, Iterable
+from collection_store import get_store
+from funnel_registry import funnel_registry
+
+logger = logging.getLogger(__name__)
+
+RESOLVED_COLLECTIONS = ('users', 'clients', 'projects')
+
+class EntityResolver:
+    """Неизменяемый снимок словарей ID -> сущность"""
+    
+    def __init__(self, maps: Dict[str, Dict[str, Dict[str, Any]]], version: Tuple[int, ...] = ()):
+        self._maps = maps
+        # Версии коллекций, из которых построен снимок
+        self.version = version
+    
+    def _get(self, collection_name: str, entity_id: Any) -> Optional[Dict[str, Any]]:
+        if not entity_id:
+            return None
+        return self._maps.get(collection_name, {}).get(entity_id)
+    
+    def user(self, user_id: Any) -> Optional[Dict[str, Any]]:
+        return self._get('users', user_id)
+    
+    def client(self, client_id: Any) -> Optional[Dict[str, Any]]:
+        return self._get('clients', client_id)
+    
+    def project(self, project_id: Any) -> Optional[Dict[str, Any]]:
+        return self._get('projects', project_id)
+    
+    def users(self, user_ids: Iterable[Any]) -> List[Dict[str, Any]]:
+        """Пользователи по списку ID (ненайденные пропускаются, порядок сохраняется)"""
+        users_map = self._maps.get('users', {})
+        return [users_map[user_id] for user_id in user_ids or [] if user_id in users_map]
+    
+    def user_name(self, user_id: Any, default: str = 'Не назначено') -> str:
+        """Имя пользователя ('Неизвестно', если ID есть, но пользователь не найден)"""
+        if not user_id:
+            return default
+        user = self.user(user_id)
+        return user.get('name', 'Неизвестно') if user else 'Неизвестно'
+    
+    def funnel(self, funnel_id: Any) -> Optional[Dict[str, Any]]:
+        if not funnel_id:
+            return None
+        return funnel_registry.get_funnel(funnel_id)
+    
+    def stage(self, funnel_id: Any, stage_id: Any) -> Optional[Dict[str, Any]]:
+        if not funnel_id or not stage_id:
+            return None
+        return funnel_registry.get_stage(funnel_id, stage_id)
+
+_resolver: Optional[EntityResolver] = None
+_resolver_lock = threading.Lock()
+
+def get_resolver() -> EntityResolver:
+    """Резолвер по текущим данным (перестраивается только при изменении коллекций)"""
+    global _resolver
+    stores = [get_store(name) for name in RESOLVED_COLLECTIONS]
+    for store in stores + [funnel_registry.store]:
+        store.ensure_fresh()
+    # Воронки резолвер берет из справочника, но их версия тоже входит в версию данных
+    version = tuple(store.version for store in stores) + (funnel_registry.store.version,)
+    
+    with _resolver_lock:
+        if _resolver is None or _resolver.version != version:
+            maps = {}
+            versions = []
+            for name, store in zip(RESOLVED_COLLECTIONS, stores):
+                store_version, docs = store.snapshot()
+                maps[name] = docs
+                versions.append(store_version)
+            versions.append(funnel_registry.store.version)
+            _resolver = EntityResolver(maps, tuple(versions))
+            logger.debug(f"[RESOLVER] Rebuilt entity maps, version {_resolver.version}")
+        return _resolver
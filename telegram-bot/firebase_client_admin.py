@@ -4,7 +4,8 @@
 import os
 import firebase_admin
 from firebase_admin import credentials, firestore
-from typing import List, Dict, Any, Optional
+from google.api_core.exceptions import AlreadyExists
+from typing import List, Dict, Any, Optional, Callable, Tuple
 import config
 
 # Импорт Timestamp из google.cloud.firestore
@@ -94,6 +95,17 @@ class FirebaseClient:
             traceback.print_exc()
             return None
     
+    @staticmethod
+    def list_ids(collection_name: str) -> List[str]:
+        """Получить только ID документов коллекции (без загрузки данных)"""
+        try:
+            return [doc_ref.id for doc_ref in db.collection(collection_name).list_documents()]
+        except Exception as e:
+            print(f"Error listing ids from {collection_name}: {e}")
+            import traceback
+            traceback.print_exc()
+            return []
+    
     @staticmethod
     def save(collection_name: str, item: Dict[str, Any]) -> bool:
         """Сохранить документ (создать или обновить)"""
@@ -115,6 +127,21 @@ class FirebaseClient:
             traceback.print_exc()
             return False
     
+    @staticmethod
+    def create(collection_name: str, item: Dict[str, Any]) -> bool:
+        """Создать документ с заданным ID; False, если документ уже существует"""
+        try:
+            data = {k: v for k, v in item.items() if k != 'id'}
+            db.collection(collection_name).document(item['id']).create(data)
+            return True
+        except AlreadyExists:
+            return False
+        except Exception as e:
+            print(f"Error creating in {collection_name}: {e}")
+            import traceback
+            traceback.print_exc()
+            return False
+    
     @staticmethod
     def delete(collection_name: str, doc_id: str) -> bool:
         """Удалить документ"""
@@ -149,6 +176,128 @@ class FirebaseClient:
             import traceback
             traceback.print_exc()
             return []
+    
+    @staticmethod
+    def query_page(
+        collection_name: str,
+        filters: List[tuple],
+        order_by: str,
+        limit: int,
+        start_after: Optional[Tuple[Any, str]] = None
+    ) -> List[Dict[str, Any]]:
+        """
+        Выполнить запрос с фильтрами, сортировкой и лимитом на стороне Firestore
+        
+        Документы сортируются по полю order_by, затем по ID документа.
+        
+        Args:
+            collection_name: Название коллекции
+            filters: Фильтры (поле, оператор, значение)
+            order_by: Поле сортировки (по возрастанию)
+            limit: Максимальное количество документов
+            start_after: Курсор - (значение order_by, ID) последнего документа предыдущей страницы
+        """
+        try:
+            collection_ref = db.collection(collection_name)
+            query = collection_ref
+            for field, operator, value in filters:
+                query = query.where(field, operator, value)
+            query = query.order_by(order_by).order_by(firestore.FieldPath.document_id())
+            if start_after:
+                value, doc_id = start_after
+                query = query.start_after([value, collection_ref.document(doc_id)])
+            
+            items = []
+            for doc in query.limit(limit).stream():
+                item = doc.to_dict()
+                item = prepare_data_from_firestore(item)
+                item['id'] = doc.id
+                items.append(item)
+            return items
+        except Exception as e:
+            print(f"Error querying page of {collection_name}: {e}")
+            import traceback
+            traceback.print_exc()
+            return []
+    
+    @staticmethod
+    def update_in_transaction(
+        collection_name: str,
+        doc_ids: List[str],
+        update_fn: Callable[[Dict[str, Any]], Optional[Dict[str, Any]]]
+    ) -> List[Dict[str, Any]]:
+        """
+        Прочитать документы и обновить их в одной транзакции
+        
+        Если документы параллельно изменил другой процесс, транзакция повторяется
+        и update_fn вызывается заново для свежих данных.
+        
+        Args:
+            collection_name: Название коллекции
+            doc_ids: ID документов
+            update_fn: Получает документ, возвращает изменяемые поля (None - не менять документ)
+        
+        Returns:
+            Измененные документы (с новыми значениями полей)
+        """
+        try:
+            refs = [db.collection(collection_name).document(doc_id) for doc_id in doc_ids]
+            
+            @firestore.transactional
+            def run(transaction):
+                updated = []
+                for doc in transaction.get_all(refs):
+                    if not doc.exists:
+                        continue
+                    item = prepare_data_from_firestore(doc.to_dict())
+                    item['id'] = doc.id
+                    changes = update_fn(item)
+                    if changes:
+                        transaction.update(doc.reference, changes)
+                        item.update(changes)
+                        updated.append(item)
+                return updated
+            
+            return run(db.transaction())
+        except Exception as e:
+            print(f"Error updating {collection_name} in transaction: {e}")
+            import traceback
+            traceback.print_exc()
+            return []
+    
+    @staticmethod
+    def watch(collection_name: str, on_change: Callable[[List[tuple]], None]) -> Optional[Any]:
+        """
+        Подписаться на изменения коллекции (Firestore on_snapshot)
+        
+        Args:
+            collection_name: Название коллекции
+            on_change: Callback, получает список (тип изменения, документ),
+                       тип: 'added', 'modified' или 'removed'
+        
+        Returns:
+            Объект подписки (для unsubscribe) или None если подписка не удалась
+        """
+        def on_snapshot(docs, changes, read_time):
+            events = []
+            for change in changes:
+                item = prepare_data_from_firestore(change.document.to_dict() or {})
+                item['id'] = change.document.id
+                events.append((change.type.name.lower(), item))
+            try:
+                on_change(events)
+            except Exception as e:
+                print(f"Error handling changes of {collection_name}: {e}")
+                import traceback
+                traceback.print_exc()
+        
+        try:
+            return db.collection(collection_name).on_snapshot(on_snapshot)
+        except Exception as e:
+            print(f"Error watching {collection_name}: {e}")
+            import traceback
+            traceback.print_exc()
+            return None
 
 # Создаем экземпляр клиента
 firebase = FirebaseClient()
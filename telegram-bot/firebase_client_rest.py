@@ -2,13 +2,29 @@
 Клиент для работы с Firebase Firestore через REST API (без credentials)
 """
 import requests
-from typing import List, Dict, Any, Optional
+from datetime import datetime, timezone
+from typing import List, Dict, Any, Optional, Callable, Tuple
 import config
 
 # Firebase REST API конфигурация
 FIREBASE_API_KEY = config.FIREBASE_API_KEY
 FIREBASE_PROJECT_ID = config.FIREBASE_PROJECT_ID or "tipa-task-manager"
-FIREBASE_DATABASE_URL = f"https://firestore.googleapis.com/v1/projects/{FIREBASE_PROJECT_ID}/databases/(default)/documents"
+FIREBASE_DOCUMENTS_PATH = f"projects/{FIREBASE_PROJECT_ID}/databases/(default)/documents"
+FIREBASE_DATABASE_URL = f"https://firestore.googleapis.com/v1/{FIREBASE_DOCUMENTS_PATH}"
+
+# Операторы фильтров (как в Admin SDK) -> операторы structuredQuery
+QUERY_OPERATORS = {
+    '==': 'EQUAL',
+    '!=': 'NOT_EQUAL',
+    '<': 'LESS_THAN',
+    '<=': 'LESS_THAN_OR_EQUAL',
+    '>': 'GREATER_THAN',
+    '>=': 'GREATER_THAN_OR_EQUAL',
+    'in': 'IN',
+    'not-in': 'NOT_IN',
+    'array_contains': 'ARRAY_CONTAINS',
+    'array_contains_any': 'ARRAY_CONTAINS_ANY',
+}
 
 if not FIREBASE_API_KEY:
     print("[Firebase REST] WARNING: FIREBASE_API_KEY not set in .env file!")
@@ -40,6 +56,9 @@ def _convert_to_firestore_value(value: Any) -> Dict[str, Any]:
     """Конвертировать значение в формат Firestore REST API"""
     if value is None:
         return {'nullValue': None}
+    elif isinstance(value, datetime):
+        # Как Timestamp веб-приложения (время без часового пояса - локальное)
+        return {'timestampValue': value.astimezone(timezone.utc).strftime('%Y-%m-%dT%H:%M:%S.%fZ')}
     elif isinstance(value, bool):
         return {'booleanValue': value}
     elif isinstance(value, int):
@@ -55,6 +74,16 @@ def _convert_to_firestore_value(value: Any) -> Dict[str, Any]:
     else:
         return {'stringValue': str(value)}
 
+# Сколько раз повторять транзакцию, если документы изменились параллельно
+TRANSACTION_ATTEMPTS = 5
+
+def _document_to_item(doc: Dict[str, Any]) -> Dict[str, Any]:
+    """Документ Firestore REST API -> словарь с полями и id"""
+    doc_path = doc.get('name', '')
+    item = {k: _convert_firestore_value(v) for k, v in doc.get('fields', {}).items()}
+    item['id'] = doc_path.split('/')[-1] if '/' in doc_path else doc_path
+    return item
+
 class FirebaseClient:
     """Клиент для работы с Firebase Firestore через REST API"""
     
@@ -122,6 +151,36 @@ class FirebaseClient:
             traceback.print_exc()
             return None
     
+    @staticmethod
+    def list_ids(collection_name: str) -> List[str]:
+        """Получить только ID документов коллекции (без загрузки данных)"""
+        try:
+            url = f"{FIREBASE_DATABASE_URL}/{collection_name}"
+            # Маска по __name__ - Firestore возвращает документы без полей
+            params = {'key': FIREBASE_API_KEY, 'mask.fieldPaths': '__name__', 'pageSize': 1000}
+            ids = []
+            
+            while True:
+                response = requests.get(url, params=params, timeout=10)
+                if response.status_code != 200:
+                    print(f"Error listing ids from {collection_name}: HTTP {response.status_code}, Response: {response.text[:200]}")
+                    return ids
+                
+                data = response.json()
+                for doc in data.get('documents', []):
+                    doc_path = doc.get('name', '')
+                    ids.append(doc_path.split('/')[-1] if '/' in doc_path else doc_path)
+                
+                page_token = data.get('nextPageToken')
+                if not page_token:
+                    return ids
+                params['pageToken'] = page_token
+        except Exception as e:
+            print(f"Error listing ids from {collection_name}: {e}")
+            import traceback
+            traceback.print_exc()
+            return []
+    
     @staticmethod
     def save(collection_name: str, item: Dict[str, Any]) -> bool:
         """Сохранить документ (создать или обновить)"""
@@ -159,6 +218,31 @@ class FirebaseClient:
             traceback.print_exc()
             return False
     
+    @staticmethod
+    def create(collection_name: str, item: Dict[str, Any]) -> bool:
+        """Создать документ с заданным ID; False, если документ уже существует"""
+        try:
+            data = {k: v for k, v in item.items() if k != 'id'}
+            fields = {k: _convert_to_firestore_value(v) for k, v in data.items()}
+            
+            url = f"{FIREBASE_DATABASE_URL}/{collection_name}"
+            params = {'key': FIREBASE_API_KEY, 'documentId': item['id']}
+            response = requests.post(url, json={'fields': fields}, params=params, timeout=10)
+            
+            if response.status_code == 409:
+                # ALREADY_EXISTS
+                return False
+            if response.status_code not in [200, 201]:
+                print(f"Error creating in {collection_name}: HTTP {response.status_code}, Response: {response.text[:200]}")
+                return False
+            
+            return True
+        except Exception as e:
+            print(f"Error creating in {collection_name}: {e}")
+            import traceback
+            traceback.print_exc()
+            return False
+    
     @staticmethod
     def delete(collection_name: str, doc_id: str) -> bool:
         """Удалить документ"""
@@ -190,6 +274,166 @@ class FirebaseClient:
             import traceback
             traceback.print_exc()
             return []
+    
+    @staticmethod
+    def query_page(
+        collection_name: str,
+        filters: List[tuple],
+        order_by: str,
+        limit: int,
+        start_after: Optional[Tuple[Any, str]] = None
+    ) -> List[Dict[str, Any]]:
+        """
+        Выполнить запрос с фильтрами, сортировкой и лимитом на стороне Firestore (runQuery)
+        
+        Документы сортируются по полю order_by, затем по ID документа.
+        
+        Args:
+            collection_name: Название коллекции
+            filters: Фильтры (поле, оператор, значение)
+            order_by: Поле сортировки (по возрастанию)
+            limit: Максимальное количество документов
+            start_after: Курсор - (значение order_by, ID) последнего документа предыдущей страницы
+        """
+        try:
+            field_filters = [
+                {'fieldFilter': {
+                    'field': {'fieldPath': field},
+                    'op': QUERY_OPERATORS[operator],
+                    'value': _convert_to_firestore_value(value)
+                }}
+                for field, operator, value in filters
+            ]
+            structured_query = {
+                'from': [{'collectionId': collection_name}],
+                'orderBy': [
+                    {'field': {'fieldPath': order_by}, 'direction': 'ASCENDING'},
+                    {'field': {'fieldPath': '__name__'}, 'direction': 'ASCENDING'},
+                ],
+                'limit': limit,
+            }
+            if len(field_filters) == 1:
+                structured_query['where'] = field_filters[0]
+            elif field_filters:
+                structured_query['where'] = {'compositeFilter': {'op': 'AND', 'filters': field_filters}}
+            if start_after:
+                value, doc_id = start_after
+                structured_query['startAt'] = {
+                    'values': [
+                        _convert_to_firestore_value(value),
+                        {'referenceValue': f"{FIREBASE_DOCUMENTS_PATH}/{collection_name}/{doc_id}"},
+                    ],
+                    'before': False
+                }
+            
+            url = f"{FIREBASE_DATABASE_URL}:runQuery"
+            params = {'key': FIREBASE_API_KEY}
+            response = requests.post(url, json={'structuredQuery': structured_query}, params=params, timeout=10)
+            
+            if response.status_code != 200:
+                print(f"Error querying page of {collection_name}: HTTP {response.status_code}, Response: {response.text[:200]}")
+                return []
+            
+            items = []
+            # Ответ - список результатов; результат без 'document' означает пустую выборку
+            for result in response.json():
+                doc = result.get('document')
+                if doc:
+                    items.append(_document_to_item(doc))
+            return items
+        except Exception as e:
+            print(f"Error querying page of {collection_name}: {e}")
+            import traceback
+            traceback.print_exc()
+            return []
+    
+    @staticmethod
+    def update_in_transaction(
+        collection_name: str,
+        doc_ids: List[str],
+        update_fn: Callable[[Dict[str, Any]], Optional[Dict[str, Any]]]
+    ) -> List[Dict[str, Any]]:
+        """
+        Прочитать документы и обновить их в одной транзакции (beginTransaction, batchGet, commit)
+        
+        Если документы параллельно изменил другой процесс, commit отклоняется (ABORTED),
+        транзакция повторяется и update_fn вызывается заново для свежих данных.
+        
+        Args:
+            collection_name: Название коллекции
+            doc_ids: ID документов
+            update_fn: Получает документ, возвращает изменяемые поля (None - не менять документ)
+        
+        Returns:
+            Измененные документы (с новыми значениями полей)
+        """
+        try:
+            params = {'key': FIREBASE_API_KEY}
+            names = [f"{FIREBASE_DOCUMENTS_PATH}/{collection_name}/{doc_id}" for doc_id in doc_ids]
+            
+            for attempt in range(TRANSACTION_ATTEMPTS):
+                response = requests.post(f"{FIREBASE_DATABASE_URL}:beginTransaction", json={}, params=params, timeout=10)
+                if response.status_code != 200:
+                    print(f"Error starting transaction on {collection_name}: HTTP {response.status_code}, Response: {response.text[:200]}")
+                    return []
+                transaction = response.json()['transaction']
+                
+                response = requests.post(
+                    f"{FIREBASE_DATABASE_URL}:batchGet",
+                    json={'documents': names, 'transaction': transaction},
+                    params=params,
+                    timeout=10
+                )
+                if response.status_code != 200:
+                    print(f"Error reading {collection_name} in transaction: HTTP {response.status_code}, Response: {response.text[:200]}")
+                    requests.post(f"{FIREBASE_DATABASE_URL}:rollback", json={'transaction': transaction}, params=params, timeout=10)
+                    return []
+                
+                updated = []
+                writes = []
+                for result in response.json():
+                    doc = result.get('found')
+                    if not doc:
+                        continue
+                    item = _document_to_item(doc)
+                    changes = update_fn(item)
+                    if changes:
+                        writes.append({
+                            'update': {
+                                'name': doc['name'],
+                                'fields': {k: _convert_to_firestore_value(v) for k, v in changes.items()}
+                            },
+                            'updateMask': {'fieldPaths': list(changes)},
+                            'currentDocument': {'exists': True}
+                        })
+                        item.update(changes)
+                        updated.append(item)
+                
+                response = requests.post(
+                    f"{FIREBASE_DATABASE_URL}:commit",
+                    json={'writes': writes, 'transaction': transaction},
+                    params=params,
+                    timeout=10
+                )
+                if response.status_code == 200:
+                    return updated
+                if response.status_code != 409:
+                    print(f"Error committing transaction on {collection_name}: HTTP {response.status_code}, Response: {response.text[:200]}")
+                    return []
+                # 409 ABORTED - документы изменились параллельно, повторяем
+            
+            print(f"Error updating {collection_name} in transaction: aborted {TRANSACTION_ATTEMPTS} times")
+            return []
+        except Exception as e:
+            print(f"Error updating {collection_name} in transaction: {e}")
+            import traceback
+            traceback.print_exc()
+            return []
+    
+    @staticmethod
+    def watch(collection_name: str, on_change: Callable[[List[tuple]], None]) -> Optional[Any]:
+        """Подписка на изменения (REST API не поддерживает, используется периодическая перезагрузка)"""
+        return None
 
 # Создаем экземпляр клиента
 firebase = FirebaseClient()
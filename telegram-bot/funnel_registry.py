@@ -0,0 +1,69 @@
+"""
+Справочник воронок продаж
+Воронки загружаются один раз через кэш коллекции salesFunnels и обновляются
+по его изменениям; поиск воронки, стадии и порядка стадии - по словарям
+"""
+import logging
+from typing import Dict, Any, List, Optional, Tuple
+from collection_store import CollectionStore, get_store
+
+logger = logging.getLogger(__name__)
+
+class FunnelRegistry:
+    """Воронки и их стадии"""
+    
+    def __init__(self, store: CollectionStore):
+        self.store = store
+        self._funnels: Dict[str, Dict[str, Any]] = {}
+        # (ID воронки, ID стадии) -> стадия / позиция стадии в воронке
+        self._stages: Dict[Tuple[str, str], Dict[str, Any]] = {}
+        self._stage_order: Dict[Tuple[str, str], int] = {}
+        store.subscribe(self._on_change, replay=True)
+    
+    def _on_change(self, old: Optional[Dict[str, Any]], new: Optional[Dict[str, Any]]) -> None:
+        if old:
+            funnel_id = old.get('id')
+            self._funnels.pop(funnel_id, None)
+            for stage in old.get('stages', []) or []:
+                key = (funnel_id, stage.get('id'))
+                self._stages.pop(key, None)
+                self._stage_order.pop(key, None)
+        if new:
+            funnel_id = new.get('id')
+            self._funnels[funnel_id] = new
+            for position, stage in enumerate(new.get('stages', []) or []):
+                key = (funnel_id, stage.get('id'))
+                self._stages[key] = stage
+                self._stage_order[key] = position
+    
+    def funnels(self) -> List[Dict[str, Any]]:
+        """Все воронки (в порядке ID, как get_all)"""
+        self.store.ensure_fresh()
+        with self.store.lock:
+            return [self._funnels[funnel_id] for funnel_id in sorted(self._funnels)]
+    
+    def get_funnel(self, funnel_id: str) -> Optional[Dict[str, Any]]:
+        self.store.ensure_fresh()
+        with self.store.lock:
+            return self._funnels.get(funnel_id)
+    
+    def get_stages(self, funnel_id: str) -> List[Dict[str, Any]]:
+        """Стадии воронки"""
+        funnel = self.get_funnel(funnel_id)
+        if not funnel:
+            return []
+        return funnel.get('stages', []) or []
+    
+    def get_stage(self, funnel_id: str, stage_id: str) -> Optional[Dict[str, Any]]:
+        self.store.ensure_fresh()
+        with self.store.lock:
+            return self._stages.get((funnel_id, stage_id))
+    
+    def get_stage_order(self, funnel_id: str, stage_id: str) -> Optional[int]:
+        """Позиция стадии в воронке (None, если стадии нет)"""
+        self.store.ensure_fresh()
+        with self.store.lock:
+            return self._stage_order.get((funnel_id, stage_id))
+
+# Создаем экземпляр справочника
+funnel_registry = FunnelRegistry(get_store('salesFunnels'))
@@ -0,0 +1,130 @@
+"""
+Индекс коротких ID документов
+Пользователь видит в сообщениях последние символы ID (#12345678, см. utils.short_id),
+индекс позволяет найти полный ID по концу или началу через bisect без загрузки всей
+коллекции: для поиска по концу хранится отсортированный список перевернутых ID
+"""
+import bisect
+import logging
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+from firebase_client import firebase
+
+logger = logging.getLogger(__name__)
+
+# Как часто перечитывать список ID из Firebase (документы могут создаваться в веб-приложении)
+ID_INDEX_TTL_SECONDS = 300
+# Минимальная длина значимой части ID (без префикса типа 'task-'): ID вида task-<мс>
+# с коротким началом совпадают почти у всех документов
+SHORT_ID_MIN_LENGTH = 6
+
+class IdPrefixIndex:
+    """Отсортированный список ID документов одной коллекции"""
+    
+    def __init__(self, collection_name: str, ttl_seconds: int = ID_INDEX_TTL_SECONDS):
+        self.collection_name = collection_name
+        self.ttl_seconds = ttl_seconds
+        self._ids: List[str] = []
+        self._reversed: List[str] = []
+        self._loaded_at: Optional[float] = None
+        self._lock = threading.Lock()
+    
+    def refresh(self) -> None:
+        """Перечитать список ID (загружаются только ID, без данных документов)"""
+        ids = sorted(set(firebase.list_ids(self.collection_name)))
+        with self._lock:
+            self._ids = ids
+            self._reversed = sorted(doc_id[::-1] for doc_id in ids)
+            self._loaded_at = time.monotonic()
+        logger.info(f"[ID_INDEX] Loaded {len(ids)} ids for {self.collection_name}")
+    
+    def _ensure_fresh(self) -> None:
+        if self._loaded_at is None or time.monotonic() - self._loaded_at > self.ttl_seconds:
+            self.refresh()
+    
+    def add(self, doc_id: str) -> None:
+        """Добавить ID (вызывается при создании документа ботом)"""
+        if not doc_id:
+            return
+        with self._lock:
+            for keys, key in ((self._ids, doc_id), (self._reversed, doc_id[::-1])):
+                pos = bisect.bisect_left(keys, key)
+                if pos == len(keys) or keys[pos] != key:
+                    keys.insert(pos, key)
+    
+    def remove(self, doc_id: str) -> None:
+        """Удалить ID из индекса"""
+        with self._lock:
+            for keys, key in ((self._ids, doc_id), (self._reversed, doc_id[::-1])):
+                pos = bisect.bisect_left(keys, key)
+                if pos < len(keys) and keys[pos] == key:
+                    del keys[pos]
+    
+    def find(self, prefix: str, limit: int = 10) -> List[str]:
+        """Найти ID, начинающиеся с префикса (не более limit + 1, чтобы понять, что есть еще)"""
+        if not prefix:
+            return []
+        self._ensure_fresh()
+        with self._lock:
+            return _scan(self._ids, prefix, limit)
+    
+    def find_suffix(self, suffix: str, limit: int = 10) -> List[str]:
+        """Найти ID, заканчивающиеся на suffix (короткий ID из сообщений)"""
+        if not suffix:
+            return []
+        self._ensure_fresh()
+        with self._lock:
+            return [key[::-1] for key in _scan(self._reversed, suffix[::-1], limit)]
+
+def _scan(keys: List[str], prefix: str, limit: int) -> List[str]:
+    """Ключи отсортированного списка, начинающиеся с prefix (не более limit + 1)"""
+    start = bisect.bisect_left(keys, prefix)
+    matches = []
+    for key in keys[start:start + limit + 1]:
+        if not key.startswith(prefix):
+            break
+        matches.append(key)
+    return matches
+
+_indexes: Dict[str, IdPrefixIndex] = {}
+
+def get_id_index(collection_name: str) -> IdPrefixIndex:
+    """Получить индекс ID для коллекции (создается при первом обращении)"""
+    index = _indexes.get(collection_name)
+    if index is None:
+        index = IdPrefixIndex(collection_name)
+        _indexes[collection_name] = index
+    return index
+
+def resolve_short_id(collection_name: str, query: str, limit: int = 10) -> Tuple[Optional[str], List[str]]:
+    """
+    Найти полный ID документа по короткому ID
+    
+    Args:
+        collection_name: Название коллекции
+        query: Введенный пользователем ID, его конец (как в сообщениях) или начало
+            (допускается '#' в начале)
+        limit: Максимальное количество кандидатов для неоднозначного префикса
+    
+    Returns:
+        (полный ID или None, список кандидатов если префикс неоднозначен)
+    """
+    prefix = query.strip().lstrip('#')
+    if not prefix or ' ' in prefix:
+        return None, []
+    
+    index = get_id_index(collection_name)
+    matches = []
+    if len(prefix) >= SHORT_ID_MIN_LENGTH:
+        matches = index.find_suffix(prefix, limit)
+    # Начало ID ищем, только если после префикса типа ('task-') введено достаточно символов
+    if len(prefix.split('-', 1)[-1]) >= SHORT_ID_MIN_LENGTH:
+        matches += [doc_id for doc_id in index.find(prefix, limit) if doc_id not in matches]
+    
+    if len(matches) == 1:
+        return matches[0], []
+    if prefix in matches:
+        # Точное совпадение важнее более длинных ID с тем же началом
+        return prefix, []
+    return None, matches
@@ -0,0 +1,143 @@
+"""
+Запуск периодических задач бота
+Задача с одним именем выполняется не больше чем в одном экземпляре: запуск, который
+пришелся на еще идущий предыдущий, пропускается (и учитывается). По каждой задаче
+собирается статистика: опоздание запуска относительно расписания, длительность,
+пропущенные планировщиком запуски (misfire) и ошибки
+"""
+import functools
+import logging
+import time
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Dict, Any, Callable, Set
+from apscheduler.events import (
+    EVENT_JOB_ADDED, EVENT_JOB_SUBMITTED, EVENT_JOB_MISSED, EVENT_JOB_MAX_INSTANCES,
+    EVENT_JOB_EXECUTED, EVENT_JOB_ERROR
+)
+import config
+
+logger = logging.getLogger(__name__)
+
+@dataclass
+class JobStats:
+    """Статистика одной задачи"""
+    runs: int = 0
+    skipped: int = 0
+    misfires: int = 0
+    failures: int = 0
+    last_lag: float = 0.0
+    max_lag: float = 0.0
+    last_duration: float = 0.0
+    max_duration: float = 0.0
+    total_duration: float = 0.0
+    
+    @property
+    def avg_duration(self) -> float:
+        return self.total_duration / self.runs if self.runs else 0.0
+    
+    def summary(self) -> str:
+        return (
+            f"runs={self.runs} skipped={self.skipped} misfires={self.misfires} failures={self.failures} "
+            f"lag={self.last_lag:.2f}s (max {self.max_lag:.2f}s) "
+            f"duration={self.last_duration:.2f}s (avg {self.avg_duration:.2f}s, max {self.max_duration:.2f}s)"
+        )
+
+class JobRunner:
+    """Единственный экземпляр задачи и статистика запусков"""
+    
+    def __init__(self, lag_warning: float = config.JOB_LAG_WARNING_SECONDS):
+        self.lag_warning = lag_warning
+        self._stats: Dict[str, JobStats] = {}
+        self._running: Set[str] = set()
+        # ID задачи APScheduler -> имя: разовая задача удаляется из планировщика раньше,
+        # чем приходят события о ее запуске
+        self._names: Dict[str, str] = {}
+    
+    def stats(self, name: str) -> JobStats:
+        if name not in self._stats:
+            self._stats[name] = JobStats()
+        return self._stats[name]
+    
+    def is_running(self, name: str) -> bool:
+        return name in self._running
+    
+    def guard(self, name: str) -> Callable:
+        """
+        Декоратор корутины задачи: пропускать запуск, пока идет предыдущий, и считать статистику
+        
+        Args:
+            name: Имя задачи (для задач планировщика - то же, что в attach)
+        """
+        def decorator(func: Callable) -> Callable:
+            @functools.wraps(func)
+            async def wrapper(*args: Any, **kwargs: Any) -> Any:
+                stats = self.stats(name)
+                if name in self._running:
+                    stats.skipped += 1
+                    logger.warning(f"[JOBS] {name} is still running, skipping overlapping run ({stats.skipped} skipped)")
+                    return None
+                self._running.add(name)
+                started = time.monotonic()
+                try:
+                    return await func(*args, **kwargs)
+                except Exception:
+                    stats.failures += 1
+                    raise
+                finally:
+                    self._running.discard(name)
+                    duration = time.monotonic() - started
+                    stats.runs += 1
+                    stats.last_duration = duration
+                    stats.max_duration = max(stats.max_duration, duration)
+                    stats.total_duration += duration
+            return wrapper
+        return decorator
+    
+    def attach(self, scheduler, key: Callable[[Any], str] = lambda job: job.name) -> None:
+        """
+        Получать от планировщика APScheduler опоздания и пропуски запусков
+        
+        Args:
+            scheduler: Планировщик (TaskScheduler или планировщик JobQueue)
+            key: Имя задачи по задаче APScheduler (должно совпадать с именем в guard)
+        """
+        def listener(event) -> None:
+            if event.code == EVENT_JOB_ADDED:
+                job = scheduler.get_job(event.job_id)
+                if job is not None:
+                    self._names[event.job_id] = key(job)
+                return
+            name = self._names.get(event.job_id)
+            if name is None:
+                return
+            if event.code in (EVENT_JOB_EXECUTED, EVENT_JOB_ERROR, EVENT_JOB_MISSED) and scheduler.get_job(event.job_id) is None:
+                # Последний запуск разовой задачи
+                del self._names[event.job_id]
+            stats = self.stats(name)
+            if event.code == EVENT_JOB_SUBMITTED:
+                scheduled = event.scheduled_run_times[-1]
+                lag = max(0.0, (datetime.now(scheduled.tzinfo) - scheduled).total_seconds())
+                stats.last_lag = lag
+                stats.max_lag = max(stats.max_lag, lag)
+                if lag > self.lag_warning:
+                    logger.warning(f"[JOBS] {name} started {lag:.1f}s late")
+            elif event.code == EVENT_JOB_MISSED:
+                stats.misfires += 1
+                logger.warning(f"[JOBS] {name} missed its run at {event.scheduled_run_time}")
+            elif event.code == EVENT_JOB_MAX_INSTANCES:
+                stats.skipped += 1
+                logger.warning(f"[JOBS] {name} is still running, scheduler skipped a run")
+        
+        scheduler.add_listener(
+            listener,
+            EVENT_JOB_ADDED | EVENT_JOB_SUBMITTED | EVENT_JOB_MISSED | EVENT_JOB_MAX_INSTANCES | EVENT_JOB_EXECUTED | EVENT_JOB_ERROR
+        )
+    
+    def log_summary(self) -> None:
+        """Записать в лог статистику всех задач"""
+        for name in sorted(self._stats):
+            logger.info(f"[JOBS] {name}: {self._stats[name].summary()}")
+
+# Создаем экземпляр запуска задач
+job_runner = JobRunner()
@@ -1,12 +1,31 @@
 """
 Клавиатуры (меню и кнопки) для Telegram бота
 """
+from typing import Optional, TYPE_CHECKING
 from telegram import InlineKeyboardButton, InlineKeyboardMarkup, WebAppInfo
 
-def get_main_menu() -> InlineKeyboardMarkup:
-    """Главное меню бота"""
+if TYPE_CHECKING:
+    from counters import UserCounters
+
+def format_tasks_badge(counters: Optional['UserCounters'], with_today: bool = False) -> str:
+    """Бейдж со счетчиками задач: ' (12 · ⚠️3)'"""
+    if not counters or not counters.active_tasks:
+        return ""
+    parts = [str(counters.active_tasks)]
+    if with_today and counters.today_tasks:
+        parts.append(f"📅{counters.today_tasks}")
+    if counters.overdue_tasks:
+        parts.append(f"⚠️{counters.overdue_tasks}")
+    return f" ({' · '.join(parts)})"
+
+def format_count_badge(count: int) -> str:
+    """Бейдж с количеством: ' (5)'"""
+    return f" ({count})" if count else ""
+
+def get_main_menu(counters: Optional['UserCounters'] = None) -> InlineKeyboardMarkup:
+    """Главное меню бота (со счетчиками пользователя, если переданы)"""
     keyboard = [
-        [InlineKeyboardButton("📋 Мои задачи", callback_data="menu_tasks")],
+        [InlineKeyboardButton(f"📋 Мои задачи{format_tasks_badge(counters)}", callback_data="menu_tasks")],
         [InlineKeyboardButton("🎯 Все сделки", callback_data="menu_deals")],
         [InlineKeyboardButton("⚙️ Настройки", callback_data="menu_settings")],
         [InlineKeyboardButton("👤 Профиль", callback_data="menu_profile")],
@@ -15,17 +34,17 @@ def get_main_menu() -> InlineKeyboardMarkup:
     ]
     return InlineKeyboardMarkup(keyboard)
 
-def get_tasks_menu() -> InlineKeyboardMarkup:
-    """Меню задач"""
+def get_tasks_menu(counters: Optional['UserCounters'] = None) -> InlineKeyboardMarkup:
+    """Меню задач (со счетчиками пользователя, если переданы)"""
     keyboard = [
-        [InlineKeyboardButton("📊 Все задачи", callback_data="tasks_all")],
+        [InlineKeyboardButton(f"📊 Все задачи{format_tasks_badge(counters, with_today=True)}", callback_data="tasks_all")],
         [InlineKeyboardButton("➕ Создать задачу", callback_data="task_create")],
         [InlineKeyboardButton("🔙 Назад", callback_data="menu_main")]
     ]
     return InlineKeyboardMarkup(keyboard)
 
-def get_tasks_list_keyboard(tasks: list, filter_type: str = 'all', page: int = 0, page_size: int = 10) -> InlineKeyboardMarkup:
-    """Клавиатура для списка задач с фильтрами и навигацией"""
+def get_tasks_list_keyboard(page_tasks: list, filter_type: str = 'all', page: int = 0, has_next: bool = False) -> InlineKeyboardMarkup:
+    """Клавиатура для страницы списка задач с фильтрами и навигацией"""
     keyboard = []
     
     # Фильтры
@@ -47,11 +66,7 @@ def get_tasks_list_keyboard(tasks: list, filter_type: str = 'all', page: int = 0
     
     keyboard.append(filter_row)
     
-    # Список задач (пагинация)
-    start_idx = page * page_size
-    end_idx = start_idx + page_size
-    page_tasks = tasks[start_idx:end_idx]
-    
+    # Задачи текущей страницы
     for task in page_tasks:
         task_id = task.get('id', '')
         task_title = task.get('title', 'Без названия')[:40]
@@ -72,7 +87,7 @@ def get_tasks_list_keyboard(tasks: list, filter_type: str = 'all', page: int = 0
     nav_row = []
     if page > 0:
         nav_row.append(InlineKeyboardButton("◀️ Назад", callback_data=f"tasks_page_{filter_type}_{page-1}"))
-    if end_idx < len(tasks):
+    if has_next:
         nav_row.append(InlineKeyboardButton("Вперед ▶️", callback_data=f"tasks_page_{filter_type}_{page+1}"))
     
     if nav_row:
@@ -84,12 +99,12 @@ def get_tasks_list_keyboard(tasks: list, filter_type: str = 'all', page: int = 0
     
     return InlineKeyboardMarkup(keyboard)
 
-def get_deals_menu() -> InlineKeyboardMarkup:
-    """Меню сделок"""
+def get_deals_menu(counters: Optional['UserCounters'] = None) -> InlineKeyboardMarkup:
+    """Меню сделок (со счетчиками пользователя, если переданы)"""
     keyboard = [
         [InlineKeyboardButton("🎯 Все сделки", callback_data="deals_all")],
         [InlineKeyboardButton("🆕 Новые заявки", callback_data="deals_new")],
-        [InlineKeyboardButton("👤 Мои заявки", callback_data="deals_mine")],
+        [InlineKeyboardButton(f"👤 Мои заявки{format_count_badge(counters.deals if counters else 0)}", callback_data="deals_mine")],
         [InlineKeyboardButton("➕ Создать заявку", callback_data="deal_create")],
         [InlineKeyboardButton("🔍 Поиск", callback_data="deal_search")],
         [InlineKeyboardButton("🔙 Назад", callback_data="menu_main")]
@@ -0,0 +1,178 @@
+"""
+Напоминания о встречах
+Каждая встреча превращается в разовые задачи планировщика APScheduler: по одной на
+участника и время напоминания (за сколько минут до встречи, настраивается у пользователя).
+Задачи перепланируются по изменениям кэша коллекции meetings (перенос, смена участников,
+архивирование) и пользователей (время напоминания); коллекцию встреч никто не сканирует
+"""
+import logging
+import threading
+from datetime import datetime, timedelta
+from typing import Dict, Any, Optional, Set, Tuple
+import pytz
+from apscheduler.jobstores.base import JobLookupError
+from apscheduler.triggers.date import DateTrigger
+import config
+from collection_store import CollectionStore, get_store
+from entity_resolver import get_resolver
+from messages import format_meeting_message
+from outbox import outbox
+from utils import plural_ru
+
+logger = logging.getLogger(__name__)
+
+# Поле пользователя: за сколько минут до встречи напоминать (число или список чисел)
+USER_LEAD_FIELD = 'meetingReminderMinutes'
+JOB_PREFIX = 'meeting_reminder'
+DEFAULT_MEETING_TIME = '10:00'
+
+def meeting_start(meeting: Dict[str, Any]) -> Optional[datetime]:
+    """Начало встречи (date + time) в часовом поясе бота или None, если дата не разбирается"""
+    meeting_date = meeting.get('date')
+    if not meeting_date:
+        return None
+    try:
+        day = datetime.fromisoformat(str(meeting_date).replace('Z', '+00:00')).date()
+        hour, minute = (int(part) for part in (meeting.get('time') or DEFAULT_MEETING_TIME).split(':')[:2])
+        tz = pytz.timezone(config.DEFAULT_TIMEZONE)
+        return tz.localize(datetime(day.year, day.month, day.day, hour, minute))
+    except Exception:
+        return None
+
+def lead_minutes(user: Optional[Dict[str, Any]]) -> Tuple[int, ...]:
+    """За сколько минут до встречи напоминать пользователю"""
+    value = (user or {}).get(USER_LEAD_FIELD)
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        value = [value]
+    if isinstance(value, list):
+        minutes = tuple(sorted({int(m) for m in value if isinstance(m, (int, float)) and m > 0}, reverse=True))
+        if minutes:
+            return minutes
+    return config.MEETING_REMINDER_MINUTES
+
+def format_meeting_reminder(meeting: Dict[str, Any], minutes: int) -> str:
+    """Текст напоминания о встрече"""
+    if minutes >= 60 and minutes % 60 == 0:
+        hours = minutes // 60
+        lead = f"{hours} {plural_ru(hours, 'час', 'часа', 'часов')}"
+    else:
+        lead = f"{minutes} {plural_ru(minutes, 'минуту', 'минуты', 'минут')}"
+    return f"⏰ <b>Через {lead} встреча</b>\n\n" + format_meeting_message(meeting, get_resolver())
+
+class MeetingReminderScheduler:
+    """Разовые задачи напоминаний о встречах в планировщике"""
+    
+    def __init__(self, scheduler, bot, meetings: CollectionStore, users: CollectionStore):
+        self.scheduler = scheduler
+        self.bot = bot
+        self.meetings = meetings
+        self.users = users
+        # ID встречи -> ID задач планировщика / участники; ID пользователя -> ID его встреч
+        self._jobs: Dict[str, Set[str]] = {}
+        self._participants: Dict[str, Set[str]] = {}
+        self._by_user: Dict[str, Set[str]] = {}
+        # Изменения приходят из потока подписки Firestore и из перечитывания кэша
+        self._lock = threading.RLock()
+        meetings.subscribe(self._on_meeting_change, replay=True)
+        users.subscribe(self._on_user_change)
+    
+    def start(self) -> None:
+        """Загрузить встречи и перечитывать их по TTL кэша (с Admin SDK изменения приходят сразу)"""
+        self.scheduler.add_job(
+            self.meetings.ensure_fresh, 'interval', seconds=config.COLLECTION_STORE_TTL,
+            id=f'{JOB_PREFIX}_refresh', replace_existing=True
+        )
+        self.users.ensure_fresh()
+        self.meetings.ensure_fresh()
+    
+    def _on_meeting_change(self, old: Optional[Dict[str, Any]], new: Optional[Dict[str, Any]]) -> None:
+        self._plan((new or old).get('id'), new)
+    
+    def _on_user_change(self, old: Optional[Dict[str, Any]], new: Optional[Dict[str, Any]]) -> None:
+        if lead_minutes(old) == lead_minutes(new):
+            return
+        user_id = str((new or old).get('id'))
+        with self._lock:
+            for meeting_id in list(self._by_user.get(user_id, ())):
+                self._plan(meeting_id, self.meetings.peek(meeting_id))
+    
+    def _cancel(self, meeting_id: str) -> None:
+        for job_id in self._jobs.pop(meeting_id, ()):
+            try:
+                self.scheduler.remove_job(job_id)
+            except JobLookupError:
+                # Напоминание уже отправлено
+                pass
+        for user_id in self._participants.pop(meeting_id, ()):
+            meeting_ids = self._by_user.get(user_id)
+            if meeting_ids is not None:
+                meeting_ids.discard(meeting_id)
+                if not meeting_ids:
+                    del self._by_user[user_id]
+    
+    def _plan(self, meeting_id: str, meeting: Optional[Dict[str, Any]]) -> None:
+        """Перепланировать напоминания встречи (без встречи / для архивной - только отменить)"""
+        with self._lock:
+            self._cancel(meeting_id)
+            if not meeting or meeting.get('isArchived'):
+                return
+            start = meeting_start(meeting)
+            if start is None or start <= datetime.now(start.tzinfo):
+                return
+            self._schedule(meeting_id, start, {str(uid) for uid in meeting.get('participantIds', []) or [] if uid})
+    
+    def _schedule(self, meeting_id: str, start: datetime, participants: Set[str]) -> None:
+        now = datetime.now(start.tzinfo)
+        jobs = set()
+        self._participants[meeting_id] = participants
+        for user_id in participants:
+            self._by_user.setdefault(user_id, set()).add(meeting_id)
+            for minutes in lead_minutes(self.users.peek(user_id)):
+                fire_at = start - timedelta(minutes=minutes)
+                if fire_at <= now:
+                    continue
+                job_id = f"{JOB_PREFIX}:{meeting_id}:{user_id}:{minutes}"
+                self.scheduler.add_job(
+                    self._remind, DateTrigger(run_date=fire_at),
+                    id=job_id, args=[meeting_id, user_id, minutes, start.isoformat()],
+                    replace_existing=True, misfire_grace_time=config.MEETING_REMINDER_GRACE_SECONDS
+                )
+                jobs.add(job_id)
+        if jobs:
+            self._jobs[meeting_id] = jobs
+            logger.debug(f"[MEETINGS] Planned {len(jobs)} reminders for meeting {meeting_id} at {start}")
+    
+    async def _remind(self, meeting_id: str, user_id: str, minutes: int, start: str) -> None:
+        """Отправить напоминание (если встреча не изменилась и напоминания включены)"""
+        try:
+            with self._lock:
+                jobs = self._jobs.get(meeting_id)
+                if jobs is not None:
+                    jobs.discard(f"{JOB_PREFIX}:{meeting_id}:{user_id}:{minutes}")
+                    if not jobs:
+                        del self._jobs[meeting_id]
+            meeting = self.meetings.peek(meeting_id)
+            # Встречу перенесли или архивировали, а задачу еще не отменили
+            current_start = meeting_start(meeting) if meeting and not meeting.get('isArchived') else None
+            if current_start is None or current_start.isoformat() != start:
+                return
+            
+            notification_prefs = get_store('notificationPrefs').get('default') or {}
+            setting = notification_prefs.get('meetingReminder', {'telegramPersonal': True, 'telegramGroup': False})
+            if isinstance(setting, dict) and not setting.get('telegramPersonal', True):
+                return
+            
+            user = self.users.peek(user_id)
+            if not user or user.get('isArchived') or not user.get('telegramUserId'):
+                return
+            # Ключ с временем встречи: после перезапуска напоминание не повторится
+            send_future = outbox.submit(
+                self.bot, user.get('telegramUserId'), format_meeting_reminder(meeting, minutes), 'meeting_reminder',
+                key=f"meeting_reminder:{meeting_id}:{user_id}:{minutes}:{start}", parse_mode='HTML'
+            )
+            if send_future is not None:
+                await send_future
+                logger.info(f"[MEETINGS] Reminded user {user_id} about meeting {meeting_id} ({minutes} min)")
+        except Exception as e:
+            logger.error(f"[MEETINGS] Error sending reminder for meeting {meeting_id} to {user_id}: {e}", exc_info=True)
+
@@ -1,27 +1,21 @@
 """
 Форматирование сообщений для Telegram бота
 """
-from typing import Dict, Any, List, Optional
+from typing import Dict, Any, List, Optional, TYPE_CHECKING
 from datetime import datetime
 import pytz
+from utils import short_id
 
-def format_task_message(task: Dict[str, Any], users: List[Dict[str, Any]], projects: List[Dict[str, Any]] = None) -> str:
+if TYPE_CHECKING:
+    from entity_resolver import EntityResolver
+
+def format_task_message(task: Dict[str, Any], resolver: 'EntityResolver') -> str:
     """Форматировать сообщение о задаче"""
-    projects = projects or []
-    
-    assignee = None
-    if task.get('assigneeId'):
-        assignee = next((u for u in users if u.get('id') == task.get('assigneeId')), None)
-    
-    creator = None
-    if task.get('createdByUserId'):
-        creator = next((u for u in users if u.get('id') == task.get('createdByUserId')), None)
-    
-    project = None
-    if task.get('projectId'):
-        project = next((p for p in projects if p.get('id') == task.get('projectId')), None)
+    assignee = resolver.user(task.get('assigneeId'))
+    creator = resolver.user(task.get('createdByUserId'))
+    project = resolver.project(task.get('projectId'))
     
-    message = f"📋 Задача #{task.get('id', 'N/A')[:8]}\n\n"
+    message = f"📋 Задача #{short_id(task.get('id'))}\n\n"
     message += f"Название: {task.get('title', 'Без названия')}\n"
     
     if creator:
@@ -55,26 +49,48 @@ def format_task_message(task: Dict[str, Any], users: List[Dict[str, Any]], proje
     
     return message
 
-def format_deal_message(deal: Dict[str, Any], clients: List[Dict[str, Any]], users: List[Dict[str, Any]], funnels: List[Dict[str, Any]] = None) -> str:
+def format_new_task_notification(task: Dict[str, Any], assignee_name: str, created_by_user: bool = False) -> str:
+    """
+    Уведомление о новой задаче
+    
+    Args:
+        task: Задача
+        assignee_name: Имя ответственного
+        created_by_user: Уведомление создателю задачи (а не исполнителю)
+    """
+    if created_by_user:
+        message = f"🆕 <b>Вы создали задачу</b>\n\n"
+    else:
+        message = f"🆕 <b>Новая задача</b>\n\n"
+    message += f"📝 <b>Задача:</b> {task.get('title', 'Без названия')}\n"
+    message += f"👤 <b>Ответственный:</b> {assignee_name}\n"
+    if task.get('endDate'):
+        message += f"📅 <b>Срок:</b> {format_task_due_date(task.get('endDate'))}\n"
+    if task.get('priority') and not created_by_user:
+        message += f"⚡ <b>Приоритет:</b> {task.get('priority')}\n"
+    return message
+
+def format_task_due_date(end_date: str) -> str:
+    """Срок задачи в виде ДД.ММ.ГГГГ (дата без времени)"""
+    try:
+        date_part = end_date
+        if 'T' in date_part:
+            date_part = date_part.split('T')[0]
+        elif ' ' in date_part:
+            date_part = date_part.split(' ')[0]
+        return datetime.strptime(date_part, '%Y-%m-%d').strftime('%d.%m.%Y')
+    except:
+        return end_date
+
+def format_deal_message(deal: Dict[str, Any], resolver: 'EntityResolver') -> str:
     """Форматировать сообщение о сделке"""
-    funnels = funnels or []
-    
-    client = None
-    if deal.get('clientId'):
-        client = next((c for c in clients if c.get('id') == deal.get('clientId')), None)
+    client = resolver.client(deal.get('clientId'))
+    assignee = resolver.user(deal.get('assigneeId'))
     
-    assignee = None
-    if deal.get('assigneeId'):
-        assignee = next((u for u in users if u.get('id') == deal.get('assigneeId')), None)
+    funnel = resolver.funnel(deal.get('funnelId'))
+    stage = resolver.stage(deal.get('funnelId'), deal.get('stage')) if funnel else None
     
-    funnel = None
-    stage = None
-    if deal.get('funnelId'):
-        funnel = next((f for f in funnels if f.get('id') == deal.get('funnelId')), None)
-        if funnel and deal.get('stage'):
-            stage = next((s for s in funnel.get('stages', []) if s.get('id') == deal.get('stage')), None)
-    
-    message = f"🎯 Заявка #{deal.get('id', 'N/A')[:8]}\n\n"
+    message = f"🎯 Заявка #{short_id(deal.get('id'))}\n\n"
     message += f"Название: {deal.get('title', deal.get('contactName', 'Без названия'))}\n"
     
     if client:
@@ -160,7 +176,7 @@ def format_daily_reminder(today_tasks: List[Dict[str, Any]], overdue_tasks: List
     
     return message
 
-def format_group_daily_summary(yesterday_tasks: List[Dict[str, Any]], overdue_tasks: List[Dict[str, Any]], today_tasks: List[Dict[str, Any]], users: List[Dict[str, Any]]) -> str:
+def format_group_daily_summary(yesterday_tasks: List[Dict[str, Any]], overdue_tasks: List[Dict[str, Any]], today_tasks: List[Dict[str, Any]], resolver: 'EntityResolver') -> str:
     """Форматировать ежедневную сводку для группы"""
     message = "📋 <b>Ежедневная сводка по задачам</b>\n\n"
     
@@ -168,12 +184,8 @@ def format_group_daily_summary(yesterday_tasks: List[Dict[str, Any]], overdue_ta
     if yesterday_tasks:
         message += f"📅 <b>Задачи на вчера (не выполненные) ({len(yesterday_tasks)}):</b>\n"
         for i, task in enumerate(yesterday_tasks[:15], 1):
-            assignee_id = task.get('assigneeId')
-            assignee_name = "Не назначено"
-            if assignee_id:
-                assignee = next((u for u in users if u.get('id') == assignee_id), None)
-                if assignee:
-                    assignee_name = assignee.get('name', 'Неизвестно')
+            assignee = resolver.user(task.get('assigneeId'))
+            assignee_name = assignee.get('name', 'Неизвестно') if assignee else "Не назначено"
             
             message += f"{i}. {task.get('title', 'Без названия')} - <b>{assignee_name}</b>\n"
         
@@ -187,12 +199,8 @@ def format_group_daily_summary(yesterday_tasks: List[Dict[str, Any]], overdue_ta
     if overdue_tasks:
         message += f"⚠️ <b>Ранее просроченные задачи ({len(overdue_tasks)}):</b>\n"
         for i, task in enumerate(overdue_tasks[:15], 1):
-            assignee_id = task.get('assigneeId')
-            assignee_name = "Не назначено"
-            if assignee_id:
-                assignee = next((u for u in users if u.get('id') == assignee_id), None)
-                if assignee:
-                    assignee_name = assignee.get('name', 'Неизвестно')
+            assignee = resolver.user(task.get('assigneeId'))
+            assignee_name = assignee.get('name', 'Неизвестно') if assignee else "Не назначено"
             
             end_date = task.get('endDate', '')
             days_overdue = ""
@@ -220,12 +228,8 @@ def format_group_daily_summary(yesterday_tasks: List[Dict[str, Any]], overdue_ta
     if today_tasks:
         message += f"✅ <b>Задачи на сегодня ({len(today_tasks)}):</b>\n"
         for i, task in enumerate(today_tasks[:15], 1):
-            assignee_id = task.get('assigneeId')
-            assignee_name = "Не назначено"
-            if assignee_id:
-                assignee = next((u for u in users if u.get('id') == assignee_id), None)
-                if assignee:
-                    assignee_name = assignee.get('name', 'Неизвестно')
+            assignee = resolver.user(task.get('assigneeId'))
+            assignee_name = assignee.get('name', 'Неизвестно') if assignee else "Не назначено"
             
             message += f"{i}. {task.get('title', 'Без названия')} - <b>{assignee_name}</b>\n"
         
@@ -294,9 +298,9 @@ def format_successful_deal(deal: Dict[str, Any], client: Optional[Dict[str, Any]
     
     return message
 
-def format_meeting_message(meeting: Dict[str, Any], users: List[Dict[str, Any]]) -> str:
+def format_meeting_message(meeting: Dict[str, Any], resolver: 'EntityResolver') -> str:
     """Форматировать сообщение о встрече"""
-    message = f"📅 Встреча #{meeting.get('id', 'N/A')[:8]}\n\n"
+    message = f"📅 Встреча #{short_id(meeting.get('id'))}\n\n"
     message += f"<b>Название:</b> {meeting.get('title', 'Без названия')}\n"
     
     if meeting.get('date'):
@@ -312,11 +316,7 @@ def format_meeting_message(meeting: Dict[str, Any], users: List[Dict[str, Any]])
     # Участники (используем participantIds из types.ts)
     participant_ids = meeting.get('participantIds', [])
     if participant_ids:
-        participant_names = []
-        for participant_id in participant_ids:
-            participant = next((u for u in users if u.get('id') == participant_id), None)
-            if participant:
-                participant_names.append(participant.get('name', 'Неизвестно'))
+        participant_names = [u.get('name', 'Неизвестно') for u in resolver.users(participant_ids)]
         if participant_names:
             message += f"<b>Участники:</b> {', '.join(participant_names)}\n"
     
@@ -327,9 +327,9 @@ def format_meeting_message(meeting: Dict[str, Any], users: List[Dict[str, Any]])
     
     return message
 
-def format_document_message(document: Dict[str, Any], users: List[Dict[str, Any]]) -> str:
+def format_document_message(document: Dict[str, Any], resolver: 'EntityResolver') -> str:
     """Форматировать сообщение о документе"""
-    message = f"📄 Документ #{document.get('id', 'N/A')[:8]}\n\n"
+    message = f"📄 Документ #{short_id(document.get('id'))}\n\n"
     message += f"<b>Название:</b> {document.get('title', 'Без названия')}\n"
     
     if document.get('type'):
@@ -337,11 +337,9 @@ def format_document_message(document: Dict[str, Any], users: List[Dict[str, Any]
         message += f"<b>Тип:</b> {type_name}\n"
     
     # Автор (используем createdByUserId из types.ts)
-    author_id = document.get('createdByUserId')
-    if author_id:
-        author = next((u for u in users if u.get('id') == author_id), None)
-        if author:
-            message += f"<b>Автор:</b> {author.get('name', 'Неизвестно')}\n"
+    author = resolver.user(document.get('createdByUserId'))
+    if author:
+        message += f"<b>Автор:</b> {author.get('name', 'Неизвестно')}\n"
     
     if document.get('createdAt'):
         try:
@@ -362,3 +360,13 @@ def format_document_message(document: Dict[str, Any], users: List[Dict[str, Any]
                 message += "..."
     
     return message
+
+def format_ambiguous_id_message(query: str, candidates: List[str], limit: int = 10) -> str:
+    """Форматировать сообщение о неоднозначном коротком ID"""
+    message = f"🔍 ID '{query}' подходит к нескольким объектам:\n\n"
+    for i, doc_id in enumerate(candidates[:limit], 1):
+        message += f"{i}. {doc_id}\n"
+    if len(candidates) > limit:
+        message += "... и другие\n"
+    message += "\nУточните ID (введите больше символов)."
+    return message
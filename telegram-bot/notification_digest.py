@@ -0,0 +1,158 @@
+"""
+Объединение уведомлений в дайджесты
+Уведомления одного типа в один чат, пришедшие почти одновременно, отправляются одним
+сообщением ("🆕 5 новых задач"). Группа отправляется, когда новых событий не было
+NOTIFICATION_DIGEST_WINDOW_SECONDS, когда самое старое событие ждет
+NOTIFICATION_DIGEST_MAX_DELAY_SECONDS или когда в группе NOTIFICATION_DIGEST_MAX_SIZE событий.
+
+Уведомления очереди ждут в самой очереди (их просто не арендуют, пока группа не готова),
+уведомления, которые бот формирует сам, ждут в DigestBuffer
+"""
+import html
+import logging
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Dict, Any, List, Optional, Tuple
+import config
+from notification_queue import created_timestamp
+from utils import plural_ru
+
+logger = logging.getLogger(__name__)
+
+# Ограничение Telegram на длину сообщения
+MAX_MESSAGE_LENGTH = 4096
+
+# Тип уведомления -> (эмодзи, формы слова для 1 / 2-4 / 5+)
+DIGEST_HEADERS = {
+    'taskCreated': ('🆕', ('новая задача', 'новые задачи', 'новых задач')),
+    'taskCreatedByMe': ('🆕', ('созданная вами задача', 'созданные вами задачи', 'созданных вами задач')),
+    'taskStatusChanged': ('🔄', ('изменение статуса задачи', 'изменения статуса задач', 'изменений статуса задач')),
+    'dealCreated': ('💼', ('новая заявка', 'новые заявки', 'новых заявок')),
+    'dealStatusChanged': ('🔄', ('изменение стадии заявки', 'изменения стадии заявок', 'изменений стадии заявок')),
+    'meetingCreated': ('📅', ('новая встреча', 'новые встречи', 'новых встреч')),
+    'purchaseRequestCreated': ('🛒', ('новая заявка на закупку', 'новые заявки на закупку', 'новых заявок на закупку')),
+}
+DEFAULT_HEADER = ('🔔', ('уведомление', 'уведомления', 'уведомлений'))
+
+# Поля metadata уведомлений очереди с названием объекта
+TITLE_FIELDS = ('taskTitle', 'dealTitle', 'meetingTitle')
+
+def _is_ready(first: float, last: float, size: int, now: float) -> bool:
+    return (
+        size >= config.NOTIFICATION_DIGEST_MAX_SIZE
+        or now - first >= config.NOTIFICATION_DIGEST_MAX_DELAY_SECONDS
+        or now - last >= config.NOTIFICATION_DIGEST_WINDOW_SECONDS
+    )
+
+def format_digest(kind: str, entries: List[str]) -> str:
+    """
+    Сообщение-дайджест
+    
+    Args:
+        kind: Тип уведомлений
+        entries: Строки дайджеста (HTML), по одной на уведомление
+    """
+    emoji, forms = DIGEST_HEADERS.get(kind, DEFAULT_HEADER)
+    count = len(entries)
+    message = f"{emoji} <b>{count} {plural_ru(count, *forms)}</b>\n"
+    for i, entry in enumerate(entries):
+        tail = f"\n... и еще {count - i}"
+        if len(message) + len(entry) + 2 + len(tail) > MAX_MESSAGE_LENGTH:
+            return message + tail
+        message += f"\n{entry}"
+    return message
+
+def _queue_entry(notification: Dict[str, Any]) -> str:
+    metadata = notification.get('metadata') or {}
+    title = next((metadata.get(f) for f in TITLE_FIELDS if metadata.get(f)), None)
+    if title:
+        return f"• {html.escape(str(title))}"
+    # Названия нет - уведомление целиком
+    return f"• {notification.get('message', '')}\n"
+
+def render_queue_digest(notifications: List[Dict[str, Any]]) -> str:
+    """Текст для группы уведомлений очереди одного типа в один чат"""
+    if len(notifications) == 1:
+        return notifications[0].get('message', '')
+    return format_digest(notifications[0].get('type', ''), [_queue_entry(n) for n in notifications])
+
+def ready_notifications(notifications: List[Dict[str, Any]], now: Optional[float] = None) -> Tuple[List[Dict[str, Any]], int]:
+    """
+    Уведомления очереди, которые пора отправлять
+    
+    Уведомления группируются по (чат, тип); группа, которая еще собирается, остается
+    в очереди до следующей проверки
+    
+    Returns:
+        (готовые уведомления в исходном порядке, сколько отложено)
+    """
+    now = time.time() if now is None else now
+    groups: Dict[Tuple[str, str], List[float]] = {}
+    for notification in notifications:
+        key = (str(notification.get('chatId')), notification.get('type', ''))
+        groups.setdefault(key, []).append(created_timestamp(notification.get('createdAt')))
+    
+    ready_keys = {
+        key for key, stamps in groups.items()
+        if _is_ready(min(stamps), max(stamps), len(stamps), now)
+    }
+    ready = [n for n in notifications if (str(n.get('chatId')), n.get('type', '')) in ready_keys]
+    return ready, len(notifications) - len(ready)
+
+def group_notifications(notifications: List[Dict[str, Any]]) -> 'OrderedDict[Tuple[str, str], List[Dict[str, Any]]]':
+    """Сгруппировать уведомления по (чат, тип), группы - в порядке первого уведомления"""
+    groups: 'OrderedDict[Tuple[str, str], List[Dict[str, Any]]]' = OrderedDict()
+    for notification in notifications:
+        key = (str(notification.get('chatId')), notification.get('type', ''))
+        groups.setdefault(key, []).append(notification)
+    return groups
+
+@dataclass
+class DigestEvent:
+    """Уведомление, которое бот формирует сам"""
+    chat_id: int
+    kind: str
+    # Полное сообщение (если событие в группе одно) и строка для дайджеста
+    text: str
+    entry: str
+    reply_markup: Any = None
+    # Ключ отправки в журнале: событие не отправляется, если то же уведомление
+    # уже отправлено другим путем (например, из очереди веб-приложения)
+    send_key: Optional[str] = None
+    created: float = field(default_factory=time.monotonic)
+
+class DigestBuffer:
+    """Буфер уведомлений бота по (чат, тип)"""
+    
+    def __init__(self):
+        self._groups: 'OrderedDict[Tuple[int, str], List[DigestEvent]]' = OrderedDict()
+        self._lock = threading.Lock()
+    
+    def add(self, event: DigestEvent) -> None:
+        with self._lock:
+            self._groups.setdefault((event.chat_id, event.kind), []).append(event)
+    
+    def take_ready(self) -> List[List[DigestEvent]]:
+        """Забрать группы, которые пора отправлять"""
+        now = time.monotonic()
+        with self._lock:
+            ready_keys = [
+                key for key, events in self._groups.items()
+                if _is_ready(events[0].created, events[-1].created, len(events), now)
+            ]
+            return [self._groups.pop(key) for key in ready_keys]
+    
+    def __len__(self) -> int:
+        with self._lock:
+            return sum(len(events) for events in self._groups.values())
+
+def render_events(events: List[DigestEvent]) -> Tuple[str, Any]:
+    """Текст и клавиатура для группы событий"""
+    if len(events) == 1:
+        return events[0].text, events[0].reply_markup
+    return format_digest(events[0].kind, [event.entry for event in events]), None
+
+# Создаем экземпляр буфера
+digest_buffer = DigestBuffer()
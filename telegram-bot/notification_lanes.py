@@ -0,0 +1,120 @@
+"""
+Приоритетные полосы очереди уведомлений
+Уведомления делятся на полосы по полю type; каждая полоса читается из очереди
+отдельно, порядок отправки чередует полосы пропорционально их весам (smooth weighted
+round-robin), а число одновременных отправок каждой полосы ограничено.
+Массовая рассылка (сотни новых сделок) не задерживает личные уведомления
+"""
+import asyncio
+import logging
+from dataclasses import dataclass
+from typing import Dict, Any, List, Optional, Tuple, Awaitable
+import config
+from notification_queue import NotificationBatch, QueueCursor, get_pending_notifications
+
+logger = logging.getLogger(__name__)
+
+@dataclass(frozen=True)
+class Lane:
+    """Полоса уведомлений"""
+    name: str
+    # Типы уведомлений полосы (пусто - все типы, не попавшие в другие полосы;
+    # такая полоса читает очередь с фильтром type not-in по типам остальных полос)
+    types: Tuple[str, ...]
+    weight: int
+    # Сколько уведомлений полосы отправляется одновременно
+    max_in_flight: int
+
+LANES = (
+    Lane('personal', ('taskCreated', 'meetingCreated'), weight=4, max_in_flight=6),
+    Lane('status', ('taskStatusChanged', 'dealStatusChanged'), weight=2, max_in_flight=4),
+    Lane('bulk', ('dealCreated', 'purchaseRequestCreated'), weight=1, max_in_flight=2),
+    Lane('other', (), weight=1, max_in_flight=2),
+)
+
+_LANE_BY_TYPE = {notification_type: lane for lane in LANES for notification_type in lane.types}
+_DEFAULT_LANE = next(lane for lane in LANES if not lane.types)
+
+def lane_for(notification: Dict[str, Any]) -> Lane:
+    return _LANE_BY_TYPE.get(notification.get('type'), _DEFAULT_LANE)
+
+def weighted_order(queues: Dict[Lane, List[Dict[str, Any]]]) -> List[Dict[str, Any]]:
+    """
+    Чередовать уведомления полос пропорционально весам
+    
+    Smooth weighted round-robin: при весах 4/2/1 на каждые 7 уведомлений приходится
+    4 из первой полосы, 2 из второй и 1 из третьей, вперемешку, а не подряд
+    """
+    positions = {lane: 0 for lane in queues}
+    current = {lane: 0 for lane in queues}
+    ordered = []
+    while True:
+        active = [lane for lane, items in queues.items() if positions[lane] < len(items)]
+        if not active:
+            return ordered
+        total = sum(lane.weight for lane in active)
+        for lane in active:
+            current[lane] += lane.weight
+        chosen = max(active, key=lambda lane: current[lane])
+        current[chosen] -= total
+        ordered.append(queues[chosen][positions[chosen]])
+        positions[chosen] += 1
+
+class LaneReader:
+    """Чтение очереди по полосам с курсором на каждую полосу"""
+    
+    def __init__(self, lanes: Tuple[Lane, ...] = LANES):
+        self.lanes = lanes
+        # Полосы не пересекаются: полоса без типов исключает типы остальных полос
+        self._known_types = tuple(t for lane in lanes for t in lane.types)
+        self._cursors: Dict[Lane, Optional[QueueCursor]] = {lane: None for lane in lanes}
+        self._exhausted: set = set()
+    
+    @property
+    def has_more(self) -> bool:
+        return len(self._exhausted) < len(self.lanes)
+    
+    def next_batch(self, limit: int = config.NOTIFICATION_QUEUE_BATCH_SIZE) -> NotificationBatch:
+        """
+        Следующая пачка: по limit уведомлений каждой полосы, в порядке весов полос
+        
+        Запросы полос не пересекаются, поэтому каждое уведомление читается
+        одной полосой и ее курсором
+        """
+        queues: Dict[Lane, List[Dict[str, Any]]] = {lane: [] for lane in self.lanes}
+        for lane in self.lanes:
+            if lane in self._exhausted:
+                continue
+            batch = get_pending_notifications(
+                limit=limit,
+                after=self._cursors[lane],
+                types=lane.types,
+                exclude_types=() if lane.types else self._known_types
+            )
+            self._cursors[lane] = batch.cursor
+            if not batch.has_more:
+                self._exhausted.add(lane)
+            queues[lane].extend(batch)
+        
+        counts = {lane.name: len(items) for lane, items in queues.items() if items}
+        if counts:
+            logger.info(f"[NOTIFICATION_LANES] Pending by lane: {counts}")
+        return NotificationBatch(items=weighted_order(queues), cursor=None, has_more=self.has_more)
+
+class LaneLimiter:
+    """Ограничение одновременных отправок каждой полосы"""
+    
+    def __init__(self):
+        self._semaphores: Dict[str, asyncio.Semaphore] = {}
+    
+    async def run(self, notification: Dict[str, Any], send: Awaitable) -> Any:
+        """Выполнить отправку уведомления, когда в его полосе есть свободное место"""
+        lane = lane_for(notification)
+        semaphore = self._semaphores.get(lane.name)
+        if semaphore is None:
+            semaphore = self._semaphores[lane.name] = asyncio.Semaphore(lane.max_in_flight)
+        async with semaphore:
+            return await send
+
+# Создаем экземпляр ограничителя
+lane_limiter = LaneLimiter()
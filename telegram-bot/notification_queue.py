@@ -1,23 +1,260 @@
 """
 Модуль для обработки очереди уведомлений из Firebase
 Веб-приложение сохраняет задачи на отправку уведомлений в Firebase,
-бот периодически проверяет и отправляет их
+бот периодически проверяет и отправляет их.
+Неотправленные уведомления читаются запросом к Firestore (sent == False,
+по возрастанию dueAt) пачками с курсором, без загрузки истории отправленных.
+dueAt - число (миллисекунды эпохи), а не createdAt: веб-приложение хранит createdAt
+как Timestamp, а Firestore сортирует значения разных типов раздельно, поэтому
+курсор по createdAt-строке пропускал бы уведомления веб-приложения.
+
+Очередь могут обрабатывать несколько процессов бота: перед отправкой пачка
+арендуется транзакцией (владелец, токен аренды, срок), аренда продлевается,
+пока идет отправка, а просроченные аренды (процесс упал) забираются другими.
+
+Неудачная отправка повторяется с экспоненциальной задержкой: dueAt переносится
+на время следующей попытки, а запрос очереди выбирает только dueAt <= сейчас, так что
+ожидающие повтора уведомления не занимают места в пачках;
+уведомления с постоянной ошибкой или исчерпавшие попытки переносятся
+в коллекцию notificationDeadLetters и больше не занимают очередь.
+
+У каждого уведомления есть ключ идемпотентности (переданный или вычисленный
+по содержимому): он служит ID документа, а недавние ключи помнятся в памяти,
+поэтому повторная постановка и повторная отправка того же уведомления отбрасываются
 """
+import asyncio
+import hashlib
+import json
 import logging
-from typing import Dict, Any, Optional, List
-from datetime import datetime
+import os
+import random
+import socket
+import threading
+import uuid
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Dict, Any, Optional, List, Tuple, Iterator, Set
+from datetime import datetime, timedelta, timezone
+import config
 from firebase_client import firebase
 
 logger = logging.getLogger(__name__)
 
 NOTIFICATION_QUEUE_COLLECTION = 'notificationQueue'
+DEAD_LETTER_COLLECTION = 'notificationDeadLetters'
+
+# Сколько уведомлений отмечать в одной транзакции (лимит Firestore - 500 записей)
+ACK_CHUNK_SIZE = 100
+
+# Поле сортировки очереди: время (миллисекунды эпохи), с которого уведомление можно отправлять
+DUE_AT_FIELD = 'dueAt'
+
+# Курсор очереди: (dueAt, ID) последнего уведомления пачки
+QueueCursor = Tuple[int, str]
+
+# Владелец аренд этого процесса
+WORKER_ID = config.NOTIFICATION_WORKER_ID or f"{socket.gethostname()}-{os.getpid()}"
+
+def _utcnow() -> datetime:
+    return datetime.now(timezone.utc)
+
+def _epoch_ms(value: datetime) -> int:
+    return int(value.timestamp() * 1000)
+
+def _lease_expired(item: Dict[str, Any], now: datetime) -> bool:
+    lease_until = item.get('leaseUntil')
+    if not lease_until:
+        return True
+    try:
+        return datetime.fromisoformat(lease_until) <= now
+    except (TypeError, ValueError):
+        return True
+
+def _is_due(item: Dict[str, Any], now: datetime) -> bool:
+    """Подошло ли время очередной попытки отправки"""
+    due_at = item.get(DUE_AT_FIELD)
+    return due_at is None or due_at <= _epoch_ms(now)
+
+class RecentKeys:
+    """Ограниченное множество недавних ключей (самые старые вытесняются)"""
+    
+    def __init__(self, maxsize: int = config.NOTIFICATION_RECENT_KEYS):
+        self.maxsize = maxsize
+        self._keys: 'OrderedDict[str, None]' = OrderedDict()
+        self._lock = threading.Lock()
+    
+    def add(self, key: str) -> bool:
+        """Запомнить ключ; False, если он уже был"""
+        with self._lock:
+            if key in self._keys:
+                self._keys.move_to_end(key)
+                return False
+            self._keys[key] = None
+            if len(self._keys) > self.maxsize:
+                self._keys.popitem(last=False)
+            return True
+    
+    def discard(self, key: str) -> None:
+        with self._lock:
+            self._keys.pop(key, None)
+    
+    def __contains__(self, key: str) -> bool:
+        with self._lock:
+            return key in self._keys
+
+# Ключи, недавно поставленные в очередь этим процессом, и ключи отправленных уведомлений
+_recent_enqueued = RecentKeys()
+_recent_sent = RecentKeys()
+
+def created_timestamp(created_at: Optional[Any]) -> float:
+    """createdAt уведомления (ISO или datetime) -> Unix time; без даты - текущее время"""
+    if isinstance(created_at, datetime):
+        return created_at.timestamp()
+    try:
+        return datetime.fromisoformat((created_at or '').replace('Z', '+00:00')).timestamp()
+    except ValueError:
+        return _utcnow().timestamp()
+
+def content_key(
+    notification_type: str,
+    user_id: str,
+    chat_id: str,
+    message: str,
+    metadata: Optional[Dict[str, Any]] = None,
+    created_at: Optional[str] = None
+) -> str:
+    """
+    Ключ идемпотентности по содержимому уведомления
+    
+    Одинаковые уведомления получают один ключ в пределах окна NOTIFICATION_DEDUPE_WINDOW_SECONDS
+    (повтор того же уведомления через день - уже новое уведомление)
+    """
+    window = int(created_timestamp(created_at) // config.NOTIFICATION_DEDUPE_WINDOW_SECONDS)
+    content = json.dumps(
+        [notification_type, str(user_id), str(chat_id), message, metadata or {}, window],
+        sort_keys=True, ensure_ascii=False, default=str
+    )
+    return hashlib.sha1(content.encode('utf-8')).hexdigest()
+
+def notification_key(notification: Dict[str, Any]) -> str:
+    """Ключ идемпотентности уведомления из очереди (сохраненный или по содержимому)"""
+    return notification.get('idempotencyKey') or content_key(
+        notification.get('type', ''),
+        notification.get('userId', ''),
+        notification.get('chatId', ''),
+        notification.get('message', ''),
+        notification.get('metadata'),
+        notification.get('createdAt')
+    )
+
+def reserve_send_key(notification: Dict[str, Any]) -> bool:
+    """
+    Занять ключ уведомления перед отправкой
+    
+    Returns:
+        False, если такое же уведомление уже отправлено (или отправляется) этим процессом
+    """
+    return _recent_sent.add(notification_key(notification))
+
+def release_send_key(notification: Dict[str, Any]) -> None:
+    """Освободить ключ (отправка не удалась, уведомление будет отправлено повторно)"""
+    _recent_sent.discard(notification_key(notification))
+
+def retry_delay(attempts: int) -> float:
+    """
+    Задержка перед следующей попыткой (секунды)
+    
+    Экспоненциальная: база * 2^(попытка - 1), не больше максимума; случайная
+    половина задержки (jitter) разводит повторы, упавшие одновременно
+    """
+    delay = min(config.NOTIFICATION_RETRY_MAX_SECONDS, config.NOTIFICATION_RETRY_BASE_SECONDS * 2 ** (attempts - 1))
+    return delay / 2 + random.uniform(0, delay / 2)
+
+@dataclass
+class NotificationBatch:
+    """Пачка неотправленных уведомлений (старые первыми)"""
+    items: List[Dict[str, Any]]
+    # Курсор, с которого начинается следующая пачка
+    cursor: Optional[QueueCursor]
+    # Пачка заполнена целиком - за курсором в очереди могут быть еще уведомления
+    has_more: bool
+    fetched_at: datetime = field(default_factory=datetime.now)
+    
+    @property
+    def ids(self) -> List[str]:
+        return [item['id'] for item in self.items]
+    
+    def __len__(self) -> int:
+        return len(self.items)
+    
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        return iter(self.items)
+    
+    def lease(self, owner: str = WORKER_ID, seconds: int = config.NOTIFICATION_LEASE_SECONDS) -> 'NotificationLease':
+        """Арендовать уведомления пачки (см. lease_notifications)"""
+        return lease_notifications(self, owner, seconds)
+
+@dataclass
+class NotificationLease:
+    """Уведомления, арендованные процессом для отправки"""
+    owner: str
+    token: str
+    items: List[Dict[str, Any]]
+    expires_at: datetime
+    seconds: int
+    # Уведомления, которые еще не отмечены отправленными
+    active: Set[str] = field(default_factory=set)
+    
+    @property
+    def ids(self) -> List[str]:
+        return [item['id'] for item in self.items]
+    
+    def __len__(self) -> int:
+        return len(self.items)
+    
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        return iter(self.items)
+    
+    def holds(self, task_id: str) -> bool:
+        return task_id in self.active and _utcnow() < self.expires_at
+    
+    def renew(self) -> None:
+        """
+        Продлить аренду (heartbeat)
+        
+        Уведомления, аренду которых перехватил другой процесс, исключаются из аренды
+        """
+        if not self.active:
+            return
+        expires_at = _utcnow() + timedelta(seconds=self.seconds)
+        
+        def extend(item: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+            if item.get('leaseToken') != self.token or item.get('sent'):
+                return None
+            return {'leaseUntil': expires_at.isoformat()}
+        
+        renewed = {item['id'] for item in firebase.update_in_transaction(
+            NOTIFICATION_QUEUE_COLLECTION, sorted(self.active), extend
+        )}
+        lost = self.active - renewed
+        if lost:
+            logger.warning(f"[NOTIFICATION_QUEUE] Lease {self.token} lost {len(lost)} notifications: {sorted(lost)}")
+        self.active = renewed
+        self.expires_at = expires_at
+    
+    async def keep_alive(self) -> None:
+        """Продлевать аренду, пока есть неотправленные уведомления (задачу отменяют после отправки)"""
+        while self.active:
+            await asyncio.sleep(self.seconds / 3)
+            self.renew()
 
 def add_notification_task(
     notification_type: str,
     user_id: str,
     message: str,
     chat_id: str,
-    metadata: Optional[Dict[str, Any]] = None
+    metadata: Optional[Dict[str, Any]] = None,
+    idempotency_key: Optional[str] = None
 ) -> bool:
     """
     Добавляет задачу на отправку уведомления в очередь
@@ -29,50 +266,140 @@ def add_notification_task(
         message: Текст сообщения
         chat_id: Telegram chat ID пользователя
         metadata: Дополнительные данные (опционально)
+        idempotency_key: Ключ идемпотентности; по умолчанию вычисляется по содержимому.
+            Повторный вызов с тем же ключом не создает второе уведомление
     
     Returns:
-        True если задача добавлена успешно
+        True если задача добавлена успешно (False - такое уведомление уже в очереди или ошибка)
     """
     try:
+        created = _utcnow()
+        key = idempotency_key or content_key(notification_type, user_id, chat_id, message, metadata, created.isoformat())
+        if key in _recent_enqueued:
+            logger.info(f"[NOTIFICATION_QUEUE] Duplicate task {key} dropped: {notification_type} for user {user_id}")
+            return False
+        
         task = {
-            'id': f"notif_{datetime.now().isoformat()}_{user_id}",
+            'id': f"notif_{key}".replace('/', '_'),
+            'idempotencyKey': key,
             'type': notification_type,
             'userId': user_id,
             'message': message,
             'chatId': chat_id,
             'metadata': metadata or {},
-            'createdAt': datetime.now().isoformat(),
+            # Timestamp, как у уведомлений веб-приложения
+            'createdAt': created,
+            DUE_AT_FIELD: _epoch_ms(created),
             'sent': False,
             'error': None
         }
-        firebase.save(NOTIFICATION_QUEUE_COLLECTION, task)
+        if not firebase.create(NOTIFICATION_QUEUE_COLLECTION, task):
+            logger.info(f"[NOTIFICATION_QUEUE] Task {key} already exists: {notification_type} for user {user_id}")
+            _recent_enqueued.add(key)
+            return False
+        _recent_enqueued.add(key)
         logger.info(f"[NOTIFICATION_QUEUE] Added task: {notification_type} for user {user_id}")
         return True
     except Exception as e:
         logger.error(f"[NOTIFICATION_QUEUE] Error adding task: {e}", exc_info=True)
         return False
 
-def get_pending_notifications(limit: int = 50) -> List[Dict[str, Any]]:
+def get_pending_notifications(
+    limit: int = config.NOTIFICATION_QUEUE_BATCH_SIZE,
+    after: Optional[QueueCursor] = None,
+    types: Tuple[str, ...] = (),
+    exclude_types: Tuple[str, ...] = ()
+) -> NotificationBatch:
     """
-    Получает список неотправленных уведомлений
+    Получает пачку неотправленных уведомлений
+    
+    Фильтр, сортировка и лимит выполняются в Firestore; уведомления, ожидающие
+    повторной попытки (dueAt в будущем), не выбираются
+    (нужны составные индексы notificationQueue: sent, dueAt; type, sent, dueAt
+    и sent, dueAt, type для exclude_types)
     
     Args:
-        limit: Максимальное количество уведомлений для получения
+        limit: Максимальное количество уведомлений в пачке
+        after: Курсор предыдущей пачки (None - с начала очереди)
+        types: Только уведомления этих типов (пусто - все типы)
+        exclude_types: Кроме уведомлений этих типов (не вместе с types)
     
     Returns:
-        Список задач на отправку уведомлений
+        Пачка задач на отправку уведомлений
     """
     try:
-        all_tasks = firebase.get_all(NOTIFICATION_QUEUE_COLLECTION)
-        pending = [t for t in all_tasks if not t.get('sent', False)]
-        # Сортируем по дате создания (старые первыми)
-        pending.sort(key=lambda x: x.get('createdAt', ''))
-        return pending[:limit]
+        filters = [('sent', '==', False), (DUE_AT_FIELD, '<=', _epoch_ms(_utcnow()))]
+        if types:
+            filters.append(('type', 'in', list(types)))
+        elif exclude_types:
+            filters.append(('type', 'not-in', list(exclude_types)))
+        items = firebase.query_page(
+            NOTIFICATION_QUEUE_COLLECTION,
+            filters,
+            order_by=DUE_AT_FIELD,
+            limit=limit,
+            start_after=after
+        )
+        cursor = (items[-1][DUE_AT_FIELD], items[-1]['id']) if items else after
+        return NotificationBatch(items=items, cursor=cursor, has_more=len(items) >= limit)
     except Exception as e:
         logger.error(f"[NOTIFICATION_QUEUE] Error getting pending notifications: {e}", exc_info=True)
-        return []
+        return NotificationBatch(items=[], cursor=after, has_more=False)
 
-def mark_notification_sent(task_id: str, success: bool = True, error: Optional[str] = None) -> bool:
+def lease_notifications(
+    batch: NotificationBatch,
+    owner: str = WORKER_ID,
+    seconds: int = config.NOTIFICATION_LEASE_SECONDS
+) -> NotificationLease:
+    """
+    Арендовать уведомления пачки для отправки
+    
+    В одной транзакции забираются уведомления, которые еще не отправлены и не арендованы
+    (или аренда которых просрочена); уведомления, арендованные другим процессом
+    или ожидающие повторной попытки, пропускаются
+    
+    Args:
+        batch: Пачка из get_pending_notifications
+        owner: Владелец аренды (ID процесса)
+        seconds: Срок аренды; продлевается через NotificationLease.renew
+    """
+    token = uuid.uuid4().hex
+    expires_at = _utcnow() + timedelta(seconds=seconds)
+    reclaimed = []
+    
+    def claim(item: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        now = _utcnow()
+        if item.get('sent') or not _lease_expired(item, now) or not _is_due(item, now):
+            return None
+        if item.get('leaseOwner'):
+            reclaimed.append(item['id'])
+        return {'leaseOwner': owner, 'leaseToken': token, 'leaseUntil': expires_at.isoformat()}
+    
+    items = []
+    if batch.items:
+        items = firebase.update_in_transaction(NOTIFICATION_QUEUE_COLLECTION, batch.ids, claim)
+        # Порядок отправки - порядок пачки
+        position = {doc_id: i for i, doc_id in enumerate(batch.ids)}
+        items.sort(key=lambda x: position.get(x['id'], len(position)))
+    if reclaimed:
+        logger.info(f"[NOTIFICATION_QUEUE] Reclaimed {len(set(reclaimed))} notifications with expired leases")
+    if len(items) < len(batch):
+        logger.info(f"[NOTIFICATION_QUEUE] {len(batch) - len(items)} notifications are leased by other workers or wait for retry")
+    return NotificationLease(
+        owner=owner,
+        token=token,
+        items=items,
+        expires_at=expires_at,
+        seconds=seconds,
+        active={item['id'] for item in items}
+    )
+
+def mark_notification_sent(
+    task_id: str,
+    success: bool = True,
+    error: Optional[str] = None,
+    lease: Optional[NotificationLease] = None
+) -> bool:
     """
     Помечает уведомление как отправленное
     
@@ -80,28 +407,201 @@ def mark_notification_sent(task_id: str, success: bool = True, error: Optional[s
         task_id: ID задачи
         success: Успешно ли отправлено
         error: Сообщение об ошибке (если есть)
+        lease: Аренда, в которой отправлялось уведомление; отметка делается, только если
+            аренда не перехвачена, и аренда снимается
     
     Returns:
         True если обновлено успешно
     """
+    if lease is not None:
+        return _complete_leased(task_id, success, error, lease)
+    changes = {'sent': success, 'sentAt': datetime.now().isoformat()}
+    if error:
+        changes['error'] = error
+    try:
+        # Меняем только эти поля (перезапись документа превратила бы Timestamp createdAt в строку)
+        return bool(firebase.update_in_transaction(NOTIFICATION_QUEUE_COLLECTION, [task_id], lambda item: changes))
+    except Exception as e:
+        logger.error(f"[NOTIFICATION_QUEUE] Error marking notification sent: {e}", exc_info=True)
+        return False
+
+def _complete_leased(task_id: str, success: bool, error: Optional[str], lease: NotificationLease) -> bool:
+    def complete(item: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        if item.get('leaseToken') != lease.token:
+            return None
+        changes = {
+            'sent': success,
+            'sentAt': datetime.now().isoformat(),
+            'leaseOwner': None,
+            'leaseToken': None,
+            'leaseUntil': None
+        }
+        if error:
+            changes['error'] = error
+        return changes
+    
+    lease.active.discard(task_id)
     try:
-        task = firebase.get_by_id(NOTIFICATION_QUEUE_COLLECTION, task_id)
-        if task:
-            task['sent'] = success
-            task['sentAt'] = datetime.now().isoformat()
-            if error:
-                task['error'] = error
-            firebase.save(NOTIFICATION_QUEUE_COLLECTION, task)
+        if firebase.update_in_transaction(NOTIFICATION_QUEUE_COLLECTION, [task_id], complete):
             return True
+        logger.warning(f"[NOTIFICATION_QUEUE] Lease on {task_id} was lost, result not saved")
         return False
     except Exception as e:
         logger.error(f"[NOTIFICATION_QUEUE] Error marking notification sent: {e}", exc_info=True)
         return False
 
+def ack_notifications_sent(acks: Dict[str, Optional[str]]) -> Set[str]:
+    """
+    Отметить отправленными несколько уведомлений (пачками по одной транзакции)
+    
+    Отметка не делается, если уведомление уже отправлено или его аренду держит
+    другой процесс (токен не совпадает и аренда не просрочена)
+    
+    Args:
+        acks: ID уведомления -> токен аренды, в которой оно отправлялось
+    
+    Returns:
+        ID отмеченных уведомлений
+    """
+    def ack(item: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        if item.get('sent'):
+            return None
+        token = item.get('leaseToken')
+        if token and token != acks.get(item['id']) and not _lease_expired(item, _utcnow()):
+            return None
+        return {
+            'sent': True,
+            'sentAt': datetime.now().isoformat(),
+            'leaseOwner': None,
+            'leaseToken': None,
+            'leaseUntil': None
+        }
+    
+    acked = set()
+    ids = sorted(acks)
+    try:
+        for start in range(0, len(ids), ACK_CHUNK_SIZE):
+            chunk = ids[start:start + ACK_CHUNK_SIZE]
+            acked.update(item['id'] for item in firebase.update_in_transaction(NOTIFICATION_QUEUE_COLLECTION, chunk, ack))
+    except Exception as e:
+        logger.error(f"[NOTIFICATION_QUEUE] Error acking notifications: {e}", exc_info=True)
+    if acked:
+        logger.info(f"[NOTIFICATION_QUEUE] Acked {len(acked)} sent notifications")
+    return acked
+
+def mark_notification_failed(
+    task_id: str,
+    error: str,
+    permanent: bool = False,
+    lease: Optional[NotificationLease] = None
+) -> bool:
+    """
+    Записывает неудачную попытку отправки
+    
+    Уведомление откладывается до nextAttemptAt (экспоненциальная задержка); после
+    NOTIFICATION_MAX_ATTEMPTS попыток или при постоянной ошибке (бот заблокирован,
+    чат не найден) оно переносится в коллекцию notificationDeadLetters
+    
+    Args:
+        task_id: ID задачи
+        error: Сообщение об ошибке
+        permanent: Ошибка не исправится повтором
+        lease: Аренда, в которой отправлялось уведомление
+    
+    Returns:
+        True если обновлено успешно
+    """
+    def fail(item: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        if lease is not None and item.get('leaseToken') != lease.token:
+            return None
+        attempts = int(item.get('attempts') or 0) + 1
+        changes = {
+            'attempts': attempts,
+            'error': error,
+            'lastAttemptAt': datetime.now().isoformat(),
+            'leaseOwner': None,
+            'leaseToken': None,
+            'leaseUntil': None
+        }
+        if permanent or attempts >= config.NOTIFICATION_MAX_ATTEMPTS:
+            # Уведомление уходит из выборки неотправленных сразу, копия - в dead letters
+            changes['sent'] = True
+            changes['sentAt'] = datetime.now().isoformat()
+            changes['deadLetter'] = True
+        else:
+            next_attempt_at = _utcnow() + timedelta(seconds=retry_delay(attempts))
+            changes['nextAttemptAt'] = next_attempt_at.isoformat()
+            # До этого времени запрос очереди уведомление не выбирает
+            changes[DUE_AT_FIELD] = _epoch_ms(next_attempt_at)
+        return changes
+    
+    if lease is not None:
+        lease.active.discard(task_id)
+    try:
+        updated = firebase.update_in_transaction(NOTIFICATION_QUEUE_COLLECTION, [task_id], fail)
+        if not updated:
+            logger.warning(f"[NOTIFICATION_QUEUE] Lease on {task_id} was lost, failure not saved")
+            return False
+        item = updated[0]
+        if item.get('deadLetter'):
+            _move_to_dead_letters(item, permanent)
+        else:
+            logger.info(f"[NOTIFICATION_QUEUE] Notification {task_id} failed (attempt {item['attempts']}), retry at {item['nextAttemptAt']}")
+        return True
+    except Exception as e:
+        logger.error(f"[NOTIFICATION_QUEUE] Error marking notification failed: {e}", exc_info=True)
+        return False
+
+def _move_to_dead_letters(item: Dict[str, Any], permanent: bool) -> None:
+    dead_letter = {k: v for k, v in item.items() if k not in ('sent', 'sentAt', 'deadLetter', 'leaseOwner', 'leaseToken', 'leaseUntil')}
+    dead_letter['permanentError'] = permanent
+    dead_letter['deadLetteredAt'] = datetime.now().isoformat()
+    if firebase.save(DEAD_LETTER_COLLECTION, dead_letter):
+        firebase.delete(NOTIFICATION_QUEUE_COLLECTION, item['id'])
+    logger.warning(
+        f"[NOTIFICATION_QUEUE] Notification {item['id']} moved to dead letters after {item.get('attempts')} attempts: {item.get('error')}"
+    )
+
+def _backfill_due_at(tasks: List[Dict[str, Any]]) -> int:
+    """Проставить dueAt неотправленным уведомлениям без него (записанным до появления поля)"""
+    ids = [task['id'] for task in tasks if not task.get('sent') and task.get(DUE_AT_FIELD) is None]
+    if not ids:
+        return 0
+    
+    def backfill(item: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        if item.get('sent') or item.get(DUE_AT_FIELD) is not None:
+            return None
+        return {DUE_AT_FIELD: int(created_timestamp(item.get('createdAt')) * 1000)}
+    
+    updated = 0
+    for start in range(0, len(ids), ACK_CHUNK_SIZE):
+        updated += len(firebase.update_in_transaction(NOTIFICATION_QUEUE_COLLECTION, ids[start:start + ACK_CHUNK_SIZE], backfill))
+    logger.info(f"[NOTIFICATION_QUEUE] Set {DUE_AT_FIELD} on {updated} pending notifications")
+    return updated
+
+def backfill_due_at() -> int:
+    """
+    Проставляет dueAt неотправленным уведомлениям без него
+    
+    Вызывается при запуске до первого чтения очереди: без поля запрос
+    get_pending_notifications уведомление не видит
+    
+    Returns:
+        Количество обновленных уведомлений
+    """
+    try:
+        return _backfill_due_at(firebase.get_all(NOTIFICATION_QUEUE_COLLECTION))
+    except Exception as e:
+        logger.error(f"[NOTIFICATION_QUEUE] Error backfilling {DUE_AT_FIELD}: {e}", exc_info=True)
+        return 0
+
 def cleanup_old_notifications(days: int = 7) -> int:
     """
     Удаляет старые отправленные уведомления
     
+    Заодно проставляет dueAt неотправленным уведомлениям без него: без поля
+    запрос очереди их не видит
+    
     Args:
         days: Количество дней для хранения
     
@@ -113,6 +613,7 @@ def cleanup_old_notifications(days: int = 7) -> int:
         cutoff_date = (datetime.now() - timedelta(days=days)).isoformat()
         
         all_tasks = firebase.get_all(NOTIFICATION_QUEUE_COLLECTION)
+        _backfill_due_at(all_tasks)
         deleted_count = 0
         
         for task in all_tasks:
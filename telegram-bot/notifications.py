@@ -1,90 +1,101 @@
 """
 Модуль уведомлений
 """
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Iterable, Iterator, Tuple
 from datetime import datetime, timedelta
 from firebase_client import firebase
-from tasks import get_today_tasks, get_overdue_tasks, get_yesterday_tasks, get_all_today_tasks, get_all_overdue_tasks
+from tasks import (
+    get_today_tasks, get_overdue_tasks, get_yesterday_tasks, get_all_today_tasks, get_all_overdue_tasks,
+    partition_tasks_by_user, filter_today_tasks, filter_overdue_tasks, get_local_today
+)
 from deals import get_won_deals_today
 from messages import format_daily_reminder, format_weekly_report, format_successful_deal
+from entity_resolver import EntityResolver, get_resolver
+from creation_index import get_creation_index, created_at_ms, to_epoch_ms
+from subscriptions import subscriber_registry
 from utils import get_week_range, format_date
 import pytz
 
-def check_new_tasks(user_id: str, last_check_time: datetime) -> List[Dict[str, Any]]:
-    """Проверить новые задачи для пользователя"""
-    try:
-        all_tasks = firebase.get_all('tasks')
-        new_tasks = []
+def filter_new_tasks(tasks: Iterable[Dict[str, Any]], user_id: str, last_check_time: datetime) -> List[Dict[str, Any]]:
+    """
+    Задачи пользователя (исполнитель или создатель), созданные после last_check_time
+    
+    Args:
+        tasks: Задачи-кандидаты (обычно срез индекса по времени создания)
+        user_id: ID пользователя
+        last_check_time: Время последней проверки
+    """
+    new_tasks = []
+    since = to_epoch_ms(last_check_time)
+    
+    for task in tasks:
+        if task.get('isArchived'):
+            continue
         
-        for task in all_tasks:
-            if task.get('isArchived'):
-                continue
-            
-            created_at = task.get('createdAt')
-            if not created_at:
-                continue
-            
-            try:
-                task_time = datetime.fromisoformat(created_at.replace('Z', '+00:00'))
-                
-                # Проверяем, новая ли задача (создана после last_check_time)
-                if task_time <= last_check_time:
-                    continue
-                
-                # Проверяем, назначена ли задача на пользователя ИЛИ создана пользователем
-                assignee_id = task.get('assigneeId')
-                assignee_ids = task.get('assigneeIds', [])
-                created_by = task.get('createdByUserId')
-                
-                is_assigned = (assignee_id and str(assignee_id) == str(user_id)) or \
-                             (isinstance(assignee_ids, list) and user_id in [str(uid) for uid in assignee_ids if uid])
-                is_created_by = created_by and str(created_by) == str(user_id)
-                
-                # Добавляем задачу если она назначена на пользователя ИЛИ создана пользователем
-                if is_assigned or is_created_by:
-                    new_tasks.append(task)
-            except Exception as date_error:
-                print(f"Error parsing task date: {date_error}")
-                continue
+        # Проверяем, новая ли задача (создана после last_check_time)
+        created = created_at_ms(task)
+        if created is None or created <= since:
+            continue
+        
+        # Проверяем, назначена ли задача на пользователя ИЛИ создана пользователем
+        assignee_id = task.get('assigneeId')
+        assignee_ids = task.get('assigneeIds', [])
+        created_by = task.get('createdByUserId')
+        
+        is_assigned = (assignee_id and str(assignee_id) == str(user_id)) or \
+                     (isinstance(assignee_ids, list) and user_id in [str(uid) for uid in assignee_ids if uid])
+        is_created_by = created_by and str(created_by) == str(user_id)
         
-        return new_tasks
+        # Добавляем задачу если она назначена на пользователя ИЛИ создана пользователем
+        if is_assigned or is_created_by:
+            new_tasks.append(task)
+    
+    return new_tasks
+
+def check_new_tasks(user_id: str, last_check_time: datetime) -> Tuple[List[Dict[str, Any]], datetime]:
+    """
+    Проверить новые задачи для пользователя
+    
+    Returns:
+        (новые задачи, время для следующей проверки): задачи берутся из кэша коллекции,
+        поэтому следующая проверка начинается с момента, до которого кэш полон, а не с текущего
+    """
+    try:
+        index = get_creation_index('tasks')
+        until = index.watermark()
+        if until is None or until <= last_check_time:
+            return [], last_check_time
+        # Только задачи, созданные после последней проверки (срез индекса по времени создания)
+        recent_tasks = index.created_since(last_check_time, until)
+        return filter_new_tasks(recent_tasks, user_id, last_check_time), until
     except Exception as e:
         print(f"Error checking new tasks: {e}")
         import traceback
         traceback.print_exc()
-        return []
+        return [], last_check_time
 
-def check_new_deals(user_id: str, last_check_time: datetime) -> List[Dict[str, Any]]:
-    """Проверить новые заявки для пользователя"""
+def check_new_deals(user_id: str, last_check_time: datetime) -> Tuple[List[Dict[str, Any]], datetime]:
+    """
+    Проверить новые заявки для пользователя
+    
+    Returns:
+        (новые заявки, время для следующей проверки) - как в check_new_tasks
+    """
     try:
-        # Получаем настройки уведомлений
-        notification_prefs = firebase.get_by_id('notificationPrefs', 'default')
-        telegram_users = notification_prefs.get('dealCreated', {}).get('telegramUsers', []) if notification_prefs else []
+        index = get_creation_index('deals')
+        until = index.watermark()
+        if until is None or until <= last_check_time:
+            return [], last_check_time
+        # Проверяем, должен ли пользователь получать уведомления (подписчики из notificationPrefs)
+        if not subscriber_registry.is_subscribed('dealCreated', user_id):
+            return [], until
         
-        # Проверяем, должен ли пользователь получать уведомления
-        if user_id not in telegram_users:
-            return []
-        
-        all_deals = firebase.get_all('deals')
-        new_deals = []
-        
-        for deal in all_deals:
-            if deal.get('isArchived'):
-                continue
-            
-            created_at = deal.get('createdAt')
-            if created_at:
-                try:
-                    deal_time = datetime.fromisoformat(created_at.replace('Z', '+00:00'))
-                    if deal_time > last_check_time:
-                        new_deals.append(deal)
-                except:
-                    pass
-        
-        return new_deals
+        # Сделки, созданные после последней проверки (срез индекса по времени создания)
+        recent_deals = index.created_since(last_check_time, until)
+        return [deal for deal in recent_deals if not deal.get('isArchived')], until
     except Exception as e:
         print(f"Error checking new deals: {e}")
-        return []
+        return [], last_check_time
 
 def check_upcoming_meetings(user_id: str, minutes_before: int = 15) -> List[Dict[str, Any]]:
     """Проверить предстоящие встречи"""
@@ -146,6 +157,38 @@ def get_daily_reminder_message(user_id: str) -> Optional[str]:
         print(f"Error getting daily reminder: {e}")
         return None
 
+def iter_daily_reminders(users: Iterable[Dict[str, Any]]) -> Iterator[Tuple[Any, str]]:
+    """
+    Ежедневные напоминания для всех пользователей за одну загрузку задач
+    
+    Задачи загружаются один раз и раскладываются по исполнителям, сообщения
+    выдаются по одному, чтобы отправка начиналась, не дожидаясь остальных
+    
+    Args:
+        users: Пользователи системы
+    
+    Yields:
+        (telegram_user_id, текст напоминания)
+    """
+    tasks_by_user = partition_tasks_by_user(firebase.get_all('tasks'))
+    today = get_local_today()
+    for user in users:
+        if user.get('isArchived'):
+            continue
+        telegram_user_id = user.get('telegramUserId')
+        if not telegram_user_id:
+            continue
+        
+        try:
+            user_tasks = tasks_by_user.get(str(user.get('id')), [])
+            today_tasks = filter_today_tasks(user_tasks, today)
+            overdue_tasks = filter_overdue_tasks(user_tasks, today)
+            if not today_tasks and not overdue_tasks:
+                continue
+            yield telegram_user_id, format_daily_reminder(today_tasks, overdue_tasks)
+        except Exception as e:
+            print(f"Error rendering daily reminder for {user.get('id')}: {e}")
+
 def get_weekly_report_message() -> Optional[str]:
     """Получить сообщение еженедельного отчета"""
     try:
@@ -153,7 +196,7 @@ def get_weekly_report_message() -> Optional[str]:
         
         # Получаем все задачи за неделю
         all_tasks = firebase.get_all('tasks')
-        all_users = firebase.get_all('users')
+        resolver = get_resolver()
         
         # Фильтруем задачи за неделю
         week_tasks = []
@@ -190,7 +233,7 @@ def get_weekly_report_message() -> Optional[str]:
         bottom_users = []
         
         for user_id, stats in user_stats.items():
-            user = next((u for u in all_users if u.get('id') == user_id), None)
+            user = resolver.user(user_id)
             if not user:
                 continue
             
@@ -228,27 +271,19 @@ def get_group_daily_summary() -> Optional[str]:
         yesterday_tasks = get_yesterday_tasks()
         overdue_tasks = get_all_overdue_tasks()
         today_tasks = get_all_today_tasks()
-        users = firebase.get_all('users')
         
         from messages import format_group_daily_summary
-        return format_group_daily_summary(yesterday_tasks, overdue_tasks, today_tasks, users)
+        return format_group_daily_summary(yesterday_tasks, overdue_tasks, today_tasks, get_resolver())
     except Exception as e:
         print(f"Error getting group daily summary: {e}")
         return None
 
-def get_successful_deal_message(deal: Dict[str, Any]) -> Optional[str]:
+def get_successful_deal_message(deal: Dict[str, Any], resolver: Optional[EntityResolver] = None) -> Optional[str]:
     """Получить сообщение об успешной сделке"""
     try:
-        clients = firebase.get_all('clients')
-        users = firebase.get_all('users')
-        
-        client = None
-        if deal.get('clientId'):
-            client = next((c for c in clients if c.get('id') == deal.get('clientId')), None)
-        
-        user = None
-        if deal.get('assigneeId'):
-            user = next((u for u in users if u.get('id') == deal.get('assigneeId')), None)
+        resolver = resolver or get_resolver()
+        client = resolver.client(deal.get('clientId'))
+        user = resolver.user(deal.get('assigneeId'))
         
         return format_successful_deal(deal, client, user)
     except Exception as e:
@@ -0,0 +1,284 @@
+"""
+Локальный журнал отправок (outbox) в SQLite (WAL)
+Каждая отправка записывается в журнал до передачи в Telegram и отмечается после;
+при запуске бота незавершенные отправки повторяются. Отметки "отправлено" в очереди
+уведомлений Firebase копятся в журнале и записываются пачками в фоне, а не
+отдельным чтением и записью документа на каждое сообщение
+"""
+import asyncio
+import json
+import logging
+import sqlite3
+import threading
+import time
+from typing import Dict, Any, List, Optional
+from telegram import InlineKeyboardMarkup
+import config
+from send_dispatcher import send_dispatcher
+from notification_queue import ack_notifications_sent
+
+logger = logging.getLogger(__name__)
+
+STATUS_PENDING = 'pending'
+STATUS_SENT = 'sent'
+STATUS_FAILED = 'failed'
+
+# После скольких неудачных попыток перестать отмечать уведомления в Firebase
+# (обычно их уже отметил или забрал другой процесс)
+MAX_ACK_ATTEMPTS = 3
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sends (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    key TEXT UNIQUE,
+    source TEXT NOT NULL,
+    chat_id TEXT NOT NULL,
+    text TEXT NOT NULL,
+    options TEXT NOT NULL,
+    acks TEXT,
+    status TEXT NOT NULL,
+    error TEXT,
+    ack_attempts INTEGER NOT NULL DEFAULT 0,
+    acked INTEGER NOT NULL DEFAULT 0,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS sends_status ON sends (status, acked);
+CREATE TABLE IF NOT EXISTS send_keys (
+    key TEXT PRIMARY KEY,
+    send_id INTEGER NOT NULL
+);
+"""
+
+def _encode_options(options: Dict[str, Any]) -> str:
+    """Параметры send_message -> JSON (клавиатура сохраняется через to_dict)"""
+    encoded = dict(options)
+    reply_markup = encoded.get('reply_markup')
+    if reply_markup is not None:
+        encoded['reply_markup'] = reply_markup.to_dict()
+    return json.dumps(encoded, ensure_ascii=False)
+
+def _decode_options(data: str, bot) -> Dict[str, Any]:
+    options = json.loads(data)
+    if options.get('reply_markup') is not None:
+        options['reply_markup'] = InlineKeyboardMarkup.de_json(options['reply_markup'], bot)
+    return options
+
+class Outbox:
+    """Журнал отправок"""
+    
+    def __init__(self, path: str = config.OUTBOX_PATH):
+        self.path = path
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+    
+    def _db(self) -> sqlite3.Connection:
+        if self._conn is None:
+            self._conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+            self._conn.row_factory = sqlite3.Row
+            # WAL: запись не блокирует чтение, fsync только при checkpoint
+            self._conn.execute('PRAGMA journal_mode=WAL')
+            self._conn.execute('PRAGMA synchronous=NORMAL')
+            self._conn.executescript(SCHEMA)
+            logger.info(f"[OUTBOX] Opened {self.path}")
+        return self._conn
+    
+    def record(
+        self,
+        chat_id: Any,
+        text: str,
+        source: str,
+        key: Optional[str] = None,
+        acks: Optional[Dict[str, Optional[str]]] = None,
+        member_keys: Optional[List[str]] = None,
+        **options: Any
+    ) -> Optional[int]:
+        """
+        Записать намерение отправить сообщение
+        
+        Args:
+            chat_id: ID чата
+            text: Текст сообщения
+            source: Источник (queue, digest, reminder, ...)
+            key: Ключ отправки; если запись с таким ключом уже есть, сообщение не записывается
+                повторно: неудачная запись переиспользуется для новой попытки, а у отправленной
+                обновляются уведомления для отметки (их снова арендовали - отмечаем с новым токеном)
+            acks: Уведомления очереди, которые отметить отправленными после отправки
+                (ID -> токен аренды)
+            member_keys: Ключи частей сообщения (например, уведомлений дайджеста); если хотя бы
+                одна часть уже отправлена или отправляется, сообщение не записывается. Ключи
+                не зависят от того, как части сгруппированы в сообщения
+            **options: Параметры send_message
+        
+        Returns:
+            ID записи для отправки или None, если сообщение с таким ключом (или одна из
+            его частей) уже отправлено или отправляется
+        """
+        now = time.time()
+        encoded_acks = json.dumps(acks) if acks else None
+        with self._lock:
+            db = self._db()
+            if member_keys and self._key_statuses(db, member_keys):
+                return None
+            try:
+                cursor = db.execute(
+                    "INSERT INTO sends (key, source, chat_id, text, options, acks, status, created_at, updated_at) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    (key, source, str(chat_id), text, _encode_options(options), encoded_acks, STATUS_PENDING, now, now)
+                )
+                if member_keys:
+                    # Ключ неудачной прошлой попытки переходит к новой записи
+                    db.executemany(
+                        "INSERT OR REPLACE INTO send_keys (key, send_id) VALUES (?, ?)",
+                        [(member_key, cursor.lastrowid) for member_key in member_keys]
+                    )
+                return cursor.lastrowid
+            except sqlite3.IntegrityError:
+                existing = db.execute("SELECT id, status FROM sends WHERE key = ?", (key,)).fetchone()
+                if existing is None:
+                    return None
+                if existing['status'] == STATUS_FAILED:
+                    # Прошлая попытка не удалась - повторяем отправку той же записью
+                    db.execute(
+                        "UPDATE sends SET source = ?, chat_id = ?, text = ?, options = ?, acks = ?, status = ?, "
+                        "error = NULL, ack_attempts = 0, acked = 0, updated_at = ? WHERE id = ?",
+                        (source, str(chat_id), text, _encode_options(options), encoded_acks, STATUS_PENDING, now, existing['id'])
+                    )
+                    return existing['id']
+                if existing['status'] == STATUS_SENT and acks:
+                    # Уже отправлено, а уведомления снова в очереди (отметка не дошла) -
+                    # отмечаем их с токеном текущей аренды
+                    db.execute(
+                        "UPDATE sends SET acks = ?, ack_attempts = 0, acked = 0, updated_at = ? WHERE id = ?",
+                        (encoded_acks, now, existing['id'])
+                    )
+                return None
+    
+    @staticmethod
+    def _key_statuses(db: sqlite3.Connection, keys: List[str]) -> Dict[str, str]:
+        """Ключи частей, уже отправленных или отправляемых -> статус их записи"""
+        statuses = {}
+        for start in range(0, len(keys), 500):
+            chunk = keys[start:start + 500]
+            rows = db.execute(
+                "SELECT send_keys.key, sends.status FROM send_keys JOIN sends ON sends.id = send_keys.send_id "
+                f"WHERE sends.status != ? AND send_keys.key IN ({','.join('?' * len(chunk))})",
+                (STATUS_FAILED, *chunk)
+            ).fetchall()
+            statuses.update((row['key'], row['status']) for row in rows)
+        return statuses
+    
+    def key_statuses(self, keys: List[str]) -> Dict[str, str]:
+        """
+        Статусы частей сообщений по ключам (member_keys в record)
+        
+        Returns:
+            Ключ -> STATUS_SENT или STATUS_PENDING; ключей без записи или с неудачной
+            записью в результате нет
+        """
+        if not keys:
+            return {}
+        with self._lock:
+            return self._key_statuses(self._db(), keys)
+    
+    def _set_status(self, row_id: int, status: str, error: Optional[str] = None) -> None:
+        with self._lock:
+            self._db().execute(
+                "UPDATE sends SET status = ?, error = ?, updated_at = ? WHERE id = ?",
+                (status, error, time.time(), row_id)
+            )
+    
+    async def deliver(self, bot, row_id: int, chat_id: Any, text: str, **options: Any):
+        """Отправить записанное сообщение и отметить результат в журнале"""
+        try:
+            result = await send_dispatcher.send(bot, chat_id, text, **options)
+        except Exception as e:
+            self._set_status(row_id, STATUS_FAILED, str(e))
+            raise
+        self._set_status(row_id, STATUS_SENT)
+        return result
+    
+    def submit(
+        self,
+        bot,
+        chat_id: Any,
+        text: str,
+        source: str,
+        key: Optional[str] = None,
+        member_keys: Optional[List[str]] = None,
+        **options: Any
+    ) -> Optional['asyncio.Future']:
+        """
+        Записать и поставить сообщение в отправку
+        
+        Returns:
+            Future с отправленным сообщением или None, если сообщение с таким ключом уже отправлялось
+        """
+        row_id = self.record(chat_id, text, source, key=key, member_keys=member_keys, **options)
+        if row_id is None:
+            logger.info(f"[OUTBOX] Send {key or member_keys} already recorded, skipping")
+            return None
+        return asyncio.ensure_future(self.deliver(bot, row_id, chat_id, text, **options))
+    
+    def _rows(self, query: str, params: tuple = ()) -> List[sqlite3.Row]:
+        with self._lock:
+            return self._db().execute(query, params).fetchall()
+    
+    async def replay(self, bot) -> int:
+        """Повторить отправки, не завершенные до перезапуска бота"""
+        rows = self._rows("SELECT * FROM sends WHERE status = ? ORDER BY id", (STATUS_PENDING,))
+        if not rows:
+            return 0
+        logger.info(f"[OUTBOX] Replaying {len(rows)} unfinished sends")
+        sends = []
+        for row in rows:
+            options = _decode_options(row['options'], bot)
+            sends.append((row, asyncio.ensure_future(self.deliver(bot, row['id'], row['chat_id'], row['text'], **options))))
+        for row, send_future in sends:
+            try:
+                await send_future
+            except Exception as e:
+                logger.error(f"[OUTBOX] Replay of send {row['id']} to {row['chat_id']} failed: {e}")
+        return len(rows)
+    
+    def flush_acks(self) -> int:
+        """Отметить в Firebase уведомления отправленных сообщений (одной пачкой)"""
+        rows = self._rows(
+            "SELECT id, acks FROM sends WHERE status = ? AND acked = 0 AND acks IS NOT NULL ORDER BY id",
+            (STATUS_SENT,)
+        )
+        if not rows:
+            return 0
+        row_acks = {row['id']: json.loads(row['acks']) for row in rows}
+        acks: Dict[str, Optional[str]] = {}
+        for item_acks in row_acks.values():
+            acks.update(item_acks)
+        
+        acked = ack_notifications_sent(acks)
+        now = time.time()
+        with self._lock:
+            db = self._db()
+            for row_id, item_acks in row_acks.items():
+                if set(item_acks) <= acked:
+                    db.execute("UPDATE sends SET acked = 1, updated_at = ? WHERE id = ?", (now, row_id))
+                else:
+                    db.execute(
+                        "UPDATE sends SET ack_attempts = ack_attempts + 1, acked = ack_attempts + 1 >= ?, updated_at = ? WHERE id = ?",
+                        (MAX_ACK_ATTEMPTS, now, row_id)
+                    )
+        return len(acked)
+    
+    def cleanup(self, days: int = config.OUTBOX_RETENTION_DAYS) -> int:
+        """Удалить завершенные записи старше days дней"""
+        cutoff = time.time() - days * 86400
+        with self._lock:
+            db = self._db()
+            cursor = db.execute(
+                "DELETE FROM sends WHERE updated_at < ? AND (status = ? OR (status = ? AND (acked = 1 OR acks IS NULL)))",
+                (cutoff, STATUS_FAILED, STATUS_SENT)
+            )
+            db.execute("DELETE FROM send_keys WHERE send_id NOT IN (SELECT id FROM sends)")
+            return cursor.rowcount
+
+# Создаем экземпляр журнала
+outbox = Outbox()
@@ -0,0 +1,51 @@
+"""
+Адаптивный интервал периодической проверки
+Пока в очереди есть необработанные уведомления или недавно что-то происходило,
+стадия проверки запускается с минимальным интервалом; в простое интервал растет
+экспоненциально до максимального
+"""
+import logging
+import config
+
+logger = logging.getLogger(__name__)
+
+class AdaptiveInterval:
+    """Интервал до следующей проверки по результату предыдущей"""
+    
+    def __init__(
+        self,
+        min_seconds: float = config.PERIODIC_CHECK_MIN_INTERVAL,
+        max_seconds: float = config.PERIODIC_CHECK_MAX_INTERVAL,
+        backoff: float = config.PERIODIC_CHECK_BACKOFF
+    ):
+        self.min_seconds = min_seconds
+        self.max_seconds = max(min_seconds, max_seconds)
+        self.backoff = backoff
+        self.current = min_seconds
+        self._woken = False
+    
+    def next_delay(self, activity: int = 0, backlog: bool = False) -> float:
+        """
+        Интервал до следующей проверки
+        
+        Args:
+            activity: Сколько событий обработала проверка (уведомления, новые задачи, сделки)
+            backlog: Осталась ли необработанная работа (очередь не разобрана, дайджесты ждут отправки)
+        """
+        if backlog or activity or self._woken:
+            self.current = self.min_seconds
+        else:
+            self.current = min(self.max_seconds, self.current * self.backoff)
+        self._woken = False
+        logger.debug(f"[PERIODIC] Next check in {self.current:.1f}s (activity={activity}, backlog={backlog})")
+        return self.current
+    
+    def wake(self) -> bool:
+        """
+        Отметить активность пользователей: следующая проверка - через минимальный интервал
+        
+        Returns:
+            True, если уже запланированную проверку нужно перенести на более раннее время
+        """
+        self._woken = True
+        return self.current > self.min_seconds
@@ -0,0 +1,100 @@
+"""
+Кэш отрисованных сообщений
+Текст и клавиатура сообщения о сущности хранятся по ключу
+(шаблон, ID, updatedAt, версия резолвера) и пересчитываются только после изменения
+сущности или связанных с ней справочников; старые записи вытесняются по LRU
+"""
+import logging
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Dict, Any, Optional, Tuple, Callable, Hashable
+from telegram import InlineKeyboardMarkup
+import config
+from entity_resolver import EntityResolver
+from messages import format_task_message, format_deal_message, format_meeting_message, format_document_message
+from keyboards import get_task_menu, get_deal_menu
+
+logger = logging.getLogger(__name__)
+
+@dataclass(frozen=True)
+class RenderedMessage:
+    """Готовое сообщение: текст и клавиатура (None - без клавиатуры)"""
+    text: str
+    reply_markup: Optional[InlineKeyboardMarkup] = None
+
+class RenderCache:
+    """LRU-кэш отрисованных сообщений"""
+    
+    def __init__(self, max_size: int = config.RENDER_CACHE_SIZE):
+        self.max_size = max_size
+        self._items: 'OrderedDict[Hashable, RenderedMessage]' = OrderedDict()
+        self._lock = threading.Lock()
+    
+    def get_or_render(self, template: str, entity: Dict[str, Any], resolver: EntityResolver,
+                      render: Callable[[], RenderedMessage]) -> RenderedMessage:
+        """
+        Получить сообщение из кэша или отрисовать его
+        
+        Args:
+            template: Имя шаблона (одна сущность может отрисовываться по-разному)
+            entity: Документ сущности
+            resolver: Резолвер, которым отрисовывается сообщение
+            render: Функция отрисовки
+        """
+        updated_at = entity.get('updatedAt')
+        if not updated_at:
+            # Без updatedAt нельзя понять, изменилась ли сущность - не кэшируем
+            return render()
+        
+        key: Tuple = (template, entity.get('id'), updated_at, resolver.version)
+        with self._lock:
+            rendered = self._items.get(key)
+            if rendered is not None:
+                self._items.move_to_end(key)
+                return rendered
+        
+        rendered = render()
+        with self._lock:
+            self._items[key] = rendered
+            self._items.move_to_end(key)
+            while len(self._items) > self.max_size:
+                self._items.popitem(last=False)
+        return rendered
+
+# Создаем экземпляр кэша
+render_cache = RenderCache()
+
+def render_task(task: Dict[str, Any], resolver: EntityResolver, with_menu: bool = True) -> RenderedMessage:
+    """Сообщение о задаче (с меню задачи для личного чата, без меню для группы)"""
+    return render_cache.get_or_render(
+        'task_menu' if with_menu else 'task', task, resolver,
+        lambda: RenderedMessage(
+            format_task_message(task, resolver),
+            get_task_menu(task.get('id')) if with_menu else None
+        )
+    )
+
+def render_deal(deal: Dict[str, Any], resolver: EntityResolver, with_menu: bool = True) -> RenderedMessage:
+    """Сообщение о сделке (с меню сделки для личного чата, без меню для группы)"""
+    return render_cache.get_or_render(
+        'deal_menu' if with_menu else 'deal', deal, resolver,
+        lambda: RenderedMessage(
+            format_deal_message(deal, resolver),
+            get_deal_menu(deal.get('id')) if with_menu else None
+        )
+    )
+
+def render_meeting(meeting: Dict[str, Any], resolver: EntityResolver) -> RenderedMessage:
+    """Сообщение о встрече"""
+    return render_cache.get_or_render(
+        'meeting', meeting, resolver,
+        lambda: RenderedMessage(format_meeting_message(meeting, resolver))
+    )
+
+def render_document(document: Dict[str, Any], resolver: EntityResolver) -> RenderedMessage:
+    """Сообщение о документе"""
+    return render_cache.get_or_render(
+        'document', document, resolver,
+        lambda: RenderedMessage(format_document_message(document, resolver))
+    )
@@ -10,11 +10,17 @@ except ImportError:
     from apscheduler.triggers.cron import CronTrigger
 from apscheduler.triggers.cron import CronTrigger
 from datetime import datetime
+import asyncio
 import pytz
 import config
 from firebase_client import firebase
-from notifications import get_daily_reminder_message, get_weekly_report_message, get_successful_deal_message, get_group_daily_summary
+from notifications import iter_daily_reminders, get_weekly_report_message, get_group_daily_summary
+from send_dispatcher import send_dispatcher
+from outbox import outbox
 from deals import get_won_deals_today
+from job_runner import job_runner
+from collection_store import get_store
+from meeting_reminders import MeetingReminderScheduler
 
 class TaskScheduler:
     """Планировщик задач для бота"""
@@ -22,7 +28,11 @@ class TaskScheduler:
     def __init__(self, bot_instance):
         self.bot = bot_instance
         self.scheduler = AsyncIOScheduler(timezone=pytz.timezone(config.DEFAULT_TIMEZONE))
+        # Статистика запусков ведется по ID задач (как в guard), напоминания о встречах - одной строкой
+        job_runner.attach(self.scheduler, key=lambda job: job.id.split(':')[0])
         self.setup_jobs()
+        # Напоминания о встречах - разовые задачи этого же планировщика
+        self.meeting_reminders = MeetingReminderScheduler(self.scheduler, bot_instance, get_store('meetings'), get_store('users'))
     
     def setup_jobs(self):
         """Настроить задачи планировщика"""
@@ -50,31 +60,32 @@ class TaskScheduler:
             name='Еженедельный отчет'
         )
     
+    @job_runner.guard('daily_reminder')
     async def send_daily_reminders(self):
         """Отправить ежедневные напоминания всем пользователям"""
         try:
             users = firebase.get_all('users')
-            for user in users:
-                if user.get('isArchived'):
-                    continue
-                
-                # Получаем telegram_user_id из настроек пользователя
-                telegram_user_id = user.get('telegramUserId')
-                if not telegram_user_id:
-                    continue
-                
-                message = get_daily_reminder_message(user.get('id'))
-                if message:
-                    try:
-                        await self.bot.send_message(
-                            chat_id=telegram_user_id,
-                            text=message
-                        )
-                    except Exception as e:
-                        print(f"Error sending daily reminder to {telegram_user_id}: {e}")
+            # Задачи загружаются один раз на всех, напоминания отправляются по мере готовности
+            # Напоминание записывается в журнал отправок с ключом на день: после перезапуска
+            # недоставленные напоминания отправятся, а уже отправленные не повторятся
+            today = datetime.now(pytz.timezone(config.DEFAULT_TIMEZONE)).date().isoformat()
+            sends = []
+            for telegram_user_id, message in iter_daily_reminders(users):
+                send_future = outbox.submit(self.bot, telegram_user_id, message, 'reminder', key=f"reminder:{today}:{telegram_user_id}")
+                if send_future is not None:
+                    sends.append((telegram_user_id, send_future))
+                # Даем диспетчеру начать отправку, пока готовятся следующие напоминания
+                await asyncio.sleep(0)
+            
+            for telegram_user_id, send_future in sends:
+                try:
+                    await send_future
+                except Exception as e:
+                    print(f"Error sending daily reminder to {telegram_user_id}: {e}")
         except Exception as e:
             print(f"Error in send_daily_reminders: {e}")
     
+    @job_runner.guard('group_daily_summary')
     async def send_group_daily_summary(self):
         """Отправить ежедневную сводку в групповой чат"""
         try:
@@ -97,11 +108,7 @@ class TaskScheduler:
             message = get_group_daily_summary()
             if message:
                 try:
-                    await self.bot.send_message(
-                        chat_id=telegram_chat_id,
-                        text=message,
-                        parse_mode='HTML'
-                    )
+                    await send_dispatcher.send(self.bot, telegram_chat_id, message, parse_mode='HTML')
                     print(f"Group daily summary sent to {telegram_chat_id}")
                 except Exception as e:
                     print(f"Error sending group daily summary to {telegram_chat_id}: {e}")
@@ -110,6 +117,7 @@ class TaskScheduler:
         except Exception as e:
             print(f"Error in send_group_daily_summary: {e}")
     
+    @job_runner.guard('weekly_report')
     async def send_weekly_report(self):
         """Отправить еженедельный отчет в групповой чат"""
         try:
@@ -125,10 +133,7 @@ class TaskScheduler:
             message = get_weekly_report_message()
             if message:
                 try:
-                    await self.bot.send_message(
-                        chat_id=telegram_chat_id,
-                        text=message
-                    )
+                    await send_dispatcher.send(self.bot, telegram_chat_id, message)
                 except Exception as e:
                     print(f"Error sending weekly report to {telegram_chat_id}: {e}")
         except Exception as e:
@@ -137,6 +142,7 @@ class TaskScheduler:
     def start(self):
         """Запустить планировщик"""
         self.scheduler.start()
+        self.meeting_reminders.start()
         print("Task scheduler started")
     
     def stop(self):
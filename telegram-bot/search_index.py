@@ -0,0 +1,199 @@
+"""
+Поиск по сделкам и клиентам CRM
+Имена и компании нормализуются (нижний регистр, кириллица -> латиница, похожие буквы
+сводятся к одной), телефоны - к цифрам; по нормализованным строкам строится индекс
+n-грамм, который обновляется по изменениям кэша коллекции
+"""
+import logging
+import math
+from typing import Dict, Any, List, Optional, Set, Tuple, Callable
+from collection_store import CollectionStore, get_store
+
+logger = logging.getLogger(__name__)
+
+NGRAM_SIZE = 3
+# Запрос с таким количеством цифр (и почти без букв) ищется как телефон
+MIN_PHONE_DIGITS = 4
+# Нечеткое совпадение: доля n-грамм запроса, которые должны найтись в строке
+MIN_FUZZY_SCORE = 0.6
+DEFAULT_SEARCH_LIMIT = 20
+
+CYRILLIC_TO_LATIN = {
+    'а': 'a', 'б': 'b', 'в': 'v', 'г': 'g', 'д': 'd', 'е': 'e', 'ё': 'yo', 'ж': 'j',
+    'з': 'z', 'и': 'i', 'й': 'y', 'к': 'k', 'л': 'l', 'м': 'm', 'н': 'n', 'о': 'o',
+    'п': 'p', 'р': 'r', 'с': 's', 'т': 't', 'у': 'u', 'ф': 'f', 'х': 'x', 'ц': 'ts',
+    'ч': 'ch', 'ш': 'sh', 'щ': 'sh', 'ъ': '', 'ы': 'i', 'ь': '', 'э': 'e', 'ю': 'yu',
+    'я': 'ya', 'ў': 'o', 'қ': 'q', 'ғ': 'g', 'ҳ': 'h',
+}
+
+# Варианты латинского написания, которые считаем одинаковыми (Toshkent / Tashkent, Khan / Xan)
+LATIN_FOLDS = (
+    ("o'", 'o'), ("g'", 'g'), ('oʻ', 'o'), ('gʻ', 'g'),
+    ('kh', 'x'), ('ts', 'c'), ('zh', 'j'), ('dj', 'j'),
+    ('w', 'v'), ('q', 'k'), ('h', 'x'), ('y', 'i'),
+)
+
+def normalize_phone(text: str) -> str:
+    """Только цифры телефона"""
+    return ''.join(ch for ch in (text or '') if ch.isdigit())
+
+def normalize_text(text: str) -> str:
+    """Строка для поиска: латиница в нижнем регистре, слова через один пробел"""
+    text = (text or '').lower()
+    text = ''.join(CYRILLIC_TO_LATIN.get(ch, ch) for ch in text)
+    for src, dst in LATIN_FOLDS:
+        text = text.replace(src, dst)
+    text = ''.join(ch if ch.isalnum() else ' ' for ch in text)
+    return ' '.join(text.split())
+
+def _ngrams(text: str, for_query: bool = False) -> Set[str]:
+    """
+    n-граммы слов строки
+    
+    Для коротких слов запроса n-грамм нет, поэтому у документа индексируются
+    и начала слов ('^a', '^al'), а короткое слово запроса ищется как начало слова
+    """
+    grams = set()
+    for word in text.split():
+        if len(word) < NGRAM_SIZE:
+            if for_query:
+                grams.add('^' + word)
+            else:
+                grams.add(word)
+        else:
+            grams.update(word[i:i + NGRAM_SIZE] for i in range(len(word) - NGRAM_SIZE + 1))
+        if not for_query:
+            grams.update('^' + word[:k] for k in range(1, min(len(word), NGRAM_SIZE - 1) + 1))
+    return grams
+
+def _looks_like_phone(query: str) -> bool:
+    digits = normalize_phone(query)
+    letters = sum(1 for ch in query if ch.isalpha())
+    return len(digits) >= MIN_PHONE_DIGITS and letters == 0
+
+class SearchIndex:
+    """Индекс n-грамм по текстовым полям и телефонам документов одной коллекции"""
+    
+    def __init__(self, store: CollectionStore, text_fields: Tuple[str, ...], phone_fields: Tuple[str, ...] = (),
+                 include: Optional[Callable[[Dict[str, Any]], bool]] = None):
+        self.store = store
+        self.text_fields = text_fields
+        self.phone_fields = phone_fields
+        self.include = include or (lambda doc: not doc.get('isArchived', False))
+        # ID документа -> нормализованные значения полей / телефоны
+        self._texts: Dict[str, List[str]] = {}
+        self._phones: Dict[str, List[str]] = {}
+        self._grams: Dict[str, Set[str]] = {}
+        self._phone_grams: Dict[str, Set[str]] = {}
+        store.subscribe(self._on_change, replay=True)
+    
+    def _on_change(self, old: Optional[Dict[str, Any]], new: Optional[Dict[str, Any]]) -> None:
+        doc_id = (new or old).get('id')
+        self._remove(doc_id)
+        if new and self.include(new):
+            self._add(new)
+    
+    def _add(self, doc: Dict[str, Any]) -> None:
+        doc_id = doc['id']
+        texts = [normalize_text(str(doc.get(f) or '')) for f in self.text_fields]
+        texts = [t for t in texts if t]
+        phones = [normalize_phone(str(doc.get(f) or '')) for f in self.phone_fields]
+        phones = [p for p in phones if p]
+        if texts:
+            self._texts[doc_id] = texts
+            for gram in _ngrams(' '.join(texts)):
+                self._grams.setdefault(gram, set()).add(doc_id)
+        if phones:
+            self._phones[doc_id] = phones
+            for gram in _ngrams(' '.join(phones)):
+                self._phone_grams.setdefault(gram, set()).add(doc_id)
+    
+    def _remove(self, doc_id: str) -> None:
+        for values, index in ((self._texts, self._grams), (self._phones, self._phone_grams)):
+            old_values = values.pop(doc_id, None)
+            if not old_values:
+                continue
+            for gram in _ngrams(' '.join(old_values)):
+                bucket = index.get(gram)
+                if bucket is not None:
+                    bucket.discard(doc_id)
+                    if not bucket:
+                        del index[gram]
+    
+    @staticmethod
+    def _fuzzy_candidates(postings: List[Set[str]]) -> Dict[str, int]:
+        """
+        ID документов -> сколько n-грамм запроса в них нашлось
+        
+        Документ, в котором есть хотя бы MIN_FUZZY_SCORE n-грамм, обязательно есть
+        в одном из самых коротких списков, поэтому кандидаты берутся только из них
+        """
+        required = max(1, math.ceil(MIN_FUZZY_SCORE * len(postings)))
+        seeds = set()
+        for posting in postings[:len(postings) - required + 1]:
+            seeds.update(posting)
+        return {doc_id: sum(1 for posting in postings if doc_id in posting) for doc_id in seeds}
+    
+    @staticmethod
+    def _text_rank(query: str, values: List[str]) -> Optional[int]:
+        """0 - поле совпало целиком, 1 - слово начинается с запроса, 2 - подстрока"""
+        best = None
+        for value in values:
+            if value == query:
+                return 0
+            if value.startswith(query) or f" {query}" in value:
+                best = 1
+            elif query in value and best is None:
+                best = 2
+        return best
+    
+    def search(self, query: str, limit: int = DEFAULT_SEARCH_LIMIT) -> List[Dict[str, Any]]:
+        """
+        Найти документы, отсортированные по качеству совпадения
+        
+        Args:
+            query: Строка поиска (имя, компания, название или телефон)
+            limit: Максимальное количество результатов
+        """
+        self.store.ensure_fresh()
+        if _looks_like_phone(query):
+            key, values, index = normalize_phone(query), self._phones, self._phone_grams
+        else:
+            key, values, index = normalize_text(query), self._texts, self._grams
+        if not key:
+            return []
+        
+        grams = _ngrams(key, for_query=True)
+        ranked = []
+        with self.store.lock:
+            postings = sorted((index.get(gram, set()) for gram in grams), key=len)
+            # Документы со всеми n-граммами запроса (пересечение начиная с самого короткого списка)
+            matched = set(postings[0]).intersection(*postings[1:]) if postings[0] else set()
+            for doc_id in matched:
+                doc_values = values.get(doc_id, [])
+                rank = self._text_rank(key, doc_values)
+                ranked.append((3 if rank is None else rank, -1.0, min(len(v) for v in doc_values), doc_id))
+            
+            if not ranked:
+                # Точных совпадений нет - ищем похожие (опечатки, другой порядок слов)
+                for doc_id, hits in self._fuzzy_candidates(postings).items():
+                    score = hits / len(postings)
+                    if score >= MIN_FUZZY_SCORE:
+                        ranked.append((3, -score, min(len(v) for v in values.get(doc_id, [''])), doc_id))
+            
+            ranked.sort()
+            return [self.store.peek(doc_id) for _, _, _, doc_id in ranked[:limit]]
+
+_indexes: Dict[str, SearchIndex] = {}
+
+def get_deal_search() -> SearchIndex:
+    """Поиск по активным сделкам (название, контакт)"""
+    if 'deals' not in _indexes:
+        _indexes['deals'] = SearchIndex(get_store('deals'), ('title', 'contactName', 'telegramUsername'))
+    return _indexes['deals']
+
+def get_client_search() -> SearchIndex:
+    """Поиск по активным клиентам (имя, компания, контактное лицо, телефон)"""
+    if 'clients' not in _indexes:
+        _indexes['clients'] = SearchIndex(get_store('clients'), ('name', 'companyName', 'contactPerson'), ('phone',))
+    return _indexes['clients']
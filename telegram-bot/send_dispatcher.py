@@ -0,0 +1,149 @@
+"""
+Отправка сообщений в Telegram с ограничением скорости
+Сообщения отправляются параллельно (не больше SEND_CONCURRENCY одновременно),
+с учетом общих лимитов Telegram и лимитов на один чат / группу (token bucket).
+На RetryAfter чат ставится на паузу на указанное время, и отправка повторяется
+"""
+import asyncio
+import logging
+import time
+from datetime import timedelta
+from typing import Dict, Any, Optional, Union
+from telegram.error import RetryAfter, BadRequest, Forbidden, ChatMigrated
+import config
+
+logger = logging.getLogger(__name__)
+
+ChatId = Union[int, str]
+
+# Сколько секунд чат должен простаивать, чтобы его состояние можно было забыть
+IDLE_CHAT_SECONDS = 300
+
+class TokenBucket:
+    """Token bucket: rate токенов в секунду, не больше capacity подряд"""
+    
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._blocked_until = 0.0
+    
+    def reserve(self) -> float:
+        """Занять токен; возвращает, сколько секунд нужно подождать перед отправкой"""
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+        self._tokens -= 1
+        wait = -self._tokens / self.rate if self._tokens < 0 else 0.0
+        return max(wait, self._blocked_until - now)
+    
+    def block(self, seconds: float) -> None:
+        """Не выдавать токены ближайшие seconds секунд (ответ RetryAfter)"""
+        self._blocked_until = max(self._blocked_until, time.monotonic() + seconds)
+    
+    def is_idle(self, seconds: float) -> bool:
+        return time.monotonic() - self._updated > seconds and time.monotonic() > self._blocked_until
+
+class _ChatState:
+    def __init__(self, bucket: TokenBucket):
+        self.bucket = bucket
+        # Сообщения в один чат уходят по очереди, в порядке постановки
+        self.lock = asyncio.Lock()
+
+def _is_group_chat(chat_id: ChatId) -> bool:
+    return str(chat_id).startswith('-')
+
+def is_permanent_send_error(error: BaseException) -> bool:
+    """
+    Ошибка отправки, которая не исправится повтором: бот заблокирован или удален из чата
+    (Forbidden), чат не найден / неверный текст сообщения (BadRequest), группа стала супергруппой
+    """
+    return isinstance(error, (Forbidden, BadRequest, ChatMigrated))
+
+def _retry_after_seconds(error: RetryAfter) -> float:
+    retry_after = error.retry_after
+    if isinstance(retry_after, timedelta):
+        return retry_after.total_seconds()
+    return float(retry_after)
+
+class SendDispatcher:
+    """Параллельная отправка сообщений с лимитами Telegram"""
+    
+    def __init__(
+        self,
+        concurrency: int = config.SEND_CONCURRENCY,
+        global_rate: float = config.SEND_GLOBAL_RATE,
+        chat_rate: float = config.SEND_CHAT_RATE,
+        group_rate_per_minute: float = config.SEND_GROUP_RATE_PER_MINUTE,
+        max_retries: int = config.SEND_MAX_RETRIES
+    ):
+        self.concurrency = concurrency
+        self.chat_rate = chat_rate
+        self.group_rate = group_rate_per_minute / 60
+        self.max_retries = max_retries
+        self._global = TokenBucket(global_rate, global_rate)
+        self._chats: Dict[str, _ChatState] = {}
+        self._semaphore: Optional[asyncio.Semaphore] = None
+    
+    def _chat_state(self, chat_id: ChatId) -> _ChatState:
+        key = str(chat_id)
+        state = self._chats.get(key)
+        if state is None:
+            if len(self._chats) > 1000:
+                self._forget_idle_chats()
+            if _is_group_chat(chat_id):
+                bucket = TokenBucket(self.group_rate, 3)
+            else:
+                bucket = TokenBucket(self.chat_rate, 1)
+            state = _ChatState(bucket)
+            self._chats[key] = state
+        return state
+    
+    def _forget_idle_chats(self) -> None:
+        for key in [k for k, s in self._chats.items() if not s.lock.locked() and s.bucket.is_idle(IDLE_CHAT_SECONDS)]:
+            del self._chats[key]
+    
+    def submit(self, bot, chat_id: ChatId, text: str, **kwargs: Any) -> 'asyncio.Future':
+        """
+        Поставить сообщение в отправку
+        
+        Args:
+            bot: telegram.Bot
+            chat_id: ID чата
+            text: Текст сообщения
+            **kwargs: Остальные параметры send_message (parse_mode, reply_markup, ...)
+        
+        Returns:
+            Future с отправленным сообщением (или с исключением, если отправить не удалось)
+        """
+        return asyncio.ensure_future(self._send(bot, chat_id, text, **kwargs))
+    
+    async def send(self, bot, chat_id: ChatId, text: str, **kwargs: Any):
+        """Отправить сообщение и дождаться результата"""
+        return await self.submit(bot, chat_id, text, **kwargs)
+    
+    async def _send(self, bot, chat_id: ChatId, text: str, **kwargs: Any):
+        if self._semaphore is None:
+            # Семафор создается внутри цикла событий, в котором работает бот
+            self._semaphore = asyncio.Semaphore(self.concurrency)
+        
+        state = self._chat_state(chat_id)
+        async with state.lock:
+            attempt = 0
+            while True:
+                await asyncio.sleep(state.bucket.reserve())
+                await asyncio.sleep(self._global.reserve())
+                try:
+                    async with self._semaphore:
+                        return await bot.send_message(chat_id=chat_id, text=text, **kwargs)
+                except RetryAfter as e:
+                    attempt += 1
+                    retry_after = _retry_after_seconds(e)
+                    state.bucket.block(retry_after)
+                    if attempt > self.max_retries:
+                        raise
+                    logger.warning(f"[SEND] RetryAfter {retry_after}s for chat {chat_id}, attempt {attempt}")
+
+# Создаем экземпляр диспетчера
+send_dispatcher = SendDispatcher()
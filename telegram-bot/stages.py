@@ -0,0 +1,147 @@
+"""
+Стадии периодической обработки
+Каждая стадия - отдельная задача JobQueue со своим интервалом: источник стадии собирает
+элементы работы и кладет их в очередь asyncio, которую параллельно разбирают обработчики
+(не больше concurrency одновременно). Медленная стадия не задерживает остальные.
+Интервал стадии подстраивается под полезную работу запуска (activity), которую сообщают
+источник и обработчики, а не под число элементов (элемент может не дать никакой работы).
+По каждой стадии считаются пропускная способность и задержка элементов
+(от постановки в очередь до окончания обработки)
+"""
+import asyncio
+import logging
+import time
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Any, Awaitable, Callable, List, Optional
+from poll_interval import AdaptiveInterval
+from job_runner import job_runner
+
+logger = logging.getLogger(__name__)
+
+@dataclass
+class StageRun:
+    """Результат источника стадии"""
+    items: List[Any] = field(default_factory=list)
+    # Полезная работа самого источника (обработчики добавляют свою, возвращая число)
+    activity: int = 0
+    # Осталась работа на следующий запуск (стадия запустится через минимальный интервал)
+    backlog: bool = False
+
+@dataclass
+class StageStats:
+    """Пропускная способность и задержка элементов стадии"""
+    items: int = 0
+    failures: int = 0
+    total_latency: float = 0.0
+    max_latency: float = 0.0
+    started: float = field(default_factory=time.monotonic)
+    
+    def record(self, latency: float, ok: bool) -> None:
+        self.items += 1
+        if not ok:
+            self.failures += 1
+        self.total_latency += latency
+        self.max_latency = max(self.max_latency, latency)
+    
+    @property
+    def throughput(self) -> float:
+        """Элементов в минуту с момента запуска"""
+        elapsed = time.monotonic() - self.started
+        return self.items * 60 / elapsed if elapsed > 0 else 0.0
+    
+    def summary(self) -> str:
+        avg_latency = self.total_latency / self.items if self.items else 0.0
+        return (
+            f"items={self.items} failures={self.failures} throughput={self.throughput:.1f}/min "
+            f"latency avg {avg_latency:.2f}s, max {self.max_latency:.2f}s"
+        )
+
+class Stage:
+    """Стадия: периодический источник -> очередь asyncio -> обработчики"""
+    
+    def __init__(
+        self,
+        name: str,
+        produce: Callable[[], Awaitable[StageRun]],
+        handle: Callable[[Any, Any], Awaitable[Optional[int]]],
+        interval: AdaptiveInterval,
+        concurrency: int = 1
+    ):
+        """
+        Args:
+            name: Имя стадии (имя задачи JobQueue и статистики job_runner)
+            produce: Источник: элементы работы на этот запуск
+            handle: Обработчик одного элемента (bot, элемент); возвращает полезную работу
+                (например, число отправленных уведомлений) или None
+            interval: Интервал между запусками (для постоянного интервала min = max)
+            concurrency: Сколько элементов обрабатывать одновременно
+        """
+        self.name = name
+        self.produce = produce
+        self.handle = handle
+        self.interval = interval
+        self.concurrency = concurrency
+        self.stats = StageStats()
+        self._queue: Optional[asyncio.Queue] = None
+        self._workers: List[asyncio.Task] = []
+        # Полезная работа обработчиков в текущем запуске
+        self._handled_activity = 0
+        self._job = None
+        self.run = job_runner.guard(name)(self._run)
+    
+    def schedule(self, job_queue, delay: float) -> None:
+        """Запланировать следующий запуск стадии через delay секунд"""
+        self._job = job_queue.run_once(self.run, when=delay, name=self.name)
+    
+    def wake(self, job_queue) -> None:
+        """Появилась работа: запустить стадию через минимальный интервал"""
+        if not self.interval.wake() or job_runner.is_running(self.name):
+            # Идущий запуск сам запланирует следующий с минимальным интервалом
+            return
+        job = self._job
+        next_t = job.next_t if job else None
+        if next_t and (next_t - datetime.now(next_t.tzinfo)).total_seconds() > self.interval.min_seconds:
+            job.schedule_removal()
+            self.schedule(job_queue, self.interval.min_seconds)
+    
+    def _start_workers(self, bot) -> None:
+        # Очередь и обработчики создаются внутри цикла событий, в котором работает бот
+        if self._queue is None:
+            self._queue = asyncio.Queue()
+        self._workers = [w for w in self._workers if not w.done()]
+        while len(self._workers) < self.concurrency:
+            self._workers.append(asyncio.ensure_future(self._work(bot)))
+    
+    async def _work(self, bot) -> None:
+        while True:
+            queued_at, item = await self._queue.get()
+            ok = True
+            try:
+                self._handled_activity += await self.handle(bot, item) or 0
+            except Exception as e:
+                ok = False
+                logger.error(f"[STAGE] {self.name}: error handling item: {e}", exc_info=True)
+            finally:
+                self.stats.record(time.monotonic() - queued_at, ok)
+                self._queue.task_done()
+    
+    async def _run(self, context) -> None:
+        """Запуск стадии: собрать работу, дождаться обработки, запланировать следующий запуск"""
+        activity = 0
+        backlog = False
+        try:
+            self._start_workers(context.bot)
+            self._handled_activity = 0
+            result = await self.produce()
+            now = time.monotonic()
+            for item in result.items:
+                self._queue.put_nowait((now, item))
+            # Следующий запуск - только после обработки этого (элементы не собираются повторно)
+            await self._queue.join()
+            activity = result.activity + self._handled_activity
+            backlog = result.backlog
+        except Exception as e:
+            logger.error(f"[STAGE] Error in {self.name}: {e}", exc_info=True)
+        finally:
+            self.schedule(context.job_queue, self.interval.next_delay(activity, backlog))
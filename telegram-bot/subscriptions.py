@@ -0,0 +1,45 @@
+"""
+Подписчики уведомлений бота
+Из настроек notificationPrefs/default для каждого типа события собирается множество
+ID пользователей (список telegramUsers); множества перестраиваются по изменениям кэша
+коллекции notificationPrefs, проверка подписки - поиск в множестве
+"""
+import logging
+from typing import Dict, Any, FrozenSet, Optional
+from collection_store import CollectionStore, get_store
+
+logger = logging.getLogger(__name__)
+
+PREFS_DOC_ID = 'default'
+
+class SubscriberRegistry:
+    """ID подписчиков по типам событий"""
+    
+    def __init__(self, store: CollectionStore):
+        self.store = store
+        self._subscribers: Dict[str, FrozenSet[str]] = {}
+        store.subscribe(self._on_change, replay=True)
+    
+    def _on_change(self, old: Optional[Dict[str, Any]], new: Optional[Dict[str, Any]]) -> None:
+        if (new or old).get('id') != PREFS_DOC_ID:
+            return
+        subscribers = {}
+        for event_type, setting in (new or {}).items():
+            if not isinstance(setting, dict) or setting.get('telegramPersonal') is False:
+                continue
+            user_ids = setting.get('telegramUsers')
+            if isinstance(user_ids, list):
+                subscribers[event_type] = frozenset(str(uid) for uid in user_ids if uid)
+        self._subscribers = subscribers
+        logger.info(f"[SUBSCRIPTIONS] Subscribers: { {k: len(v) for k, v in subscribers.items()} }")
+    
+    def subscribers(self, event_type: str) -> FrozenSet[str]:
+        """ID пользователей, подписанных на событие"""
+        self.store.ensure_fresh()
+        return self._subscribers.get(event_type, frozenset())
+    
+    def is_subscribed(self, event_type: str, user_id: str) -> bool:
+        return str(user_id) in self.subscribers(event_type)
+
+# Создаем экземпляр реестра
+subscriber_registry = SubscriberRegistry(get_store('notificationPrefs'))
@@ -0,0 +1,94 @@
+"""
+Индекс активных задач по исполнителям
+Строится поверх кэша коллекции tasks и обновляется по одному документу при изменениях
+"""
+import logging
+from dataclasses import dataclass
+from datetime import date
+from typing import Dict, Any, List, Optional, Set, FrozenSet, Callable
+from collection_store import CollectionStore, get_store
+from tasks import parse_end_date, active_task_user_ids
+
+logger = logging.getLogger(__name__)
+
+@dataclass(frozen=True)
+class TaskEntry:
+    """То, что индекс знает об активной задаче"""
+    task_id: str
+    user_ids: FrozenSet[str]
+    end_date: Optional[date]
+
+# Подписчик получает (ID задачи, старая запись, новая запись); None - задача не активна
+TaskIndexListener = Callable[[str, Optional[TaskEntry], Optional[TaskEntry]], None]
+
+def make_task_entry(task: Optional[Dict[str, Any]]) -> Optional[TaskEntry]:
+    """Запись индекса для активной задачи (tasks.active_task_user_ids) или None"""
+    if not task:
+        return None
+    user_ids = active_task_user_ids(task)
+    if not user_ids:
+        return None
+    
+    try:
+        end_date = parse_end_date(task.get('endDate', ''))
+    except Exception:
+        end_date = None
+    return TaskEntry(task.get('id'), user_ids, end_date)
+
+class TaskIndex:
+    """Активные задачи по исполнителям"""
+    
+    def __init__(self, store: CollectionStore):
+        self.store = store
+        self._entries: Dict[str, TaskEntry] = {}
+        self._by_user: Dict[str, Set[str]] = {}
+        self._listeners: List[TaskIndexListener] = []
+        store.subscribe(self._on_change, replay=True)
+    
+    def subscribe(self, listener: TaskIndexListener) -> None:
+        """Подписаться на изменения записей индекса"""
+        with self.store.lock:
+            self._listeners.append(listener)
+    
+    def _on_change(self, old: Optional[Dict[str, Any]], new: Optional[Dict[str, Any]]) -> None:
+        task_id = (new or old).get('id')
+        old_entry = self._entries.get(task_id)
+        new_entry = make_task_entry(new)
+        if old_entry == new_entry:
+            return
+        
+        if old_entry:
+            del self._entries[task_id]
+            for user_id in old_entry.user_ids:
+                user_tasks = self._by_user.get(user_id)
+                if user_tasks:
+                    user_tasks.discard(task_id)
+        if new_entry:
+            self._entries[task_id] = new_entry
+            for user_id in new_entry.user_ids:
+                self._by_user.setdefault(user_id, set()).add(task_id)
+        
+        for listener in self._listeners:
+            try:
+                listener(task_id, old_entry, new_entry)
+            except Exception as e:
+                logger.error(f"[TASK_INDEX] Listener error: {e}", exc_info=True)
+    
+    def ensure_fresh(self) -> None:
+        self.store.ensure_fresh()
+    
+    def entries(self) -> List[TaskEntry]:
+        """Все активные задачи"""
+        self.ensure_fresh()
+        with self.store.lock:
+            return list(self._entries.values())
+
+
+_task_index: Optional[TaskIndex] = None
+
+def get_task_index() -> TaskIndex:
+    """Получить индекс задач (создается при первом обращении)"""
+    global _task_index
+    if _task_index is None:
+        _task_index = TaskIndex(get_store('tasks'))
+    return _task_index
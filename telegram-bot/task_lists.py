@@ -0,0 +1,126 @@
+"""
+Снимки списков задач для пагинации в чате
+Список задач пользователя считается один раз и хранится в памяти с коротким TTL,
+переключение страниц и фильтров обслуживается из снимка
+"""
+import logging
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Dict, Any, List, Optional, Tuple
+import config
+from tasks import get_user_tasks, filter_today_tasks, filter_overdue_tasks
+from task_index import TaskEntry, get_task_index
+
+logger = logging.getLogger(__name__)
+
+TASK_FILTERS = ('all', 'today', 'overdue')
+
+@dataclass
+class TaskListSnapshot:
+    """Снимок отфильтрованного списка задач пользователя"""
+    user_id: str
+    filter_type: str
+    tasks: List[Dict[str, Any]]
+    created_at: float = field(default_factory=time.monotonic)
+    # Последняя открытая страница (курсор)
+    page: int = 0
+    
+    @property
+    def total(self) -> int:
+        return len(self.tasks)
+    
+    def page_count(self, page_size: int) -> int:
+        return (self.total + page_size - 1) // page_size
+    
+    def get_page(self, page: int, page_size: int) -> List[Dict[str, Any]]:
+        """Задачи страницы (курсор перемещается на нее)"""
+        self.page = page
+        start_idx = page * page_size
+        return self.tasks[start_idx:start_idx + page_size]
+    
+    def has_next(self, page: int, page_size: int) -> bool:
+        return (page + 1) * page_size < self.total
+
+class TaskListSnapshots:
+    """Хранилище снимков по ключу (chat_id, user_id, filter_type)"""
+    
+    def __init__(self, ttl_seconds: int = config.TASK_LIST_SNAPSHOT_TTL):
+        self.ttl_seconds = ttl_seconds
+        self._snapshots: Dict[Tuple[int, str, str], TaskListSnapshot] = {}
+        self._lock = threading.Lock()
+    
+    def _is_fresh(self, snapshot: Optional[TaskListSnapshot]) -> bool:
+        return snapshot is not None and time.monotonic() - snapshot.created_at <= self.ttl_seconds
+    
+    def get(self, chat_id: int, user_id: str, filter_type: str, refresh: bool = False) -> TaskListSnapshot:
+        """
+        Получить снимок списка задач
+        
+        Args:
+            chat_id: ID чата, в котором листают список
+            user_id: ID пользователя системы
+            filter_type: all, today или overdue
+            refresh: Пересчитать снимок, даже если он еще свежий
+        """
+        if filter_type not in TASK_FILTERS:
+            filter_type = 'all'
+        
+        key = (chat_id, user_id, filter_type)
+        with self._lock:
+            snapshot = self._snapshots.get(key)
+        if not refresh and self._is_fresh(snapshot):
+            return snapshot
+        
+        # Один проход по задачам пользователя заполняет снимки всех фильтров,
+        # поэтому переключение фильтров тоже не требует повторной загрузки
+        user_tasks = get_user_tasks(user_id)
+        created_at = time.monotonic()
+        snapshots = {
+            'all': TaskListSnapshot(user_id, 'all', user_tasks, created_at),
+            'today': TaskListSnapshot(user_id, 'today', filter_today_tasks(user_tasks), created_at),
+            'overdue': TaskListSnapshot(user_id, 'overdue', filter_overdue_tasks(user_tasks), created_at),
+        }
+        with self._lock:
+            for name, item in snapshots.items():
+                self._snapshots[(chat_id, user_id, name)] = item
+        logger.info(f"[TASK_LISTS] Built snapshot for user {user_id} in chat {chat_id}: {len(user_tasks)} tasks")
+        return snapshots[filter_type]
+    
+    def invalidate_user(self, user_id: str) -> None:
+        """Сбросить снимки пользователя (его задачи изменились)"""
+        if not user_id:
+            return
+        user_id = str(user_id)
+        with self._lock:
+            for key in [k for k in self._snapshots if k[1] == user_id]:
+                del self._snapshots[key]
+    
+    def invalidate_task(self, task: Optional[Dict[str, Any]]) -> None:
+        """Сбросить снимки всех исполнителей задачи"""
+        if not task:
+            return
+        self.invalidate_user(task.get('assigneeId'))
+        assignee_ids = task.get('assigneeIds', [])
+        if isinstance(assignee_ids, list):
+            for assignee_id in assignee_ids:
+                self.invalidate_user(assignee_id)
+    
+    def on_task_index_change(self, task_id: str, old_entry: Optional[TaskEntry], new_entry: Optional[TaskEntry]) -> None:
+        """Задача изменилась (в том числе в веб-приложении) - сбросить снимки ее исполнителей"""
+        for entry in (old_entry, new_entry):
+            if entry:
+                for user_id in entry.user_ids:
+                    self.invalidate_user(user_id)
+    
+    def cleanup(self) -> int:
+        """Удалить устаревшие снимки"""
+        with self._lock:
+            expired = [k for k, s in self._snapshots.items() if not self._is_fresh(s)]
+            for key in expired:
+                del self._snapshots[key]
+        return len(expired)
+
+# Создаем экземпляр хранилища
+task_list_snapshots = TaskListSnapshots()
+get_task_index().subscribe(task_list_snapshots.on_task_index_change)
@@ -1,14 +1,19 @@
 """
 Модуль работы с задачами
 """
-from typing import List, Dict, Any, Optional
-from datetime import datetime
+from typing import List, Dict, Any, Optional, Iterable, FrozenSet
+from datetime import datetime, date
 import logging
+import pytz
 from firebase_client import firebase
+from id_index import get_id_index
+from collection_store import apply_saved
 from utils import get_today_date, is_overdue
 
 logger = logging.getLogger(__name__)
 
+COMPLETED_STATUSES = ['выполнено', 'done', 'завершено', 'completed', 'выполнена', 'завершена']
+
 def get_user_tasks(user_id: str, include_archived: bool = False) -> List[Dict[str, Any]]:
     """Получить задачи пользователя"""
     try:
@@ -21,33 +26,8 @@ def get_user_tasks(user_id: str, include_archived: bool = False) -> List[Dict[st
             return []
         
         for task in all_tasks:
-            # Пропускаем архивные задачи
-            if task.get('isArchived') and not include_archived:
-                continue
-            
-            # Пропускаем идеи и функции
-            entity_type = task.get('entityType', 'task')
-            if entity_type in ['idea', 'feature']:
-                continue
-            
-            # Пропускаем выполненные задачи
-            status = str(task.get('status', '')).lower().strip()
-            completed_statuses = ['выполнено', 'done', 'завершено', 'completed', 'выполнена', 'завершена']
-            if any(status == s for s in completed_statuses):
-                continue
-            
-            # Проверяем, назначена ли задача на пользователя
-            assignee_id = task.get('assigneeId')
-            assignee_ids = task.get('assigneeIds', [])
-            
-            # Проверяем по assigneeId (может быть строкой или None)
-            if assignee_id and str(assignee_id) == str(user_id):
-                user_tasks.append(task)
-                logger.debug(f"[TASKS] Task {task.get('id')} assigned via assigneeId")
-            # Проверяем по assigneeIds (массив)
-            elif isinstance(assignee_ids, list) and user_id in [str(uid) for uid in assignee_ids if uid]:
+            if str(user_id) in active_task_user_ids(task, include_archived):
                 user_tasks.append(task)
-                logger.debug(f"[TASKS] Task {task.get('id')} assigned via assigneeIds")
         
         logger.info(f"[TASKS] Found {len(user_tasks)} tasks for user {user_id}")
         return user_tasks
@@ -57,169 +37,116 @@ def get_user_tasks(user_id: str, include_archived: bool = False) -> List[Dict[st
         traceback.print_exc()
         return []
 
-def get_today_tasks(user_id: str) -> List[Dict[str, Any]]:
-    """Получить задачи на сегодня"""
+def get_task_user_ids(task: Dict[str, Any]) -> FrozenSet[str]:
+    """ID исполнителей задачи (assigneeId и assigneeIds)"""
+    user_ids = set()
+    if task.get('assigneeId'):
+        user_ids.add(str(task.get('assigneeId')))
+    assignee_ids = task.get('assigneeIds', [])
+    if isinstance(assignee_ids, list):
+        user_ids.update(str(uid) for uid in assignee_ids if uid)
+    return frozenset(user_ids)
+
+def active_task_user_ids(task: Dict[str, Any], include_archived: bool = False) -> FrozenSet[str]:
+    """
+    Исполнители активной задачи (пустое множество, если задача не активна)
+    
+    Единые правила для списков, напоминаний и индекса: без архивных, идей, функций
+    и выполненных задач
+    """
+    if task.get('isArchived') and not include_archived:
+        return frozenset()
+    if task.get('entityType', 'task') in ['idea', 'feature']:
+        return frozenset()
+    if is_completed_task(task):
+        return frozenset()
+    return get_task_user_ids(task)
+
+def partition_tasks_by_user(all_tasks: Iterable[Dict[str, Any]]) -> Dict[str, List[Dict[str, Any]]]:
+    """Разложить активные задачи по исполнителям за один проход"""
+    tasks_by_user: Dict[str, List[Dict[str, Any]]] = {}
+    for task in all_tasks:
+        for user_id in active_task_user_ids(task):
+            tasks_by_user.setdefault(user_id, []).append(task)
+    return tasks_by_user
+
+def parse_end_date(end_date_str: str) -> Optional[date]:
+    """Распарсить срок задачи (YYYY-MM-DD, YYYYMMDD или ISO с временем)"""
+    if not end_date_str:
+        return None
+    
+    # Нормализуем дату - убираем время если есть
+    if 'T' in end_date_str:
+        end_date_str = end_date_str.split('T')[0]
+    elif ' ' in end_date_str:
+        end_date_str = end_date_str.split(' ')[0]
+    
+    # Пробуем разные форматы
+    if len(end_date_str) == 10 and '-' in end_date_str:  # YYYY-MM-DD
+        return datetime.strptime(end_date_str, '%Y-%m-%d').date()
+    if len(end_date_str) == 8 and '-' not in end_date_str:  # YYYYMMDD
+        return datetime.strptime(end_date_str, '%Y%m%d').date()
     try:
-        from datetime import date
-        import pytz
-        
-        tz = pytz.timezone('Asia/Tashkent')
-        today = datetime.now(tz).date()
-        today_str = today.isoformat()
-        
-        logger.info(f"[TASKS] ===== GET_TODAY_TASKS START =====")
-        logger.info(f"[TASKS] user_id: {user_id}, today: {today_str}")
-        
-        user_tasks = get_user_tasks(user_id)
-        logger.info(f"[TASKS] Found {len(user_tasks)} user tasks total")
-        
-        if not user_tasks:
-            logger.warning(f"[TASKS] No user tasks found for user_id: {user_id}")
-            return []
+        return datetime.fromisoformat(end_date_str.replace('Z', '+00:00')).date()
+    except ValueError:
+        # Последняя попытка - парсим как есть
+        return datetime.strptime(end_date_str, '%Y-%m-%d').date()
+
+def is_completed_task(task: Dict[str, Any]) -> bool:
+    """Проверить, выполнена ли задача"""
+    status = str(task.get('status', '')).lower().strip()
+    return status in COMPLETED_STATUSES
+
+def _filter_by_end_date(user_tasks: List[Dict[str, Any]], predicate) -> List[Dict[str, Any]]:
+    """Отфильтровать невыполненные задачи по сроку"""
+    result = []
+    for task in user_tasks:
+        end_date_str = task.get('endDate', '')
+        if not end_date_str:
+            continue
         
-        today_tasks = []
-        for task in user_tasks:
-            task_id = task.get('id', 'unknown')
-            task_title = task.get('title', 'no title')
-            end_date_str = task.get('endDate', '')
-            
-            if not end_date_str:
-                logger.debug(f"[TASKS] Task {task_id} has no endDate, skipping")
-                continue
-            
-            # Нормализуем дату - убираем время если есть
-            original_date = end_date_str
-            if 'T' in end_date_str:
-                end_date_str = end_date_str.split('T')[0]
-            elif ' ' in end_date_str:
-                end_date_str = end_date_str.split(' ')[0]
-            
-            # Парсим дату
-            try:
-                task_date = None
-                # Пробуем разные форматы
-                if len(end_date_str) == 10 and '-' in end_date_str:  # YYYY-MM-DD
-                    task_date = datetime.strptime(end_date_str, '%Y-%m-%d').date()
-                elif len(end_date_str) == 8 and '-' not in end_date_str:  # YYYYMMDD
-                    task_date = datetime.strptime(end_date_str, '%Y%m%d').date()
-                else:
-                    # Пробуем ISO формат
-                    try:
-                        task_date = datetime.fromisoformat(end_date_str.replace('Z', '+00:00')).date()
-                    except:
-                        # Последняя попытка - парсим как есть
-                        task_date = datetime.strptime(end_date_str, '%Y-%m-%d').date()
-                
-                logger.info(f"[TASKS] Task {task_id} '{task_title}': original={original_date}, normalized={end_date_str}, parsed={task_date}, today={today}, match={task_date == today}")
-                
-                # Сравниваем даты
-                if task_date == today:
-                    # Исключаем выполненные задачи
-                    status = str(task.get('status', '')).lower().strip()
-                    completed_statuses = ['выполнено', 'done', 'завершено', 'completed', 'выполнена', 'завершена']
-                    is_completed = any(status == s for s in completed_statuses)
-                    
-                    if not is_completed:
-                        today_tasks.append(task)
-                        logger.info(f"[TASKS] ✅ Added task {task_id} '{task_title}' to today tasks (status: {task.get('status', 'none')})")
-                    else:
-                        logger.debug(f"[TASKS] ❌ Task {task_id} is completed (status: {status}), skipping")
-                else:
-                    logger.debug(f"[TASKS] Task {task_id} date {task_date} != today {today}, skipping")
-            except Exception as date_error:
-                logger.warning(f"[TASKS] ❌ Error parsing date '{end_date_str}' (original: '{original_date}') for task {task_id}: {date_error}")
-                import traceback
-                logger.debug(f"[TASKS] Traceback: {traceback.format_exc()}")
-                continue
+        try:
+            task_date = parse_end_date(end_date_str)
+        except Exception as date_error:
+            logger.warning(f"[TASKS] ❌ Error parsing date '{end_date_str}' for task {task.get('id', 'unknown')}: {date_error}")
+            continue
         
-        logger.info(f"[TASKS] ===== GET_TODAY_TASKS END: Returning {len(today_tasks)} today tasks =====")
+        if task_date and predicate(task_date) and not is_completed_task(task):
+            result.append(task)
+    return result
+
+def get_local_today() -> date:
+    """Сегодняшняя дата в часовом поясе по умолчанию"""
+    return datetime.now(pytz.timezone('Asia/Tashkent')).date()
+
+def filter_today_tasks(user_tasks: List[Dict[str, Any]], today: Optional[date] = None) -> List[Dict[str, Any]]:
+    """Выбрать из уже загруженных задач пользователя задачи на сегодня"""
+    today = today or get_local_today()
+    return _filter_by_end_date(user_tasks, lambda task_date: task_date == today)
+
+def filter_overdue_tasks(user_tasks: List[Dict[str, Any]], today: Optional[date] = None) -> List[Dict[str, Any]]:
+    """Выбрать из уже загруженных задач пользователя просроченные задачи"""
+    today = today or get_local_today()
+    return _filter_by_end_date(user_tasks, lambda task_date: task_date < today)
+
+def get_today_tasks(user_id: str) -> List[Dict[str, Any]]:
+    """Получить задачи на сегодня"""
+    try:
+        today_tasks = filter_today_tasks(get_user_tasks(user_id))
+        logger.info(f"[TASKS] Found {len(today_tasks)} today tasks for user {user_id}")
         return today_tasks
     except Exception as e:
         logger.error(f"[TASKS] ❌ FATAL ERROR getting today tasks: {e}", exc_info=True)
-        import traceback
-        logger.error(f"[TASKS] Traceback: {traceback.format_exc()}")
         return []
 
 def get_overdue_tasks(user_id: str) -> List[Dict[str, Any]]:
     """Получить просроченные задачи"""
     try:
-        from datetime import date
-        import pytz
-        
-        tz = pytz.timezone('Asia/Tashkent')
-        today = datetime.now(tz).date()
-        
-        logger.info(f"[TASKS] ===== GET_OVERDUE_TASKS START =====")
-        logger.info(f"[TASKS] user_id: {user_id}, today: {today.isoformat()}")
-        
-        user_tasks = get_user_tasks(user_id)
-        logger.info(f"[TASKS] Found {len(user_tasks)} user tasks total")
-        
-        if not user_tasks:
-            logger.warning(f"[TASKS] No user tasks found for user_id: {user_id}")
-            return []
-        
-        overdue_tasks = []
-        for task in user_tasks:
-            task_id = task.get('id', 'unknown')
-            task_title = task.get('title', 'no title')
-            end_date_str = task.get('endDate', '')
-            
-            if not end_date_str:
-                logger.debug(f"[TASKS] Task {task_id} has no endDate, skipping")
-                continue
-            
-            # Нормализуем дату - убираем время если есть
-            original_date = end_date_str
-            if 'T' in end_date_str:
-                end_date_str = end_date_str.split('T')[0]
-            elif ' ' in end_date_str:
-                end_date_str = end_date_str.split(' ')[0]
-            
-            # Парсим дату
-            try:
-                task_date = None
-                # Пробуем разные форматы
-                if len(end_date_str) == 10 and '-' in end_date_str:  # YYYY-MM-DD
-                    task_date = datetime.strptime(end_date_str, '%Y-%m-%d').date()
-                elif len(end_date_str) == 8 and '-' not in end_date_str:  # YYYYMMDD
-                    task_date = datetime.strptime(end_date_str, '%Y%m%d').date()
-                else:
-                    # Пробуем ISO формат
-                    try:
-                        task_date = datetime.fromisoformat(end_date_str.replace('Z', '+00:00')).date()
-                    except:
-                        # Последняя попытка - парсим как есть
-                        task_date = datetime.strptime(end_date_str, '%Y-%m-%d').date()
-                
-                is_overdue_task = task_date < today
-                logger.info(f"[TASKS] Task {task_id} '{task_title}': original={original_date}, normalized={end_date_str}, parsed={task_date}, today={today}, is_overdue={is_overdue_task}")
-                
-                if is_overdue_task:
-                    # Исключаем выполненные задачи
-                    status = str(task.get('status', '')).lower().strip()
-                    completed_statuses = ['выполнено', 'done', 'завершено', 'completed', 'выполнена', 'завершена']
-                    is_completed = any(status == s for s in completed_statuses)
-                    
-                    if not is_completed:
-                        overdue_tasks.append(task)
-                        logger.info(f"[TASKS] ✅ Added task {task_id} '{task_title}' to overdue tasks (status: {task.get('status', 'none')})")
-                    else:
-                        logger.debug(f"[TASKS] ❌ Task {task_id} is completed (status: {status}), skipping")
-                else:
-                    logger.debug(f"[TASKS] Task {task_id} date {task_date} >= today {today}, not overdue")
-            except Exception as date_error:
-                logger.warning(f"[TASKS] ❌ Error parsing date '{end_date_str}' (original: '{original_date}') for task {task_id}: {date_error}")
-                import traceback
-                logger.debug(f"[TASKS] Traceback: {traceback.format_exc()}")
-                continue
-        
-        logger.info(f"[TASKS] ===== GET_OVERDUE_TASKS END: Returning {len(overdue_tasks)} overdue tasks =====")
+        overdue_tasks = filter_overdue_tasks(get_user_tasks(user_id))
+        logger.info(f"[TASKS] Found {len(overdue_tasks)} overdue tasks for user {user_id}")
         return overdue_tasks
     except Exception as e:
         logger.error(f"[TASKS] ❌ FATAL ERROR getting overdue tasks: {e}", exc_info=True)
-        import traceback
-        logger.error(f"[TASKS] Traceback: {traceback.format_exc()}")
         return []
 
 def get_yesterday_tasks() -> List[Dict[str, Any]]:
@@ -318,6 +245,7 @@ def update_task_status(task_id: str, new_status: str) -> bool:
         task['status'] = new_status
         task['updatedAt'] = datetime.now().isoformat()
         firebase.save('tasks', task)
+        apply_saved('tasks', task)
         return True
     except Exception as e:
         print(f"Error updating task status: {e}")
@@ -336,6 +264,8 @@ def create_task(task_data: Dict[str, Any]) -> Optional[str]:
             task_data['id'] = f"task-{int(datetime.now().timestamp() * 1000)}"
         
         firebase.save('tasks', task_data)
+        get_id_index('tasks').add(task_data['id'])
+        apply_saved('tasks', task_data)
         return task_data['id']
     except Exception as e:
         print(f"Error creating task: {e}")
@@ -0,0 +1,79 @@
+"""
+Данные одного запуска стадии периодической проверки
+Пользователи, настройки уведомлений и задачи, созданные с самой ранней последней проверки
+среди сессий, загружаются один раз на запуск, а проверки каждой сессии работают с этой
+копией в памяти: количество авторизованных пользователей не меняет число запросов к Firestore.
+Задачи берутся из кэша коллекции, поэтому последняя проверка сессии продвигается
+до времени, до которого кэш полон (watermark), а не до текущего времени
+"""
+import logging
+from datetime import datetime
+from typing import Dict, Any, List, Optional
+from firebase_client import firebase
+from collection_store import get_store
+from notifications import filter_new_tasks
+from creation_index import get_creation_index
+
+logger = logging.getLogger(__name__)
+
+class TickSnapshot:
+    """Данные, общие для всех сессий в одном запуске стадии (загружаются при первом обращении)"""
+    
+    def __init__(self):
+        self.now = datetime.now()
+        self._prefs_loaded = False
+        self._prefs: Optional[Dict[str, Any]] = None
+        self._users: Optional[Dict[str, Dict[str, Any]]] = None
+        self._recent_tasks: Optional[List[Dict[str, Any]]] = None
+        self._recent_since: Optional[datetime] = None
+        # До какого времени созданные задачи уже в кэше (фиксируется на весь запуск)
+        self.watermark: Optional[datetime] = None
+    
+    @property
+    def prefs(self) -> Optional[Dict[str, Any]]:
+        """Настройки уведомлений (notificationPrefs/default)"""
+        if not self._prefs_loaded:
+            self._prefs = firebase.get_by_id('notificationPrefs', 'default')
+            self._prefs_loaded = True
+        return self._prefs
+    
+    @property
+    def users(self) -> Dict[str, Dict[str, Any]]:
+        """Пользователи по ID (из кэша коллекции users)"""
+        if self._users is None:
+            _, self._users = get_store('users').snapshot()
+        return self._users
+    
+    def user_active(self, user_id: str) -> bool:
+        """Активен ли пользователь (как auth.check_user_active)"""
+        if not self.users:
+            # Коллекция не загрузилась - не завершаем сессии по ошибке чтения
+            return True
+        user = self.users.get(str(user_id))
+        if not user:
+            return False
+        return not user.get('isArchived', False)
+    
+    def load_recent_tasks(self, since: datetime) -> None:
+        """Отобрать задачи, созданные после since (самой ранней последней проверки сессий) и до watermark"""
+        index = get_creation_index('tasks')
+        if self.watermark is None:
+            self.watermark = index.watermark()
+        self._recent_since = since
+        if self.watermark is None or self.watermark <= since:
+            self._recent_tasks = []
+        else:
+            self._recent_tasks = index.created_since(since, self.watermark)
+        logger.debug(f"[SNAPSHOT] {len(self._recent_tasks)} tasks created after {since} (until {self.watermark})")
+    
+    def new_tasks(self, user_id: str, last_check: datetime) -> List[Dict[str, Any]]:
+        """Новые задачи пользователя (исполнитель или создатель) с last_check"""
+        if self._recent_tasks is None or last_check < self._recent_since:
+            self.load_recent_tasks(last_check)
+        return filter_new_tasks(self._recent_tasks, user_id, last_check)
+    
+    def next_check(self, last_check: datetime) -> datetime:
+        """С какого времени искать новые задачи сессии в следующий раз"""
+        if self.watermark is None:
+            return last_check
+        return max(last_check, self.watermark)
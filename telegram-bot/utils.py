@@ -78,3 +78,23 @@ def get_user_name(user: Dict[str, Any]) -> str:
 def get_client_name(client: Dict[str, Any]) -> str:
     """Получить название клиента"""
     return client.get('name', client.get('companyName', client.get('id', 'Неизвестно')))
+
+def plural_ru(count: int, one: str, few: str, many: str) -> str:
+    """Форма слова для числа: 1 задача, 2 задачи, 5 задач"""
+    count = abs(count) % 100
+    if 11 <= count <= 19:
+        return many
+    if count % 10 == 1:
+        return one
+    if 2 <= count % 10 <= 4:
+        return few
+    return many
+
+# Сколько последних символов ID показывать пользователю: ID вида task-<мс> различаются концом
+SHORT_ID_LENGTH = 8
+
+def short_id(doc_id: str) -> str:
+    """Короткий ID для сообщений (последние символы полного ID)"""
+    if not doc_id:
+        return 'N/A'
+    return doc_id[-SHORT_ID_LENGTH:]